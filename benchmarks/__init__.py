@@ -0,0 +1 @@
+"""效能基準測試（不需要 Django 設定即可執行）"""
@@ -0,0 +1,90 @@
+"""
+醫師時段索引（DoctorIntervalIndex）效能基準
+    
+    python -m benchmarks.bench_doctor_index
+    python -m benchmarks.bench_doctor_index --sizes 1000 10000 50000 --cases-per-doctor 8
+
+模擬排程引擎逐台放置手術：每台先查詢主刀醫師在新時段是否有空，再登記時段。
+同時量測舊做法（每次線性掃描所有已排手術）作為比較，並核對兩者的衝突數一致。
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import SyntheticSchedule  # noqa: E402
+from surgery_scheduler.compact_schedule import time_to_minutes  # noqa: E402
+from surgery_scheduler.doctor_index import DoctorIntervalIndex  # noqa: E402
+
+
+def make_intervals(generator, cases: int, cases_per_doctor: int, seed: int = 0):
+    """
+    (醫師, 開始, 結束, 房間)：取 SyntheticSchedule 一天的排程，依房內順序接續（接台接在前一台之後），
+    時長依該術式的實際時長抽樣；同名醫師再分成幾位，讓每位醫師約 cases_per_doctor 台
+    """
+    rng = random.Random(seed)
+    doctors = {doctor for choice in generator.doctors_by_type.values() for doctor in choice.values}
+    groups = max(1, cases // cases_per_doctor // len(doctors))
+    intervals = []
+    end = {}
+    for surgery in generator.day(cases, seed=seed):
+        room = surgery['room']
+        start = end.get(room, 8 * 60) if surgery['time'] == 'TF' else time_to_minutes(surgery['time'])
+        surgery_type = surgery['surgery_type'].split(' ', 1)[1]
+        end[room] = start + rng.choice(generator.durations_by_type[surgery_type])
+        intervals.append((f"{surgery['doctor']}{rng.randrange(groups)}", start, end[room], room))
+    return intervals
+
+
+def place_indexed(intervals):
+    index = DoctorIntervalIndex()
+    clashes = 0
+    for doctor, start, end, room in intervals:
+        if not index.is_free(doctor, start, end, room):
+            clashes += 1
+        index.add(doctor, start, end, room)
+    return clashes
+
+
+def place_linear(intervals):
+    placed = []
+    clashes = 0
+    for doctor, start, end, room in intervals:
+        if any(d == doctor and r != room and s < end and start < e for d, s, e, r in placed):
+            clashes += 1
+        placed.append((doctor, start, end, room))
+    return clashes
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 5000, 10000, 50000])
+    parser.add_argument('--cases-per-doctor', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--linear-limit', type=int, default=10000, help='超過此數量不量測線性掃描（太慢）')
+    args = parser.parse_args(argv)
+    
+    generator = SyntheticSchedule.from_training_data()
+    print(f"{'cases':>7} {'clashes':>8} {'index ms':>9} {'µs/case':>8} {'linear ms':>10} {'speedup':>8}")
+    for cases in args.sizes:
+        intervals = make_intervals(generator, cases, args.cases_per_doctor, args.seed)
+        indexed, clashes = timed(place_indexed, intervals)
+        line = f"{cases:>7} {clashes:>8} {indexed * 1000:>9.1f} {indexed / cases * 1e6:>8.2f}"
+        if cases <= args.linear_limit:
+            linear, linear_clashes = timed(place_linear, intervals)
+            assert linear_clashes == clashes, '索引與線性掃描的衝突數不一致'
+            line += f" {linear * 1000:>10.1f} {linear / indexed:>7.1f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+排程匯出測試：PDF 產生耗時、記憶體、快取命中與同時匯出
+    
+    python -m benchmarks.bench_export
+    python -m benchmarks.bench_export --sizes 10 100 1000 5000
+
+使用暫存的 SQLite 資料庫與 MEDIA_ROOT（不影響 db.sqlite3 與 media/）：
+- 各規模第一次下載（產生 PDF）與第二次下載（快取檔）的耗時、記憶體高峰、頁數
+- 以 pdfplumber 讀回，確認每台手術的優先級與預估時長取自排程項目
+- 多個版本同時匯出，各自得到自己的檔案
+- 寫入多天的排程，比較匯出 1 天與整段期間的 CSV / SpreadsheetML（.xml）/ ICS：耗時、記憶體高峰、查詢數，
+  並解析輸出確認筆數、單房/單一醫師篩選與 iCalendar 行長度
+任一項不符時以狀態碼 1 結束。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+from benchmarks.bench_tenancy import setup_database
+from benchmarks.synthetic import SyntheticSchedule, seed_schedule
+
+
+def fetch(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+def download(client, url):
+    """回傳 (內容, 耗時, 記憶體高峰 bytes)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    content = fetch(client, url)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return content, elapsed, peak
+
+
+def check_pdf(content, optimized):
+    """讀回 PDF，比對每台手術的優先級與時長"""
+    import pdfplumber
+    schedule = optimized.get_optimized_data()['optimized_data']
+    expected = sorted(f"P{item.get('priority', 3)} {item.get('base_duration', item.get('duration', 90))}分"
+                      for item in schedule)
+    found = []
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        pages = len(pdf.pages)
+        for page in pdf.pages:
+            for line in (page.extract_text() or '').splitlines():
+                words = line.split()
+                if len(words) >= 2 and words[-2].startswith('P') and words[-1].endswith('分'):
+                    found.append(f'{words[-2]} {words[-1]}')
+    problems = []
+    if sorted(found) != expected:
+        problems.append(f'PDF 內的優先級/時長與排程不符（{len(found)} 列，排程 {len(expected)} 台）')
+    return pages, problems
+
+
+def seed_days(generator, hospital, days, per_day):
+    """從今天起連續 days 天，每天 per_day 台（每天各自優化並建立版本）"""
+    from datetime import date, timedelta
+    first = date.today()
+    for i in range(days):
+        seed_schedule(hospital, generator.day(per_day, seed=i), first + timedelta(days=i))
+    return first
+
+
+def count_rows(fmt, content):
+    """解析匯出內容，回傳 (資料筆數, 問題列表)"""
+    import csv
+    import xml.etree.ElementTree as ET
+    if fmt == 'csv':
+        return len(list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))) - 1, []
+    if fmt == 'xml':
+        ns = {'ss': 'urn:schemas-microsoft-com:office:spreadsheet'}
+        return len(ET.fromstring(content).findall('.//ss:Row', ns)) - 1, []
+    lines = content.split(b'\r\n')
+    problems = [f'iCalendar 有 {sum(len(line) > 75 for line in lines)} 行超過 75 bytes'] \
+        if any(len(line) > 75 for line in lines) else []
+    return lines.count(b'BEGIN:VEVENT'), problems
+
+
+def bench_bulk_exports(client, hospital, first_day, days):
+    """CSV / SpreadsheetML / ICS：1 天與整段期間的耗時、記憶體與查詢數"""
+    from datetime import timedelta
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from surgery_scheduler.models import Surgery
+    problems = []
+    client.get(f'/upload/?hospital={hospital.id}')
+    ranges = {
+        '1 天': f'start={first_day}&end={first_day + timedelta(days=1)}',
+        f'{days} 天': '',
+    }
+    print("批次匯出（串流）")
+    for label, query in ranges.items():
+        for fmt in ('csv', 'xml', 'ics'):
+            url = f'/export/schedule.{fmt}?{query}'
+            # 查詢記錄有上限（寫入大量排程後已滿），先清空才量得到
+            reset_queries()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                content = fetch(client, url)
+            elapsed = time.perf_counter() - started
+            # 記憶體高峰另外量：逐塊讀取後丟棄（不計入收集整份輸出的記憶體）
+            tracemalloc.start()
+            for _ in client.get(url).streaming_content:
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rows, format_problems = count_rows(fmt, content)
+            expected = Surgery.objects.filter(hospital=hospital)
+            if query:
+                expected = expected.filter(scheduled_start__date=first_day)
+            if rows != expected.count():
+                problems.append(f'{fmt} {label}: {rows} 筆，預期 {expected.count()} 筆')
+            problems += format_problems
+            selects = sum('surgery_scheduler_surgery' in q['sql'] for q in captured.captured_queries)
+            print(f"  {fmt:>3} {label:>5}: {rows:>6} 筆 {len(content) / 1024:>8.1f} KiB | {elapsed * 1000:>7.1f} ms | "
+                  f"記憶體高峰 {peak / 1024 / 1024:.1f} MiB | 手術查詢 {selects} 次")
+            if selects != 1:
+                problems.append(f'{fmt} {label}: 手術查詢 {selects} 次')
+    
+    # 單一手術房 / 單一醫師的行事曆
+    room, doctor = Surgery.objects.filter(hospital=hospital).values_list(
+        'operating_room__number', 'doctor__name').first()
+    for params, expected in (
+        (f'room={room}', Surgery.objects.filter(hospital=hospital, operating_room__number=room).count()),
+        (f'doctor={doctor}', Surgery.objects.filter(hospital=hospital, doctor__name=doctor).count()),
+    ):
+        rows, _ = count_rows('ics', fetch(client, f'/export/schedule.ics?{params}'))
+        print(f"  ics {params}: {rows} 筆")
+        if rows != expected:
+            problems.append(f'ics {params}: {rows} 筆，預期 {expected} 筆')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--per-day', type=int, default=120)
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'export.sqlite3'))
+        from django.conf import settings
+        settings.MEDIA_ROOT = os.path.join(tmp, 'media')
+        from django.test import Client
+        from surgery_scheduler.models import Hospital
+        from surgery_scheduler.pdf_exporter import export_path
+        from surgery_scheduler.schedule_optimizer import OptimizationConfig
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        
+        generator = SyntheticSchedule.from_training_data()
+        problems = []
+        versions = []
+        client = Client()
+        print("PDF 匯出（第一次產生 / 第二次讀取快取）")
+        for size in args.sizes:
+            hospital = Hospital.objects.create(name=f'院區{size}')
+            with contextlib.redirect_stdout(io.StringIO()):
+                optimized = seed_schedule(hospital, generator.day(size, seed=size))
+            versions.append(optimized)
+            url = f'/export/{optimized.id}/?hospital={hospital.id}'
+            started = time.perf_counter()
+            content = fetch(client, url)
+            first = time.perf_counter() - started
+            cached, second, _ = download(client, url)
+            # 記憶體高峰另外量（tracemalloc 本身會拖慢產生速度）
+            os.remove(export_path(optimized.id))
+            _, _, peak = download(client, url)
+            if cached != content:
+                problems.append(f'{size} 台: 快取檔內容與第一次不同')
+            pages, pdf_problems = check_pdf(content, optimized)
+            problems += [f'{size} 台: {p}' for p in pdf_problems]
+            print(f"  {size:>6} 台: {pages:>4} 頁 {len(content) / 1024:>7.1f} KiB | "
+                  f"產生 {first * 1000:>7.1f} ms（記憶體高峰 {peak / 1024 / 1024:.1f} MiB）| "
+                  f"快取 {second * 1000:.1f} ms")
+        
+        # 同時匯出：刪掉快取後多個執行緒一起下載不同（與相同）版本
+        for optimized in versions:
+            os.remove(export_path(optimized.id))
+        results = {}
+        
+        def fetch_version(optimized, slot):
+            from django.db import connection
+            try:
+                results[slot] = (optimized.id, fetch(Client(), f'/export/{optimized.id}/?hospital={optimized.hospital_id}'))
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=fetch_version, args=(o, (o.id, k))) for o in versions for k in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for optimized in versions:
+            contents = {content for (oid, content) in results.values() if oid == optimized.id}
+            if len(contents) != 1:
+                problems.append(f'版本 {optimized.id} 同時匯出的內容不一致')
+        if len({content for _, content in results.values()}) != len(versions):
+            problems.append('不同版本同時匯出時得到相同的檔案')
+        leftovers = [f for f in os.listdir(os.path.dirname(export_path(0))) if f.endswith('.tmp')]
+        if leftovers:
+            problems.append(f'留下暫存檔: {leftovers}')
+        print(f"  同時匯出 {len(threads)} 個請求（{len(versions)} 個版本）: 各版本內容一致")
+        
+        hospital = Hospital.objects.create(name='批次匯出')
+        with contextlib.redirect_stdout(io.StringIO()):
+            first_day = seed_days(generator, hospital, args.days, args.per_day)
+        problems += bench_bulk_exports(client, hospital, first_day, args.days)
+        
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("  ✓ 匯出內容正確，PDF 重複下載直接使用快取檔，批次匯出以單一查詢串流")
+
+
+if __name__ == '__main__':
+    main()
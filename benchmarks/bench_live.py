@@ -0,0 +1,200 @@
+"""
+看板即時推播測試：大量閒置的 SSE 連線，插入緊急手術後各看板多久收到變動
+    
+    python -m benchmarks.bench_live
+    python -m benchmarks.bench_live --displays 500 --cases 120
+
+使用暫存的 SQLite 資料庫（不影響 db.sqlite3），直接以 ASGI 介面呼叫
+hospital_scheduler.asgi.application（不需要另外啟動伺服器）：
+- 開啟 N 個訂閱整個院區的連線，以及每個手術房一個只訂閱該房的連線
+- 閒置一段時間，確認沒有任何事件、記錄每個連線佔用的記憶體
+- 以 test Client 送出緊急手術，記錄每個看板收到事件的延遲
+- 只訂閱單一房間的看板只有變動的房間收到事件
+任一項不符時以狀態碼 1 結束。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+from benchmarks.bench_tenancy import setup_database
+
+
+class Display:
+    """以 ASGI 介面連到 /live/schedule/ 的看板，記錄收到的事件與時間"""
+    
+    def __init__(self, app, query: str):
+        self.app = app
+        self.query = query
+        self.status = None
+        self.events = []
+        self._buffer = ''
+        self._closed = asyncio.Event()
+        self._request_sent = False
+        self.task = None
+    
+    def open(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': '/live/schedule/', 'raw_path': b'/live/schedule/',
+            'query_string': self.query.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        self.task = asyncio.ensure_future(self.app(scope, self._receive, self._send))
+    
+    async def _receive(self):
+        if not self._request_sent:
+            self._request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self._closed.wait()
+        return {'type': 'http.disconnect'}
+    
+    async def _send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            return
+        self._buffer += message.get('body', b'').decode()
+        while '\n\n' in self._buffer:
+            block, self._buffer = self._buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+            if 'event' in fields:
+                self.events.append((time.perf_counter(), fields['event'], json.loads(fields['data'])))
+    
+    async def close(self):
+        self._closed.set()
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def run(args, hospital_id, optimized_id, rooms):
+    from django.core.asgi import get_asgi_application
+    from django.test import Client
+    from surgery_scheduler.live_updates import get_broadcaster
+    app = get_asgi_application()
+    broadcaster = get_broadcaster()
+    problems = []
+    
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    displays = [Display(app, f'hospital={hospital_id}&last={optimized_id}') for _ in range(args.displays)]
+    room_displays = {room: Display(app, f'hospital={hospital_id}&last={optimized_id}&room={room}') for room in rooms}
+    everyone = displays + list(room_displays.values())
+    started = time.perf_counter()
+    for display in everyone:
+        display.open()
+    connected = await wait_until(lambda: broadcaster.get_metrics()['subscribers'] == len(everyone), 60)
+    connect_time = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    if not connected:
+        problems.append(f"只有 {broadcaster.get_metrics()['subscribers']}/{len(everyone)} 個連線完成訂閱")
+    per_connection = sum(s.size_diff for s in after.compare_to(before, 'filename')) / len(everyone)
+    
+    await asyncio.sleep(args.idle)
+    idle_events = sum(len(d.events) for d in everyone)
+    if idle_events:
+        problems.append(f'閒置期間收到 {idle_events} 個事件')
+    
+    def post_emergency():
+        client = Client()
+        client.get(f'/upload/?hospital={hospital_id}')
+        with contextlib.redirect_stdout(io.StringIO()):
+            return client.post('/emergency/', {
+                'patient_name': '即時推播測試', 'doctor_name': '值班醫師',
+                'surgery_type': 'Debridement', 'urgency_level': '1',
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+    
+    posted = time.perf_counter()
+    response = await asyncio.to_thread(post_emergency)
+    answered = time.perf_counter()
+    if response.status_code != 200:
+        problems.append(f'緊急插入失敗: {response.status_code}')
+    new_id = response.json().get('optimized_id')
+    delivered = await wait_until(lambda: all(d.events for d in displays), 5)
+    if not delivered:
+        problems.append(f'{sum(not d.events for d in displays)} 個看板 5 秒內沒有收到事件')
+    
+    latencies = [d.events[0][0] - posted for d in displays if d.events]
+    changed_rooms = set()
+    for display in displays:
+        for _, kind, data in display.events:
+            if kind != 'rooms' or data['optimized_id'] != new_id:
+                problems.append(f'看板收到非預期事件: {kind} #{data["optimized_id"]}')
+                break
+            changed_rooms = {r['room'] for r in data['rooms']}
+    await asyncio.sleep(0.2)
+    notified_rooms = {room for room, d in room_displays.items() if d.events}
+    if notified_rooms != changed_rooms:
+        problems.append(f'單房看板收到事件的房間 {sorted(notified_rooms)} ≠ 有變動的房間 {sorted(changed_rooms)}')
+    for room, display in room_displays.items():
+        for _, _, data in display.events:
+            if {r['room'] for r in data['rooms']} - {room}:
+                problems.append(f'第 {room} 房的看板收到其他房間的資料')
+    
+    for display in everyone:
+        await display.close()
+    if broadcaster.get_metrics()['subscribers']:
+        problems.append(f"關閉後仍有 {broadcaster.get_metrics()['subscribers']} 個訂閱")
+    
+    print(f"看板 {len(displays)} 個（整個院區）+ {len(room_displays)} 個（單一手術房）")
+    print(f"  建立連線: {connect_time:.2f} s，每個連線約 {per_connection / 1024:.1f} KiB")
+    print(f"  閒置 {args.idle:.1f} s: {idle_events} 個事件")
+    if latencies:
+        print(f"  緊急插入請求耗時: {(answered - posted) * 1000:.0f} ms")
+        print(f"  看板收到變動（自送出請求起）: 中位數 {statistics.median(latencies) * 1000:.0f} ms，"
+              f"最慢 {max(latencies) * 1000:.0f} ms")
+        print(f"  變動的手術房: {sorted(changed_rooms)}（共 {len(rooms)} 房）")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--displays', type=int, default=200)
+    parser.add_argument('--cases', type=int, default=60)
+    parser.add_argument('--idle', type=float, default=1.0)
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'live.sqlite3'))
+        from benchmarks.synthetic import SyntheticSchedule, seed_schedule
+        from surgery_scheduler.models import Hospital
+        from surgery_scheduler.schedule_optimizer import OptimizationConfig
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        
+        hospital = Hospital.objects.create(name='院區1')
+        with contextlib.redirect_stdout(io.StringIO()):
+            optimized = seed_schedule(hospital, SyntheticSchedule.from_training_data().day(args.cases, seed=args.cases))
+        rooms = [room['room'] for room in optimized.summary['rooms']]
+        
+        problems = asyncio.run(run(args, hospital.id, optimized.id, rooms))
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("  ✓ 閒置連線沒有事件，變動在提交後推送到所有看板")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+ScheduleOCRProcessor 頁面擷取效能基準
+    
+    python -m benchmarks.bench_ocr
+    python -m benchmarks.bench_ocr --pages 50 100 200 --workers 4
+
+以 SyntheticSchedule 產生合成排程 PDF（房間區塊會跨頁），比較舊的逐頁 += 串接與平行分頁擷取，
+並確認兩者解析出的 schedule_data 完全相同。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pdfplumber
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import CASES_PER_ROOM, LINES_PER_PAGE, SyntheticSchedule  # noqa: E402
+from surgery_scheduler.ocr_processor import ScheduleOCRProcessor  # noqa: E402
+
+
+def cases_for_pages(pages: int) -> int:
+    """約 pages 頁的台數（每台 3 行，另外約每 CASES_PER_ROOM 台一行房間標題）"""
+    return max(1, pages * LINES_PER_PAGE * CASES_PER_ROOM // (3 * CASES_PER_ROOM + 1))
+
+
+class SerialOCRProcessor(ScheduleOCRProcessor):
+    """舊版作法：逐頁擷取並以 += 串接全文，僅供比較"""
+    
+    def process(self, file_path, progress_callback=None):
+        all_text = ""
+        with pdfplumber.open(file_path) as pdf:
+            for page in pdf.pages:
+                all_text += (page.extract_text() or "") + "\n"
+        return {'schedule_data': self.parse_text(all_text), 'raw_text': all_text}
+
+
+def run_once(processor, path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = processor.process(path)
+        elapsed = time.perf_counter() - started
+    return elapsed, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='+', type=int, default=[50, 100, 200])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    generator = SyntheticSchedule.from_training_data()
+    serial = SerialOCRProcessor()
+    parallel = ScheduleOCRProcessor(max_workers=args.workers)
+    # 先暖機，讓子程序啟動時間不計入
+    with tempfile.TemporaryDirectory() as tmp:
+        warmup = Path(tmp) / 'warmup.pdf'
+        generator.write_pdf(warmup, generator.day(cases_for_pages(ScheduleOCRProcessor.PARALLEL_MIN_PAGES), seed=args.seed))
+        run_once(parallel, warmup)
+        
+        print(f"workers={args.workers}")
+        print(f"{'pages':>6} {'cases':>7} {'serial ms':>10} {'parallel ms':>12} {'speedup':>8}")
+        for target in args.pages:
+            path = Path(tmp) / f'schedule_{target}.pdf'
+            pages = generator.write_pdf(path, generator.day(cases_for_pages(target), seed=args.seed))
+            base, base_result = min((run_once(serial, path) for _ in range(args.repeat)), key=lambda r: r[0])
+            best, result = min((run_once(parallel, path) for _ in range(args.repeat)), key=lambda r: r[0])
+            assert result == base_result, '平行擷取與逐頁擷取結果不一致'
+            cases = len(result['schedule_data'])
+            print(f"{pages:>6} {cases:>7} {base * 1000:>10.1f} {best * 1000:>12.1f} {base / best:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
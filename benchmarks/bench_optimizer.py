@@ -0,0 +1,78 @@
+"""
+ScheduleOptimizer.optimize 效能基準
+    
+    python -m benchmarks.bench_optimizer
+    python -m benchmarks.bench_optimizer --sizes 40:300 100:5000 200:10000 --compare-linear
+
+每組大小以 房間數:手術數 表示；--compare-linear 會同時量測舊的 O(rooms) 線性掃描派工。
+"""
+import argparse
+import copy
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import SyntheticSchedule  # noqa: E402
+from surgery_scheduler import schedule_optimizer  # noqa: E402
+from surgery_scheduler.schedule_optimizer import OptimizationConfig, ScheduleOptimizer  # noqa: E402
+
+
+class LinearRoomDispatcher(schedule_optimizer.RoomDispatcher):
+    """舊版的線性掃描派工（每台手術 O(rooms)），僅供比較"""
+    
+    def set_ready(self, room, minutes):
+        self._ready[room] = minutes
+    
+    def earliest(self):
+        room = min(self._ready.keys(), key=lambda r: self._ready[r])
+        return room, self._ready[room]
+
+
+def run_once(optimizer, data):
+    payload = copy.deepcopy(data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = optimizer.optimize(payload)
+        elapsed = time.perf_counter() - started
+    return elapsed, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['10:60', '40:300', '100:1000', '100:5000', '200:10000'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ml', action='store_true', help='包含 ML 推論（預設只量測知識庫 + 派工）')
+    parser.add_argument('--compare-linear', action='store_true')
+    args = parser.parse_args(argv)
+    
+    OptimizationConfig.USE_ML_ANALYSIS = args.ml
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimizer = ScheduleOptimizer()
+    
+    generator = SyntheticSchedule.from_training_data()
+    print(f"{'rooms':>6} {'cases':>7} {'heap ms':>10} {'µs/case':>8}" + (f" {'linear ms':>10} {'speedup':>8}" if args.compare_linear else ''))
+    for size in args.sizes:
+        rooms, cases = (int(x) for x in size.split(':'))
+        data = generator.day(cases, rooms=rooms, seed=args.seed)
+        best, result = min((run_once(optimizer, data) for _ in range(args.repeat)), key=lambda r: r[0])
+        line = f"{rooms:>6} {cases:>7} {best * 1000:>10.1f} {best / cases * 1e6:>8.1f}"
+        
+        if args.compare_linear:
+            original = schedule_optimizer.RoomDispatcher
+            schedule_optimizer.RoomDispatcher = LinearRoomDispatcher
+            try:
+                linear, linear_result = min((run_once(optimizer, data) for _ in range(args.repeat)), key=lambda r: r[0])
+            finally:
+                schedule_optimizer.RoomDispatcher = original
+            assert linear_result == result, '線性派工與 heap 派工結果不一致'
+            line += f" {linear * 1000:>10.1f} {linear / best:>7.1f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+查詢數與查詢計畫檢查：結果頁的查詢數不隨手術數增加，常用查詢都走索引
+    
+    python -m benchmarks.bench_queries
+    python -m benchmarks.bench_queries --sizes 10 100 1000 5000
+
+使用暫存的 SQLite 資料庫（不影響 db.sqlite3）：
+- 依各規模寫入排程，記錄結果頁（ResultView）的查詢數與耗時，查詢數必須固定
+- 排程 JSON API：完整回應與 If-None-Match 命中（304）的查詢數與耗時
+- 列出常用查詢的 EXPLAIN QUERY PLAN，確認都使用對應的索引
+任一項不符時以狀態碼 1 結束。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+from benchmarks.bench_tenancy import setup_database
+from benchmarks.synthetic import SyntheticSchedule, seed_schedule
+
+
+def result_page_queries(optimized_id, hospital_id):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    client = Client()
+    client.get(f'/upload/?hospital={hospital_id}')
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(f'/result/{optimized_id}/')
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.status_code
+    return len(captured.captured_queries), elapsed
+
+
+def api_queries(hospital_id):
+    """排程 API：(完整回應的查詢數, 耗時, 304 的查詢數, 耗時)"""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    client = Client()
+    client.get(f'/upload/?hospital={hospital_id}')
+    measured = []
+    headers = {}
+    for expected in (200, 304):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/schedule/?page_size=100', **headers)
+        measured += [len(captured.captured_queries), time.perf_counter() - started]
+        assert response.status_code == expected, response.status_code
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+    return measured
+
+
+def query_plans(hospital_id):
+    """常用查詢 → (EXPLAIN QUERY PLAN, 預期使用的索引名稱)"""
+    from django.db import connection
+    from surgery_scheduler.models import Doctor, OperatingRoom, OptimizedSchedule, Surgery
+    from surgery_scheduler.schedule_summary import SUMMARY_SURGERY_FIELDS
+    room = OperatingRoom.objects.filter(hospital_id=hospital_id).first()
+    queries = {
+        '排程摘要手術列表': (
+            Surgery.objects.filter(hospital_id=hospital_id).select_related('operating_room', 'doctor')
+            .only(*SUMMARY_SURGERY_FIELDS).order_by('scheduled_start'),
+            'surgery_hospital_start_idx'),
+        '單一手術房依時間': (
+            Surgery.objects.filter(operating_room=room).order_by('scheduled_start'),
+            'surgery_room_start_idx'),
+        '院區最新優化結果': (
+            OptimizedSchedule.objects.filter(hospital_id=hospital_id).order_by('-created_at')[:1],
+            'optimized_hospital_created_idx'),
+        '房號批次查詢': (
+            OperatingRoom.objects.filter(hospital_id=hospital_id, number__in=['10', '11']),
+            'room_hospital_number_idx'),
+        '醫師批次查詢': (
+            Doctor.objects.filter(hospital_id=hospital_id, name__in=['王醫師', '李醫師']),
+            'doctor_hospital_name_idx'),
+    }
+    plans = {}
+    with connection.cursor() as cursor:
+        for label, (queryset, index) in queries.items():
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plans[label] = (' | '.join(row[-1] for row in cursor.fetchall()), index)
+    return plans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'queries.sqlite3'))
+        from surgery_scheduler.models import Hospital
+        from surgery_scheduler.schedule_optimizer import OptimizationConfig
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        
+        generator = SyntheticSchedule.from_training_data()
+        problems = []
+        counts = {}
+        print("結果頁（ResultView）")
+        for size in args.sizes:
+            hospital = Hospital.objects.create(name=f'院區{size}')
+            with contextlib.redirect_stdout(io.StringIO()):
+                optimized = seed_schedule(hospital, generator.day(size, seed=size))
+            counts[size], elapsed = result_page_queries(optimized.id, hospital.id)
+            print(f"  {size:>6} 台: {counts[size]} 次查詢, {elapsed * 1000:.1f} ms")
+        if len(set(counts.values())) > 1:
+            problems.append(f'結果頁查詢數隨手術數變動: {counts}')
+        
+        full_queries, full_time, cached_queries, cached_time = api_queries(hospital.id)
+        print("排程 JSON API（最大規模）")
+        print(f"  完整回應: {full_queries} 次查詢, {full_time * 1000:.1f} ms")
+        print(f"  304 命中: {cached_queries} 次查詢, {cached_time * 1000:.1f} ms")
+        
+        print("查詢計畫")
+        for label, (plan, index) in query_plans(hospital.id).items():
+            uses_index = index in plan
+            print(f"  {'✓' if uses_index else '❌'} {label}: {plan}")
+            if not uses_index:
+                problems.append(f'{label} 未使用 {index}')
+        
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("  ✓ 查詢數固定，常用查詢皆使用索引")
+
+
+if __name__ == '__main__':
+    main()
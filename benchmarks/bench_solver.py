@@ -0,0 +1,66 @@
+"""
+局部搜尋求解器（單程序 / 平行重啟）效能基準
+    
+    python -m benchmarks.bench_solver
+    python -m benchmarks.bench_solver --sizes 40:300 100:1000 --workers 1 4 16 --budget 2
+
+同一份輸入、同一個時間預算下比較不同子程序數找到的解：
+醫師重複排入兩間房的組數、衝突分鐘數、最晚結束時間、總迭代次數（子程序啟動時間也計入耗時）。
+局部搜尋的醫師重複排入組數比貪婪排程多時以狀態碼 1 結束。
+"""
+import argparse
+import contextlib
+import copy
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import SyntheticSchedule  # noqa: E402
+from surgery_scheduler.schedule_optimizer import OptimizationConfig, ScheduleOptimizer  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['40:300', '100:1000'])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--budget', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    OptimizationConfig.USE_ML_ANALYSIS = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimizer = ScheduleOptimizer()
+    
+    generator = SyntheticSchedule.from_training_data()
+    problems = []
+    print(f"{'rooms':>6} {'cases':>7} {'workers':>8} {'doctor':>7} {'overlap':>8} {'makespan':>9} {'iters':>9} {'sec':>6}")
+    for size in args.sizes:
+        rooms, cases = (int(x) for x in size.split(':'))
+        data = generator.day(cases, rooms=rooms, seed=args.seed)
+        greedy = None
+        for workers in args.workers:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = optimizer.optimize(copy.deepcopy(data), solver='local_search',
+                                            time_budget=args.budget, seed=args.seed, workers=workers)
+            info = result['solver']
+            if greedy is None:
+                greedy = info['greedy']
+                print(f"{rooms:>6} {cases:>7} {'greedy':>8} {greedy['doctor_conflicts']:>7} {greedy['overlap_minutes']:>8} "
+                      f"{greedy['makespan_minutes']:>9} {'-':>9} {'-':>6}")
+            metrics = info['result']
+            print(f"{rooms:>6} {cases:>7} {workers:>8} {metrics['doctor_conflicts']:>7} {metrics['overlap_minutes']:>8} "
+                  f"{metrics['makespan_minutes']:>9} {info['iterations']:>9} {info['elapsed_seconds']:>6.2f}")
+            if result['doctor_conflicts'] > greedy['doctor_conflicts']:
+                problems.append(f"{rooms}:{cases} workers={workers}: 醫師重複排入 "
+                                f"{greedy['doctor_conflicts']} → {result['doctor_conflicts']}")
+    
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+多院區並行測試：兩個（以上）院區同時優化與插入緊急手術，確認彼此的排程不會互相覆蓋
+    
+    python -m benchmarks.bench_tenancy
+    python -m benchmarks.bench_tenancy --hospitals 3 --rounds 5 --cases 120
+
+使用暫存的 SQLite 資料庫（不影響 db.sqlite3），透過實際的 view（Django test Client）操作：
+每個院區一個執行緒，交錯執行「優化 → 緊急插入」，最後檢查每個院區：
+- 資料表內的手術數 = 該院區最新版本排程的手術數
+- 手術、手術房、醫師、優化結果都屬於同一院區
+- 結果頁只顯示該院區的房間
+並列出單獨執行與同時執行的耗時。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+
+def setup_database(path):
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES['default']['NAME'] = path
+    # 同時寫入時等待鎖，而不是立即失敗
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 30
+    # 讓 test Client 的回應帶有 template context（檢查結果頁用）
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def run_tenant(hospital_id, upload_id, rounds, errors):
+    from django.db import connection
+    from django.test import Client
+    client = Client()
+    try:
+        client.get(f'/upload/?hospital={hospital_id}')
+        for i in range(rounds):
+            response = client.post(f'/optimize/{upload_id}/')
+            if response.status_code != 302:
+                errors.append((hospital_id, 'optimize', response.status_code))
+            response = client.post('/emergency/', {
+                'patient_name': f'急診{hospital_id}-{i}', 'doctor_name': f'值班醫師{hospital_id}',
+                'surgery_type': 'Debridement', 'urgency_level': '1',
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            if response.status_code != 200:
+                errors.append((hospital_id, 'emergency', response.status_code))
+    except Exception as e:  # 記錄後由主程序回報
+        errors.append((hospital_id, 'exception', repr(e)))
+    finally:
+        connection.close()
+
+
+def run_all(tenants, rounds, concurrent):
+    errors = []
+    started = time.perf_counter()
+    if concurrent:
+        threads = [threading.Thread(target=run_tenant, args=(h, u, rounds, errors)) for h, u in tenants]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        for h, u in tenants:
+            run_tenant(h, u, rounds, errors)
+    return time.perf_counter() - started, errors
+
+
+def check_isolation(tenants):
+    from django.test import Client
+    from surgery_scheduler.models import OptimizedSchedule, Surgery
+    problems = []
+    for hospital_id, _ in tenants:
+        latest = OptimizedSchedule.objects.filter(hospital_id=hospital_id).order_by('-created_at').first()
+        expected = len(latest.get_optimized_data()['optimized_data'])
+        surgeries = Surgery.objects.filter(hospital_id=hospital_id)
+        if surgeries.count() != expected:
+            problems.append(f'院區 {hospital_id}: 手術 {surgeries.count()} 筆，最新版本 {expected} 筆')
+        foreign = surgeries.exclude(operating_room__hospital_id=hospital_id).count()
+        foreign += surgeries.exclude(doctor__hospital_id=hospital_id).count()
+        if foreign:
+            problems.append(f'院區 {hospital_id}: {foreign} 筆手術指向其他院區的房間或醫師')
+        rooms = set(Client().get(f'/result/{latest.id}/?hospital={hospital_id}').context['rooms_data'])
+        own_rooms = set(surgeries.values_list('operating_room__number', flat=True))
+        if rooms != own_rooms:
+            problems.append(f'院區 {hospital_id}: 結果頁房間 {sorted(rooms)} ≠ {sorted(own_rooms)}')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hospitals', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--cases', type=int, default=60)
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'tenancy.sqlite3'))
+        from benchmarks.synthetic import SyntheticSchedule
+        from surgery_scheduler.models import Hospital, ScheduleUpload
+        from surgery_scheduler.schedule_optimizer import OptimizationConfig
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        
+        generator = SyntheticSchedule.from_training_data()
+        tenants = []
+        for i in range(args.hospitals):
+            hospital = Hospital.objects.create(name=f'院區{i + 1}')
+            # 各院區使用不同的房號範圍，方便檢查是否混到其他院區
+            data = generator.day(args.cases, rooms=6, seed=i, first_room=6 * i)
+            upload = ScheduleUpload.objects.create(
+                hospital=hospital, uploaded_file='schedules/synthetic.pdf', extracted_data=data,
+                processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+            )
+            tenants.append((hospital.id, upload.id))
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial, serial_errors = run_all(tenants, args.rounds, concurrent=False)
+            concurrent, concurrent_errors = run_all(tenants, args.rounds, concurrent=True)
+            problems = check_isolation(tenants)
+        
+        print(f"院區 {args.hospitals} 個 × {args.rounds} 輪（優化 + 緊急插入），每院區 {args.cases} 台")
+        print(f"  依序執行: {serial:.2f} s")
+        print(f"  同時執行: {concurrent:.2f} s")
+        for error in serial_errors + concurrent_errors:
+            print(f"  ❌ 請求失敗: {error}")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if serial_errors or concurrent_errors or problems:
+            sys.exit(1)
+        print("  ✓ 各院區排程互不影響")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+緊急手術同時插入測試：多個請求同時插入同一院區，確認沒有任何一筆被覆蓋
+    
+    python -m benchmarks.bench_versions
+    python -m benchmarks.bench_versions --threads 8 --per-thread 3 --cases 80
+
+使用暫存的 SQLite 資料庫（不影響 db.sqlite3），透過實際的 view（Django test Client）操作：
+先優化一次，接著多個執行緒同時送出緊急手術，最後檢查：
+- 院區目前版本包含所有送出的緊急手術
+- 版本鏈是一條直線（每個版本的 parent 都是前一個版本，沒有分岔）
+- 資料表內的手術與目前版本一致
+並列出總耗時與版本衝突重算的次數。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+from benchmarks.bench_tenancy import setup_database
+
+
+def run_thread(index, per_thread, errors):
+    from django.db import connection
+    from django.test import Client
+    client = Client()
+    try:
+        for i in range(per_thread):
+            response = client.post('/emergency/', {
+                'patient_name': f'急診{index}-{i}', 'doctor_name': f'值班醫師{index}',
+                'surgery_type': 'Debridement', 'urgency_level': str(1 + (index + i) % 5),
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            if response.status_code != 200:
+                errors.append((index, i, response.status_code, response.content[:200]))
+    except Exception as e:  # 記錄後由主程序回報
+        errors.append((index, 'exception', repr(e)))
+    finally:
+        connection.close()
+
+
+def check_versions(hospital_id, root_id, expected_patients):
+    from surgery_scheduler.persistence import current_version
+    from surgery_scheduler.models import OptimizedSchedule, Surgery
+    problems = []
+    head = current_version(hospital_id)
+    schedule = head.get_optimized_data()['optimized_data']
+    patients = {item.get('patient') for item in schedule}
+    missing = sorted(expected_patients - patients)
+    if missing:
+        problems.append(f'目前版本缺少 {len(missing)} 筆緊急手術: {missing[:5]}')
+    
+    chain = 0
+    node = head
+    while node.id != root_id:
+        chain += 1
+        node = node.parent
+        if node is None:
+            problems.append('目前版本的 parent 鏈沒有回到優化版本')
+            break
+    if chain != len(expected_patients):
+        problems.append(f'版本鏈長度 {chain}，預期 {len(expected_patients)}')
+    forks = OptimizedSchedule.objects.filter(hospital_id=hospital_id).exclude(id=root_id).count()
+    if forks != chain:
+        problems.append(f'共有 {forks} 個子版本，但版本鏈只有 {chain} 個（有分岔）')
+    
+    rows = set(Surgery.objects.filter(hospital_id=hospital_id).values_list('patient_name', flat=True))
+    if Surgery.objects.filter(hospital_id=hospital_id).count() != len(schedule) or not expected_patients <= rows:
+        problems.append('資料表內的手術與目前版本不一致')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=6)
+    parser.add_argument('--per-thread', type=int, default=3)
+    parser.add_argument('--cases', type=int, default=60)
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'versions.sqlite3'))
+        from django.test import Client
+        from benchmarks.synthetic import SyntheticSchedule
+        from surgery_scheduler.models import Hospital, OptimizedSchedule, ScheduleUpload
+        from surgery_scheduler.schedule_optimizer import OptimizationConfig
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        
+        hospital = Hospital.objects.create(name='院區1')
+        data = SyntheticSchedule.from_training_data().day(args.cases, rooms=6, seed=0)
+        upload = ScheduleUpload.objects.create(
+            hospital=hospital, uploaded_file='schedules/synthetic.pdf', extracted_data=data,
+            processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+        )
+        
+        errors = []
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            client = Client()
+            client.get(f'/upload/?hospital={hospital.id}')
+            client.post(f'/optimize/{upload.id}/')
+            root_id = OptimizedSchedule.objects.get(hospital=hospital).id
+            
+            started = time.perf_counter()
+            threads = [threading.Thread(target=run_thread, args=(t, args.per_thread, errors))
+                       for t in range(args.threads)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+        
+        expected = {f'急診{t}-{i}' for t in range(args.threads) for i in range(args.per_thread)}
+        problems = check_versions(hospital.id, root_id, expected)
+        
+        print(f"{args.threads} 個執行緒 × {args.per_thread} 筆緊急手術，原排程 {args.cases} 台")
+        print(f"  同時插入: {elapsed:.2f} s（{len(expected) / elapsed:.1f} 筆/秒）")
+        print(f"  版本衝突重算: {log.getvalue().count('排程版本衝突')} 次")
+        for error in errors:
+            print(f"  ❌ 請求失敗: {error}")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if errors or problems:
+            sys.exit(1)
+        print("  ✓ 所有緊急手術都已依序寫入目前版本")
+
+
+if __name__ == '__main__':
+    main()
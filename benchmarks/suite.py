@@ -0,0 +1,365 @@
+"""
+整體效能基準：以合成排程量測各主要步驟在不同規模下的耗時與記憶體高峰，輸出 JSON 供比對退步
+    
+    python -m benchmarks.suite
+    python -m benchmarks.suite --sizes 10 100 1000 10000 --output results.json
+    python -m benchmarks.suite --only optimize ocr --baseline results.json --tolerance 0.25
+    python -m benchmarks.suite --output - > results.json
+
+排程由 benchmarks.synthetic 依訓練資料的分布產生（固定 seed，每次相同），量測：
+- optimize          ScheduleOptimizer.optimize（--no-ml 時只用知識庫）
+- insert_emergency  EmergencySurgeryInserter.insert_emergency（插入已優化的排程）
+- analyze_surgery   MLSurgeryAnalyzer.analyze_surgery 逐台分析（每次先清空預測快取）
+- analyze_batch     MLSurgeryAnalyzer.analyze_batch 整天一次分析（每次先清空預測快取）
+- ocr               ScheduleOCRProcessor.process 解析合成 PDF（不使用 OCR 快取），結果必須與原排程相同
+- persist_optimized 優化結果寫入資料庫（與優化 view 相同：整批取代手術、建立版本與摘要）
+- emergency_view    以 test Client 送出緊急手術（插入 + 只寫入差異 + 建立版本）
+資料庫為暫存的 SQLite（不影響 db.sqlite3）。
+
+耗時為 --repeat 次中最快與中位數（準備輸入的時間不計入）；記憶體高峰另外以 tracemalloc 執行一次，
+只含主程序（OCR 子程序的記憶體不計入）。
+有 --baseline 時與之前的 JSON 比較：耗時或記憶體高峰超過基準 (1 + tolerance) 倍、
+且差距大於雜訊門檻時視為退步。結果不正確或有退步時以狀態碼 1 結束。
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
+
+from benchmarks.synthetic import SyntheticSchedule, ocr_fields  # noqa: E402
+
+# JSON 格式改變時遞增
+SCHEMA_VERSION = 1
+
+BENCHMARKS = (
+    'optimize', 'insert_emergency', 'analyze_surgery', 'analyze_batch',
+    'ocr', 'persist_optimized', 'emergency_view',
+)
+
+# 比對基準時的雜訊門檻：差距小於此值不算退步
+MIN_DELTA_SECONDS = 0.005
+MIN_DELTA_BYTES = 256 * 1024
+
+
+def measure(run, prepare=lambda: None, repeat=3):
+    """
+    執行 repeat 次 run(prepare())，回傳 (耗時列表, 記憶體高峰 bytes, 最後一次的結果)
+    
+    prepare 的時間不計入；記憶體高峰另外執行一次量測（tracemalloc 會拖慢執行）。
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        payload = prepare()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = run(payload)
+            timings.append(time.perf_counter() - started)
+    
+    payload = prepare()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            run(payload)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return timings, peak, result
+
+
+class Suite:
+    """依規模逐一執行各項基準，收集結果與錯誤"""
+    
+    def __init__(self, args, tmp):
+        self.args = args
+        self.tmp = tmp
+        self.generator = SyntheticSchedule.from_training_data()
+        self.results = []
+        self.problems = []
+        self._optimizer = None
+        self._analyzer = None
+        self._database = False
+        # persist_optimized 寫入的院區（emergency_view 接著插入）
+        self.hospital = None
+    
+    @property
+    def optimizer(self):
+        if self._optimizer is None:
+            from surgery_scheduler.schedule_optimizer import ScheduleOptimizer
+            with contextlib.redirect_stdout(io.StringIO()):
+                self._optimizer = ScheduleOptimizer()
+                # 暖機：模型載入不計入第一次量測
+                self._optimizer.optimize(self.generator.day(10, seed=self.args.seed))
+        return self._optimizer
+    
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            from surgery_scheduler.ml_analyzer import MLSurgeryAnalyzer
+            with contextlib.redirect_stdout(io.StringIO()):
+                self._analyzer = MLSurgeryAnalyzer()
+        return self._analyzer
+    
+    def record(self, name, cases, day, timings, peak, **extra):
+        entry = {
+            'benchmark': name,
+            'cases': cases,
+            'rooms': len({s['room'] for s in day}),
+            'repeat': len(timings),
+            'best_seconds': min(timings),
+            'median_seconds': statistics.median(timings),
+            'peak_memory_bytes': peak,
+        }
+        entry.update(extra)
+        self.results.append(entry)
+        detail = ''.join(f' | {k} {v}' for k, v in extra.items())
+        log(f"  {name:>17} {cases:>6} 台: 最快 {entry['best_seconds'] * 1000:>9.1f} ms | "
+            f"中位數 {entry['median_seconds'] * 1000:>9.1f} ms | 記憶體高峰 {peak / 1024 / 1024:>7.1f} MiB{detail}")
+    
+    def check(self, ok, message):
+        if not ok:
+            self.problems.append(message)
+    
+    def run(self):
+        for cases in self.args.sizes:
+            day = self.generator.day(cases, seed=self.args.seed + cases)
+            log(f"{cases} 台（{len({s['room'] for s in day})} 房）")
+            for name in BENCHMARKS:
+                if name in self.args.only:
+                    getattr(self, f'bench_{name}')(cases, day)
+    
+    def bench_optimize(self, cases, day):
+        from surgery_scheduler.prediction_cache import get_prediction_cache
+        
+        def prepare():
+            # 每次都從空的預測快取開始，各次量測的條件相同
+            get_prediction_cache().clear()
+            return copy.deepcopy(day)
+        
+        optimizer = self.optimizer
+        timings, peak, result = measure(lambda payload: optimizer.optimize(payload), prepare, self.args.repeat)
+        self.check(len(result['optimized_data']) == cases, f'optimize {cases} 台: 結果只有 {len(result["optimized_data"])} 台')
+        self.record('optimize', cases, day, timings, peak)
+    
+    def bench_insert_emergency(self, cases, day):
+        with contextlib.redirect_stdout(io.StringIO()):
+            schedule = self.optimizer.optimize(copy.deepcopy(day))['optimized_data']
+        emergency = self.generator.emergency(seed=self.args.seed + cases)
+        inserter = self.optimizer.emergency_inserter
+        timings, peak, result = measure(
+            lambda payload: inserter.insert_emergency(*payload),
+            lambda: (copy.deepcopy(schedule), dict(emergency)), self.args.repeat
+        )
+        self.check(len(result['adjusted_schedule']) == cases + 1,
+                   f'insert_emergency {cases} 台: 插入後有 {len(result["adjusted_schedule"])} 台')
+        self.record('insert_emergency', cases, day, timings, peak,
+                    affected=result['insertion_info']['affected_surgeries'])
+    
+    def _analyze(self, name, cases, day, run):
+        from surgery_scheduler.prediction_cache import get_prediction_cache
+        if not self.analyzer.is_ready():
+            self.problems.append(f'{name}: ML 模型無法載入（ml_models/*.pkl）')
+            return
+        cache = get_prediction_cache()
+        timings, peak, result = measure(run, cache.clear, self.args.repeat)
+        # 接台（TF）沒有開始時間，無法建立 ML 特徵，回傳 None 交給知識庫；其他都必須有結果
+        failed = sum(r is None for r, s in zip(result, day) if s['time'] != 'TF')
+        self.check(not failed, f'{name} {cases} 台: {failed} 台分析失敗')
+        self.record(name, cases, day, timings, peak, fallback=sum(r is None for r in result))
+    
+    def bench_analyze_surgery(self, cases, day):
+        self._analyze('analyze_surgery', cases, day, lambda _: [self.analyzer.analyze_surgery(s) for s in day])
+    
+    def bench_analyze_batch(self, cases, day):
+        self._analyze('analyze_batch', cases, day, lambda _: self.analyzer.analyze_batch(day))
+    
+    def bench_ocr(self, cases, day):
+        from surgery_scheduler.ocr_processor import ScheduleOCRProcessor
+        path = os.path.join(self.tmp, f'synthetic_{cases}.pdf')
+        pages = self.generator.write_pdf(path, day)
+        processor = ScheduleOCRProcessor(max_workers=self.args.workers)
+        timings, peak, result = measure(lambda _: processor.process(path), repeat=self.args.repeat)
+        self.check(ocr_fields(result['schedule_data']) == ocr_fields(day), f'ocr {cases} 台: 解析結果與合成排程不同')
+        self.record('ocr', cases, day, timings, peak, pages=pages)
+    
+    def setup_database(self):
+        if not self._database:
+            from benchmarks.bench_tenancy import setup_database
+            setup_database(os.path.join(self.tmp, 'suite.sqlite3'))
+            self._database = True
+    
+    def bench_persist_optimized(self, cases, day):
+        self.setup_database()
+        from surgery_scheduler.compact_schedule import CompactSchedule
+        from surgery_scheduler.models import Hospital, OptimizedSchedule, ScheduleUpload, Surgery
+        from django.utils import timezone
+        from surgery_scheduler.persistence import SchedulePersistence, optimization_notes, publish_version, write_atomic
+        from surgery_scheduler.schedule_summary import build_summary
+        
+        hospital = Hospital.objects.create(name=f'效能測試 {cases} 台')
+        upload = ScheduleUpload.objects.create(
+            hospital=hospital, uploaded_file='schedules/synthetic.pdf', extracted_data=day,
+            processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = self.optimizer.optimize(copy.deepcopy(day), hospital.id)
+        
+        def save(_):
+            # 與 ScheduleOptimizationView 的寫入相同
+            today = timezone.localdate()
+            
+            def block():
+                SchedulePersistence(hospital.id, today).replace_schedule(
+                    CompactSchedule.from_dicts(result['optimized_data']), optimization_notes
+                )
+                optimized = OptimizedSchedule.objects.create(
+                    hospital=hospital, original_schedule=upload, optimized_data=result,
+                    utilization_improvement=result.get('improvement', 0), schedule_date=today,
+                    summary=build_summary(hospital.id, today),
+                )
+                publish_version(hospital.id, optimized)
+                return optimized
+            return write_atomic(block)
+        
+        timings, peak, _ = measure(save, repeat=self.args.repeat)
+        stored = Surgery.objects.filter(hospital=hospital).count()
+        self.check(stored == cases, f'persist_optimized {cases} 台: 資料表有 {stored} 台')
+        self.record('persist_optimized', cases, day, timings, peak)
+        self.hospital = hospital
+    
+    def bench_emergency_view(self, cases, day):
+        from django.test import Client
+        from surgery_scheduler.models import Surgery
+        if 'persist_optimized' not in self.args.only:
+            self.bench_persist_optimized(cases, day)
+        hospital = self.hospital
+        client = Client()
+        client.get(f'/upload/?hospital={hospital.id}')
+        emergency = self.generator.emergency(seed=self.args.seed + cases)
+        form = {
+            'patient_name': emergency['patient'], 'doctor_name': emergency['doctor'],
+            'surgery_type': emergency['surgery_type'], 'urgency_level': str(emergency['urgency_level']),
+        }
+        before = Surgery.objects.filter(hospital=hospital).count()
+        timings, peak, response = measure(
+            lambda _: client.post('/emergency/', form, HTTP_X_REQUESTED_WITH='XMLHttpRequest'), repeat=self.args.repeat
+        )
+        self.check(response.status_code == 200, f'emergency_view {cases} 台: 狀態碼 {response.status_code}')
+        inserted = Surgery.objects.filter(hospital=hospital).count() - before
+        self.check(inserted == self.args.repeat + 1, f'emergency_view {cases} 台: 新增 {inserted} 台')
+        self.record('emergency_view', cases, day, timings, peak)
+
+
+def compare(results, baseline, tolerance):
+    """與基準結果比較，回傳退步的項目"""
+    previous = {(r['benchmark'], r['cases']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = previous.get((result['benchmark'], result['cases']))
+        if base is None:
+            continue
+        for metric, floor in (('best_seconds', MIN_DELTA_SECONDS), ('peak_memory_bytes', MIN_DELTA_BYTES)):
+            old, new = base[metric], result[metric]
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append({
+                    'benchmark': result['benchmark'], 'cases': result['cases'], 'metric': metric,
+                    'baseline': old, 'current': new, 'ratio': new / old if old else None,
+                })
+    return regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent.parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+# 輸出 JSON 到 stdout 時，表格改印到 stderr
+_log_stream = sys.stdout
+
+
+def log(message):
+    print(message, file=_log_stream, flush=True)
+
+
+def main(argv=None):
+    global _log_stream
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='OCR 子程序數')
+    parser.add_argument('--no-ml', action='store_true', help='optimize / insert_emergency 只用知識庫')
+    parser.add_argument('--output', help="JSON 結果的檔案路徑（'-' 表示 stdout）")
+    parser.add_argument('--baseline', help='之前的 JSON 結果，用來比對退步')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    if args.output == '-':
+        _log_stream = sys.stderr
+    
+    from surgery_scheduler.schedule_optimizer import OptimizationConfig
+    OptimizationConfig.USE_ML_ANALYSIS = not args.no_ml
+    
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        suite = Suite(args, tmp)
+        suite.run()
+    
+    report = {
+        'schema': SCHEMA_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {
+            'sizes': args.sizes, 'repeat': args.repeat, 'seed': args.seed,
+            'workers': args.workers, 'ml': not args.no_ml,
+        },
+        'duration_seconds': round(time.perf_counter() - started, 3),
+        'results': suite.results,
+        'problems': suite.problems,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(suite.results, json.load(f), args.tolerance)
+        for r in report['regressions']:
+            ratio = f"（{r['ratio']:.2f}x）" if r['ratio'] else ''
+            log(f"  📉 {r['benchmark']} {r['cases']} 台 {r['metric']}: {r['baseline']:.4g} → {r['current']:.4g}{ratio}")
+    
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(text)
+    elif args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        log(f"結果已寫入 {args.output}")
+    
+    for problem in suite.problems:
+        log(f"  ❌ {problem}")
+    if suite.problems or report.get('regressions'):
+        sys.exit(1)
+    log("  ✓ 所有結果正確" + ('，沒有退步' if args.baseline else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+合成排程產生器：依 ml_models/training_data.csv 的分布產生可重現（固定 seed）的一天排程與排程 PDF
+    
+    from benchmarks.synthetic import SyntheticSchedule
+    generator = SyntheticSchedule.from_training_data()
+    day = generator.day(1000, seed=0)             # 與 OCR 輸出格式相同的手術列表
+    generator.write_pdf('day.pdf', day)           # ScheduleOCRProcessor 可解析的 PDF
+    emergency = generator.emergency(seed=0)       # 緊急手術表單資料
+    optimized = seed_schedule(hospital, day)      # 優化後寫入資料表並發布為院區目前版本（需 Django）
+
+- 術式依訓練資料的出現頻率抽樣，主刀醫師依「該術式」的醫師分布抽樣
+- 各房第一台的開始時間取自訓練資料中的早上時段，之後依該術式的實際時長（進位到 15 分鐘）接續
+- 手術房沿用訓練資料的房號（10、12 … 24），房間不夠時以相同間隔往後編號；
+  各房台數依訓練資料的房間分布分配
+- 約一成接台（TF）手術，與實際 PDF 相同
+"""
+import bisect
+import csv
+import itertools
+import math
+import random
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+TRAINING_DATA = Path(__file__).resolve().parent.parent / 'ml_models' / 'training_data.csv'
+
+# 平均每房每天的台數（訓練資料平均時長約 2 小時，07:00–23:00 約 8 台）
+CASES_PER_ROOM = 8
+# 接台（TF）手術的比例
+TF_RATE = 0.1
+# 第一台最晚的開始時間；之後的開始時間不超過 DAY_LAST_START
+FIRST_CASE_LATEST = 9 * 60
+DAY_LAST_START = 23 * 60 + 30
+# 排程時間以 15 分鐘為單位
+SLOT_MINUTES = 15
+
+SURNAMES = '陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周'
+GIVEN_NAMES = '志明美玲建宏淑芬俊傑雅婷家豪怡君宗翰佳蓉冠宇欣怡承恩'
+
+FONT = 'STSong-Light'
+LINES_PER_PAGE = 48
+
+
+class WeightedChoice:
+    """依出現次數加權抽樣（累積權重 + 二分搜尋）"""
+    
+    def __init__(self, counts: Dict):
+        self.values = list(counts)
+        self.cumulative = list(itertools.accumulate(counts[v] for v in self.values))
+    
+    def sample(self, rng: random.Random):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+class SyntheticSchedule:
+    """訓練資料的分布（術式、術式別醫師、房間、早上開刀時間、術式別實際時長）"""
+    
+    def __init__(self, rows: Sequence[Dict[str, str]]):
+        if not rows:
+            raise ValueError('訓練資料沒有任何資料列')
+        self.surgery_types = WeightedChoice(Counter(row['surgery_type'] for row in rows))
+        doctors = defaultdict(Counter)
+        durations = defaultdict(list)
+        for row in rows:
+            doctors[row['surgery_type']][row['doctor']] += 1
+            durations[row['surgery_type']].append(int(row['actual_duration']))
+        self.doctors_by_type = {t: WeightedChoice(c) for t, c in doctors.items()}
+        self.durations_by_type = dict(durations)
+        
+        rooms = Counter(int(row['room']) for row in rows)
+        self.room_numbers = sorted(rooms)
+        self.room_weights = [rooms[r] for r in self.room_numbers]
+        self.room_step = min((b - a for a, b in zip(self.room_numbers, self.room_numbers[1:])), default=1)
+        
+        starts = Counter()
+        for row in rows:
+            minutes = _minutes(row['time'])
+            if minutes <= FIRST_CASE_LATEST:
+                starts[minutes] += 1
+        self.first_starts = WeightedChoice(starts or Counter({8 * 60: 1}))
+    
+    @classmethod
+    def from_training_data(cls, path=TRAINING_DATA) -> 'SyntheticSchedule':
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls(list(csv.DictReader(f)))
+    
+    def rooms(self, count: int) -> List[str]:
+        """count 個房號：先用訓練資料的房號，不夠時以相同間隔往後編號"""
+        numbers = self.room_numbers[:count]
+        while len(numbers) < count:
+            numbers.append(numbers[-1] + self.room_step)
+        return [str(n) for n in numbers]
+    
+    def day(self, cases: int, rooms: int = None, seed: int = 0, first_room: int = 0) -> List[Dict]:
+        """
+        產生一天 cases 台手術（格式與 ScheduleOCRProcessor 的 schedule_data 相同）
+        
+        rooms 預設為 ceil(cases / CASES_PER_ROOM)；同一個 seed 每次產生相同的排程。
+        first_room 跳過前面幾個房號（多院區時讓各院區的房號不重疊）。
+        """
+        rng = random.Random(seed)
+        rooms = rooms or max(1, math.ceil(cases / CASES_PER_ROOM))
+        numbers = self.rooms(first_room + rooms)[first_room:]
+        # 各房台數：依訓練資料的房間分布分配（房號超出訓練資料時循環使用權重）
+        weights = [self.room_weights[(first_room + i) % len(self.room_weights)] for i in range(rooms)]
+        counts = Counter(rng.choices(range(rooms), weights=weights, k=cases))
+        
+        data = []
+        for index, room in enumerate(numbers):
+            t = self.first_starts.sample(rng)
+            for j in range(counts[index]):
+                surgery_type = self.surgery_types.sample(rng)
+                tf = j > 0 and rng.random() < TF_RATE
+                time_str = 'TF' if tf else f"{t // 60:02d}:{t % 60:02d}"
+                data.append({
+                    'room': room, 'time': time_str, 'patient': _patient(rng),
+                    'doctor': self.doctors_by_type[surgery_type].sample(rng),
+                    'surgery_type': f'S{rng.randint(1000, 9999)} {surgery_type}',
+                    'original_time': time_str, 'original_room': room, 'sort_key': 2 * j + 1,
+                })
+                duration = rng.choice(self.durations_by_type[surgery_type])
+                t = min(t + math.ceil(duration / SLOT_MINUTES) * SLOT_MINUTES, DAY_LAST_START)
+        return data
+    
+    def emergency(self, seed: int = 0) -> Dict:
+        """緊急手術（與緊急插入表單相同的欄位）"""
+        rng = random.Random(seed)
+        surgery_type = self.surgery_types.sample(rng)
+        return {
+            'patient': _patient(rng),
+            'doctor': self.doctors_by_type[surgery_type].sample(rng),
+            'surgery_type': surgery_type,
+            'urgency_level': rng.randint(1, 5),
+        }
+    
+    @staticmethod
+    def write_pdf(path, day: Sequence[Dict]) -> int:
+        """
+        把排程寫成 ScheduleOCRProcessor 可解析的 PDF，回傳頁數
+        
+        內容連續排版（房間區塊會跨頁），OCR 解析結果應與 day 完全相同。
+        """
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        from reportlab.pdfgen import canvas
+        
+        if FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+        
+        c = canvas.Canvas(str(path), invariant=1)
+        line = 0
+        pages = 1
+        
+        def write(text):
+            nonlocal line, pages
+            if line == LINES_PER_PAGE:
+                c.showPage()
+                line = 0
+                pages += 1
+            if line == 0:
+                c.setFont(FONT, 10)
+            c.drawString(40, 800 - line * 16, text)
+            line += 1
+        
+        room = None
+        for surgery in day:
+            if surgery['room'] != room:
+                room = surgery['room']
+                write(f'房間：{room}')
+            write(surgery['time'])
+            write(f"{surgery['patient']} {surgery['doctor']} 推床")
+            write(surgery['surgery_type'])
+        c.save()
+        return pages
+
+
+def seed_schedule(hospital, day: Sequence[Dict], schedule_date=None):
+    """
+    與 ScheduleOptimizationView 相同的寫入：建立上傳、優化、寫入 schedule_date（預設今天）的手術，
+    建立 OptimizedSchedule 並發布為院區目前版本；回傳 OptimizedSchedule（需已設定 Django）
+    """
+    from django.utils import timezone
+    from surgery_scheduler.compact_schedule import CompactSchedule
+    from surgery_scheduler.models import OptimizedSchedule, ScheduleUpload
+    from surgery_scheduler.persistence import SchedulePersistence, optimization_notes, publish_version
+    from surgery_scheduler.schedule_optimizer import ScheduleOptimizer
+    from surgery_scheduler.schedule_summary import build_summary
+    
+    day = list(day)
+    schedule_date = schedule_date or timezone.localdate()
+    upload = ScheduleUpload.objects.create(
+        hospital=hospital, uploaded_file='schedules/synthetic.pdf', extracted_data=day,
+        processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+    )
+    result = ScheduleOptimizer().optimize(day, hospital.id)
+    SchedulePersistence(hospital.id, schedule_date).replace_schedule(
+        CompactSchedule.from_dicts(result['optimized_data']), optimization_notes
+    )
+    optimized = OptimizedSchedule.objects.create(
+        hospital=hospital, original_schedule=upload, optimized_data=result,
+        utilization_improvement=result.get('improvement', 0), schedule_date=schedule_date,
+        summary=build_summary(hospital.id, schedule_date),
+    )
+    publish_version(hospital.id, optimized)
+    return optimized
+
+
+def _minutes(time_str: str) -> int:
+    hour, minute = time_str.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def _patient(rng: random.Random) -> str:
+    return rng.choice(SURNAMES) + ''.join(rng.choices(GIVEN_NAMES, k=2))
+
+
+def ocr_fields(day: Sequence[Dict]) -> List[Tuple]:
+    """比對 OCR 結果用：每台手術的 (房號, 時間, 病患, 醫師, 術式, 原始順序)"""
+    return [(s['room'], s['time'], s['patient'], s['doctor'], s['surgery_type'], s['sort_key']) for s in day]
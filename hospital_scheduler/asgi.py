@@ -13,4 +13,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_scheduler.settings')
 
+# 📺 看板即時推播（/live/schedule/，SSE）需以 ASGI 伺服器執行，例如：
+#     uvicorn hospital_scheduler.asgi:application
 application = get_asgi_application()
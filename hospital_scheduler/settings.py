@@ -78,6 +78,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 測試資料庫使用檔案（記憶體資料庫的鎖定不會等待，多執行緒的並行測試需要與正式環境相同的行為）
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -125,3 +127,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# 📄 OCR 背景解析的執行緒數量
+OCR_WORKERS = 2
+# 📄 解析中的工作超過此秒數沒有更新進度時視為中斷（程序重啟或當機），改由其他工作者接手
+OCR_JOB_TIMEOUT = 600
+
+# 📄 OCR 結果快取（整份檔案 / 單頁內容 hash），超過容量時淘汰最久未用的項目
+OCR_CACHE_DIR = BASE_DIR / 'ocr_cache'
+OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024
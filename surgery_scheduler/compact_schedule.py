@@ -0,0 +1,350 @@
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+NO_TIME = -1  # TF 或無法解析的時間
+DAY_START_MINUTES = 8 * 60  # 08:00
+
+
+@lru_cache(maxsize=4096)
+def time_to_minutes(time_str: str) -> int:
+    """'HH:MM' → 距午夜分鐘數（與 strptime('%H:%M') 相同的解析規則）"""
+    t = datetime.strptime(time_str, '%H:%M')
+    return t.hour * 60 + t.minute
+
+
+@lru_cache(maxsize=4096)
+def minutes_to_time(minutes: int) -> str:
+    """距午夜分鐘數 → 'HH:MM'（超過午夜時與 datetime.strftime 一樣取 24 小時餘數）"""
+    return f"{(minutes // 60) % 24:02d}:{minutes % 60:02d}"
+
+
+@lru_cache(maxsize=4096)
+def encode_time(value: str):
+    """
+    時間字串 → (分鐘數, 原字串)
+    標準 'HH:MM' 只存分鐘數（原字串為 None）；'8:00'、'TF' 等非標準格式另外保留原字串
+    """
+    if (len(value) == 5 and value[2] == ':' and value.isascii()
+            and value[:2].isdigit() and value[3:].isdigit()):
+        hour, minute = int(value[:2]), int(value[3:])
+        if hour < 24 and minute < 60:
+            return hour * 60 + minute, None
+    try:
+        return time_to_minutes(value), value
+    except ValueError:
+        return NO_TIME, value
+
+
+class StatusCode(IntEnum):
+    """手術狀態代碼（取代每筆都重複的狀態字串）"""
+    NONE = 0
+    ANCHOR = 1        # 📌 第一台-保留
+    REASSIGNED = 2    # 🔄 重新分配(原房{status_arg})
+    KEPT = 3          # ✅ 保持原房
+    EMERGENCY = 4     # 🚨 緊急手術
+    DELAYED = 5       # ⏰ 因緊急手術延後 {status_arg} 分鐘
+    CUSTOM = 6        # 其他文字，原樣保留在 status_raw
+
+
+STATUS_TEXT = {
+    StatusCode.ANCHOR: "📌 第一台-保留",
+    StatusCode.KEPT: "✅ 保持原房",
+    StatusCode.EMERGENCY: "🚨 緊急手術",
+}
+_STATUS_BY_TEXT = {text: code for code, text in STATUS_TEXT.items()}
+_REASSIGNED_RE = re.compile(r'🔄 重新分配\(原房(.*)\)')
+_DELAYED_RE = re.compile(r'⏰ 因緊急手術延後 ([1-9][0-9]*|0) 分鐘')
+
+
+class Field:
+    """
+    present 位元：記錄原始 dict 中出現過哪些 key（轉回 dict 時才能無損還原）
+    用一般 int 常數而非 IntFlag，避免熱路徑上的 enum 運算成本
+    """
+    ROOM = 1 << 0
+    TIME = 1 << 1
+    PATIENT = 1 << 2
+    DOCTOR = 1 << 3
+    SURGERY_TYPE = 1 << 4
+    ORIGINAL_TIME = 1 << 5
+    ORIGINAL_ROOM = 1 << 6
+    SORT_KEY = 1 << 7
+    DURATION = 1 << 8
+    BASE_DURATION = 1 << 9
+    PRIORITY = 1 << 10
+    CATEGORY = 1 << 11
+    ANALYSIS_METHOD = 1 << 12
+    IS_SCHEDULED = 1 << 13
+    IS_TF = 1 << 14
+    IS_FIRST_SURGERY = 1 << 15
+    STATUS = 1 << 16
+    IS_EMERGENCY = 1 << 17
+    DELAYED_BY_EMERGENCY = 1 << 18
+    URGENCY_LEVEL = 1 << 19
+    NOTES = 1 << 20
+
+
+# 欄位解碼規格：key → (種類, 允許的型別, present 位元)
+# 布林欄位的存在與否記在 present，值記在 flags（同一個 bit）
+_BOOL, _INT, _STR, _INTERNED, _ROOM, _DOCTOR, _TIME, _STATUS = range(8)
+_DECODE_SPEC = {
+    'room': (_ROOM, (str, int), Field.ROOM),
+    'time': (_TIME, (str,), Field.TIME),
+    'patient': (_STR, (str,), Field.PATIENT),
+    'doctor': (_DOCTOR, (str,), Field.DOCTOR),
+    'surgery_type': (_STR, (str,), Field.SURGERY_TYPE),
+    'original_time': (_TIME, (str,), Field.ORIGINAL_TIME),
+    'original_room': (_ROOM, (str, int), Field.ORIGINAL_ROOM),
+    'sort_key': (_INT, (int,), Field.SORT_KEY),
+    'duration': (_INT, (int,), Field.DURATION),
+    'base_duration': (_INT, (int,), Field.BASE_DURATION),
+    'priority': (_INT, (int,), Field.PRIORITY),
+    'category': (_INTERNED, (str,), Field.CATEGORY),
+    'analysis_method': (_INTERNED, (str,), Field.ANALYSIS_METHOD),
+    'is_scheduled': (_BOOL, (bool,), Field.IS_SCHEDULED),
+    'is_tf': (_BOOL, (bool,), Field.IS_TF),
+    'is_first_surgery': (_BOOL, (bool,), Field.IS_FIRST_SURGERY),
+    'status': (_STATUS, (str,), Field.STATUS),
+    'is_emergency': (_BOOL, (bool,), Field.IS_EMERGENCY),
+    'delayed_by_emergency': (_BOOL, (bool,), Field.DELAYED_BY_EMERGENCY),
+    'urgency_level': (_INT, (int,), Field.URGENCY_LEVEL),
+    'notes': (_STR, (str,), Field.NOTES),
+}
+_BOOL_FIELDS = {key: bit for key, (kind, _, bit) in _DECODE_SPEC.items() if kind == _BOOL}
+_INT_FIELDS = {key: bit for key, (kind, _, bit) in _DECODE_SPEC.items() if kind == _INT}
+
+
+class SymbolTable:
+    """字串 ↔ 整數 id（房號、醫師名稱只存一份）"""
+    
+    __slots__ = ('values', 'ids')
+    
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+    
+    def intern(self, value) -> int:
+        # 字串直接當 key；其他型別連同型別一起比對，避免 3 與 '3' 混為同一個 id
+        key = value if type(value) is str else (type(value), value)
+        symbol = self.ids.get(key)
+        if symbol is None:
+            symbol = len(self.values)
+            self.ids[key] = symbol
+            self.values.append(value)
+        return symbol
+    
+    def __getitem__(self, symbol: int):
+        return self.values[symbol]
+    
+    def __len__(self):
+        return len(self.values)
+
+
+@dataclass(slots=True, eq=False)
+class CompactSurgery:
+    """單台手術的精簡表示：時間為整數分鐘、房號/醫師為 SymbolTable id、狀態為代碼"""
+    room: int = -1
+    original_room: int = -1
+    doctor: int = -1
+    start: int = NO_TIME
+    original_start: int = NO_TIME
+    duration: int = 0
+    base_duration: int = 0
+    priority: int = 0
+    sort_key: int = 0
+    urgency_level: int = 0
+    status: int = StatusCode.NONE
+    status_arg: int = 0
+    flags: int = 0
+    present: int = 0
+    patient: Optional[str] = None
+    surgery_type: Optional[str] = None
+    category: Optional[str] = None
+    analysis_method: Optional[str] = None
+    notes: Optional[str] = None
+    time_raw: Optional[str] = None
+    original_time_raw: Optional[str] = None
+    status_raw: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None
+    
+    def has(self, field: int) -> bool:
+        return bool(self.present & field)
+    
+    def flag(self, field: int) -> bool:
+        return bool(self.flags & field)
+    
+    def set_flag(self, field: int, value: bool):
+        self.present |= field
+        if value:
+            self.flags |= field
+        else:
+            self.flags &= ~field
+    
+    def set_start(self, minutes: int):
+        self.start = minutes
+        self.time_raw = None
+        self.present |= Field.TIME
+    
+    def set_status(self, code: StatusCode, arg: int = 0):
+        self.status = code
+        self.status_arg = arg
+        self.status_raw = None
+        self.present |= Field.STATUS
+    
+    @property
+    def time_str(self) -> str:
+        return self.time_raw if self.time_raw is not None else minutes_to_time(self.start)
+    
+    @property
+    def original_time_str(self) -> str:
+        if self.original_time_raw is not None:
+            return self.original_time_raw
+        return minutes_to_time(self.original_start)
+
+
+class CompactSchedule:
+    """
+    整天排程的精簡表示（__slots__ dataclass 列表 + 房號/醫師 SymbolTable）
+    
+    from_dicts / to_dicts 與原本的 List[Dict] 格式互轉且無損：
+    未知的 key 或型別不符的值會原樣保留在 extra。
+    """
+    
+    __slots__ = ('surgeries', 'rooms', 'doctors')
+    
+    def __init__(self):
+        self.surgeries: List[CompactSurgery] = []
+        self.rooms = SymbolTable()
+        self.doctors = SymbolTable()
+    
+    def __len__(self):
+        return len(self.surgeries)
+    
+    def __iter__(self) -> Iterator[CompactSurgery]:
+        return iter(self.surgeries)
+    
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict[str, Any]]) -> 'CompactSchedule':
+        schedule = cls()
+        for item in items:
+            schedule.append(item)
+        return schedule
+    
+    def append(self, item: Dict[str, Any]) -> CompactSurgery:
+        """加入一筆 dict 格式的手術，回傳對應的 CompactSurgery"""
+        s = CompactSurgery()
+        present = flags = 0
+        extra = None
+        for key, value in item.items():
+            spec = _DECODE_SPEC.get(key)
+            if spec is None or type(value) not in spec[1]:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                continue
+            
+            kind, _, bit = spec
+            present |= bit
+            if kind == _STR or kind == _INT:
+                setattr(s, key, value)
+            elif kind == _BOOL:
+                if value:
+                    flags |= bit
+            elif kind == _TIME:
+                if key == 'time':
+                    s.start, s.time_raw = encode_time(value)
+                else:
+                    s.original_start, s.original_time_raw = encode_time(value)
+            elif kind == _ROOM:
+                setattr(s, key, self.rooms.intern(value))
+            elif kind == _DOCTOR:
+                s.doctor = self.doctors.intern(value)
+            elif kind == _INTERNED:
+                setattr(s, key, sys.intern(value))
+            else:
+                self._decode_status(s, value)
+        
+        s.present |= present
+        s.flags |= flags
+        s.extra = extra
+        self.surgeries.append(s)
+        return s
+    
+    def _decode_status(self, s: CompactSurgery, text: str):
+        code = _STATUS_BY_TEXT.get(text)
+        if code is not None:
+            s.set_status(code)
+            return
+        m = _REASSIGNED_RE.fullmatch(text)
+        if m:
+            s.set_status(StatusCode.REASSIGNED, self.rooms.intern(m.group(1)))
+            return
+        m = _DELAYED_RE.fullmatch(text)
+        if m:
+            s.set_status(StatusCode.DELAYED, int(m.group(1)))
+            return
+        s.set_status(StatusCode.CUSTOM)
+        s.status_raw = text
+    
+    def status_text(self, s: CompactSurgery) -> str:
+        if s.status == StatusCode.CUSTOM:
+            return s.status_raw
+        if s.status == StatusCode.REASSIGNED:
+            return f"🔄 重新分配(原房{self.rooms[s.status_arg]})"
+        if s.status == StatusCode.DELAYED:
+            return f"⏰ 因緊急手術延後 {s.status_arg} 分鐘"
+        return STATUS_TEXT.get(s.status, '')
+    
+    def room_name(self, s: CompactSurgery, default=None):
+        return self.rooms[s.room] if s.has(Field.ROOM) else default
+    
+    def original_room_name(self, s: CompactSurgery):
+        return self.rooms[s.original_room]
+    
+    def doctor_name(self, s: CompactSurgery, default: str = '待核對'):
+        return self.doctors[s.doctor] if s.has(Field.DOCTOR) else default
+    
+    def to_dict(self, s: CompactSurgery) -> Dict[str, Any]:
+        """CompactSurgery → 原本的 dict 格式"""
+        present = s.present
+        item = {}
+        if present & Field.ROOM:
+            item['room'] = self.rooms[s.room]
+        if present & Field.TIME:
+            item['time'] = s.time_str
+        if present & Field.PATIENT:
+            item['patient'] = s.patient
+        if present & Field.DOCTOR:
+            item['doctor'] = self.doctors[s.doctor]
+        if present & Field.SURGERY_TYPE:
+            item['surgery_type'] = s.surgery_type
+        if present & Field.ORIGINAL_TIME:
+            item['original_time'] = s.original_time_str
+        if present & Field.ORIGINAL_ROOM:
+            item['original_room'] = self.rooms[s.original_room]
+        for key, field in _INT_FIELDS.items():
+            if present & field:
+                item[key] = getattr(s, key)
+        if present & Field.CATEGORY:
+            item['category'] = s.category
+        if present & Field.ANALYSIS_METHOD:
+            item['analysis_method'] = s.analysis_method
+        for key, field in _BOOL_FIELDS.items():
+            if present & field:
+                item[key] = bool(s.flags & field)
+        if present & Field.STATUS:
+            item['status'] = self.status_text(s)
+        if present & Field.NOTES:
+            item['notes'] = s.notes
+        if s.extra:
+            item.update(s.extra)
+        return item
+    
+    def to_dicts(self, surgeries: Optional[Iterable[CompactSurgery]] = None) -> List[Dict[str, Any]]:
+        """轉回 List[Dict]（可指定輸出順序）"""
+        return [self.to_dict(s) for s in (self.surgeries if surgeries is None else surgeries)]
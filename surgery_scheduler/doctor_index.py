@@ -0,0 +1,83 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Hashable, List, Tuple
+
+# 尚未核對或沒有填寫的醫師名稱，不列入衝突檢查
+PLACEHOLDER_DOCTORS = frozenset({'', '待核對', '不明'})
+
+
+class DoctorIntervalIndex:
+    """
+    每位醫師的手術時段索引（依開始時間排序的列表 + 二分搜尋）
+    
+    與 [start, end) 重疊的時段，開始時間一定落在 (start - 該醫師最長時段, end) 之間，
+    因此查詢只需二分找出這段範圍再逐一比對，O(log n + 範圍內筆數)。
+    同一間房的時段不算衝突（房內前後順序由房間排程本身處理），只回報「同時在兩間房」。
+    """
+    
+    def __init__(self):
+        self._starts: Dict[Hashable, List[int]] = {}
+        self._items: Dict[Hashable, List[Tuple[int, int, Any, Any]]] = {}
+        self._longest: Dict[Hashable, int] = {}
+    
+    def __len__(self):
+        return sum(len(starts) for starts in self._starts.values())
+    
+    def add(self, doctor, start: int, end: int, room, key=None) -> bool:
+        """登記一個時段；佔位用的醫師名稱不登記並回傳 False"""
+        if doctor in PLACEHOLDER_DOCTORS or end <= start:
+            return False
+        starts = self._starts.setdefault(doctor, [])
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        self._items.setdefault(doctor, []).insert(i, (start, end, room, key))
+        if end - start > self._longest.get(doctor, 0):
+            self._longest[doctor] = end - start
+        return True
+    
+    def remove(self, doctor, start: int, end: int, room, key=None) -> bool:
+        starts = self._starts.get(doctor)
+        if not starts:
+            return False
+        items = self._items[doctor]
+        for i in range(bisect_left(starts, start), bisect_right(starts, start)):
+            if items[i] == (start, end, room, key):
+                del starts[i]
+                del items[i]
+                return True
+        return False
+    
+    def conflicts(self, doctor, start: int, end: int, room=None, exclude=None) -> List[Tuple[int, int, Any, Any]]:
+        """回傳該醫師在其他房間、與 [start, end) 重疊的時段 (start, end, room, key)"""
+        starts = self._starts.get(doctor)
+        if not starts or doctor in PLACEHOLDER_DOCTORS:
+            return []
+        items = self._items[doctor]
+        lo = bisect_right(starts, start - self._longest[doctor])
+        hi = bisect_left(starts, end)
+        return [
+            item for item in items[lo:hi]
+            if item[1] > start and item[2] != room and (exclude is None or item[3] is not exclude)
+        ]
+    
+    def is_free(self, doctor, start: int, end: int, room=None, exclude=None) -> bool:
+        return not self.conflicts(doctor, start, end, room, exclude)
+    
+    def next_free(self, doctor, start: int, duration: int, room=None, exclude=None) -> int:
+        """start 之後該醫師可連續空出 duration 分鐘的最早時間"""
+        t = start
+        while True:
+            clashes = self.conflicts(doctor, t, t + duration, room, exclude)
+            if not clashes:
+                return t
+            t = max(item[1] for item in clashes)
+    
+    def count_conflicts(self) -> int:
+        """醫師重複排入兩間房且時間重疊的組數"""
+        count = 0
+        for doctor, items in self._items.items():
+            starts = self._starts[doctor]
+            for i, (start, end, room, _) in enumerate(items):
+                # 只往後找，每一組只算一次
+                hi = bisect_left(starts, end, i + 1)
+                count += sum(1 for other in items[i + 1:hi] if other[2] != room)
+        return count
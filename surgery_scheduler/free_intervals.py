@@ -0,0 +1,64 @@
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+# 房間最後一台之後的空檔沒有結束時間
+OPEN_END = 1 << 30
+
+
+class FreeIntervalIndex:
+    """
+    各房間空檔（free interval）索引
+    
+    所有房間在 not_before 之後的空檔依開始時間排成一列（同時開始時依房間加入順序），
+    以 segment tree 維護區段內最長的空檔長度，
+    「第 lo 個之後第一個長度 ≥ length 的空檔」只需 O(log n)。
+    前後相接的手術之間會留下長度 0 的空檔（可插入、但需要延後後面的手術）。
+    """
+    
+    def __init__(self, busy: Dict[Hashable, Iterable[Tuple[int, int]]], not_before: int):
+        gaps = []
+        for order, (room, intervals) in enumerate(busy.items()):
+            t = not_before
+            for start, end in sorted(intervals):
+                if start >= t:
+                    gaps.append((t, start, order, room))
+                t = max(t, end)
+            gaps.append((t, OPEN_END, order, room))
+        gaps.sort(key=lambda gap: (gap[0], gap[2]))
+        self.gaps: List[Tuple[int, int, Hashable]] = [(start, end, room) for start, end, _, room in gaps]
+        
+        size = 1
+        while size < len(self.gaps):
+            size *= 2
+        self._size = size
+        self._tree = [-1] * (2 * size)
+        for i, (start, end, _) in enumerate(self.gaps):
+            self._tree[size + i] = end - start
+        for node in range(size - 1, 0, -1):
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+    
+    def __len__(self):
+        return len(self.gaps)
+    
+    def first_fit(self, length: int, lo: int = 0) -> Optional[int]:
+        """第 lo 個（含）之後第一個長度 ≥ length 的空檔位置，沒有時回傳 None"""
+        if lo >= len(self.gaps):
+            return None
+        return self._descend(1, 0, self._size, lo, length)
+    
+    def iter_fits(self, length: int) -> Iterator[Tuple[int, int, Hashable]]:
+        """依開始時間 yield 長度 ≥ length 的空檔 (開始, 結束, 房間)，每一個 O(log n)"""
+        i = self.first_fit(length)
+        while i is not None:
+            yield self.gaps[i]
+            i = self.first_fit(length, i + 1)
+    
+    def _descend(self, node: int, node_lo: int, node_hi: int, lo: int, length: int) -> Optional[int]:
+        if node_hi <= lo or self._tree[node] < length:
+            return None
+        if node >= self._size:
+            return node - self._size
+        mid = (node_lo + node_hi) // 2
+        found = self._descend(2 * node, node_lo, mid, lo, length)
+        if found is None:
+            found = self._descend(2 * node + 1, mid, node_hi, lo, length)
+        return found
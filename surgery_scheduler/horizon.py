@@ -0,0 +1,354 @@
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Max
+
+from .compact_schedule import CompactSchedule, CompactSurgery, Field, minutes_to_time
+from .models import OptimizedSchedule, ScheduleUpload
+from .persistence import SchedulePersistence, commit_version, optimization_notes, write_atomic
+from .schedule_optimizer import OptimizationConfig, ScheduleOptimizer
+from .schedule_summary import build_summary
+
+# 移到下一天的手術只保留這些欄位，其餘（時長、狀態等）在新的一天重新分析
+ROLL_KEYS = ('patient', 'doctor', 'surgery_type', 'urgency_level')
+# 移入的手術排在當天原有手術之後（不會成為錨點）
+ROLLED_SORT_OFFSET = 1_000_000
+# 多日排程版本在 optimized_data 內保存當天輸入的鍵（載入時還原 HorizonScheduler）
+STATE_KEY = 'horizon'
+# 版本的 optimized_data 中屬於 DayPlan.to_dict 而非排程 meta 的鍵
+PLAN_KEYS = ('date', 'optimized_data', 'overflow_count', STATE_KEY)
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _slot(day: date, minutes: int) -> str:
+    """日期 + 分鐘數 → 'YYYY-MM-DDTHH:MM'（超過午夜時進到下一天）"""
+    return f"{(day + timedelta(days=minutes // 1440)).isoformat()}T{minutes_to_time(minutes)}"
+
+
+def emergency_state(parent_data: Dict[str, Any], emergency: Dict) -> Dict[str, Any]:
+    """
+    在多日排程版本上插入緊急手術時，子版本 meta 要帶的多日狀態（當天的 emergencies 加上這筆）
+    
+    load() 因此會以含緊急手術的子版本還原該天，重算時依序重新插入；父版本不是多日排程時回傳空 dict。
+    """
+    state = parent_data.get(STATE_KEY)
+    if state is None:
+        return {}
+    return {STATE_KEY: dict(state, emergencies=state['emergencies'] + [dict(emergency)])}
+
+
+class DayCalendar:
+    """
+    單日手術房行事曆
+    
+    - is_open：整天是否開放（例如週末、國定假日為 False）
+    - close：收班時間（距午夜分鐘數），room_close 可個別指定房間
+    - closed_rooms：當天不開放的房間（該房手術移到下一個開放日）
+    """
+    
+    __slots__ = ('day', 'is_open', 'close', 'room_close', 'closed_rooms')
+    
+    def __init__(self, day: date, is_open: bool = True, close: int = None,
+                 room_close: Dict[str, int] = None, closed_rooms: Iterable[str] = ()):
+        self.day = day
+        self.is_open = is_open
+        self.close = OptimizationConfig.DAY_END_MINUTES if close is None else close
+        self.room_close = {str(k): v for k, v in (room_close or {}).items()}
+        self.closed_rooms = frozenset(str(r) for r in closed_rooms)
+    
+    def room_open(self, room) -> bool:
+        return self.is_open and str(room) not in self.closed_rooms
+    
+    def close_time(self, room) -> int:
+        return self.room_close.get(str(room), self.close)
+    
+    def key(self):
+        return (self.day, self.is_open, self.close, tuple(sorted(self.room_close.items())), self.closed_rooms)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'is_open': self.is_open, 'close': self.close, 'room_close': self.room_close,
+                'closed_rooms': sorted(self.closed_rooms)}
+    
+    @classmethod
+    def from_dict(cls, day: date, data: Dict[str, Any]) -> 'DayCalendar':
+        return cls(day, **data)
+
+
+class DayPlan:
+    """某一天的排程結果（連同輸入，用來判斷下次是否需要重算）"""
+    
+    __slots__ = ('day', 'carry_in', 'calendar_key', 'optimized_data', 'overflow', 'meta')
+    
+    def __init__(self, day, carry_in, calendar_key, optimized_data, overflow, meta):
+        self.day = day
+        self.carry_in = carry_in
+        self.calendar_key = calendar_key
+        self.optimized_data = optimized_data
+        self.overflow = overflow
+        self.meta = meta
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.meta, date=self.day.isoformat(), optimized_data=self.optimized_data,
+                    overflow_count=len(self.overflow))
+
+
+class HorizonScheduler:
+    """
+    多日滾動排程（rolling horizon）
+    
+    - 每筆手術以 'date'（YYYY-MM-DD）指定日期，沒有日期的排在第一天
+    - 每天用 ScheduleOptimizer 的單日引擎排程；超過該房收班時間的手術（錨點與緊急手術除外）
+      以 TF 接台移到下一個開放日，排程結果帶有日期（'date'、'slot' = 'YYYY-MM-DDTHH:MM'）
+    - 每天的結果與其輸入（當天的手術、行事曆、前一天移入的手術）一起保存；
+      修改某一天只會重算該天，之後的天數只有在移入的手術改變時才重算
+    - advance() 把視窗往後移，已過去的天數移入的手術保留給新的第一天
+    - persist() 把重算的天數各存成一個 OptimizedSchedule（schedule_date 為該天，連同當天的輸入），
+      load() 以各天最新的版本還原，下一次請求只重算有變動的天數
+    - 緊急手術由 EmergencySurgeryView 插入院區目前版本；目前版本是多日排程的某一天時，
+      子版本帶著加上該筆緊急手術的狀態（emergency_state），load() 還原後重算該天時依序重新插入
+    """
+    
+    def __init__(self, start, days: int = None, optimizer: ScheduleOptimizer = None,
+                 workdays: Iterable[int] = None):
+        self.start = _as_date(start)
+        self.days = OptimizationConfig.HORIZON_DAYS if days is None else days
+        self.optimizer = optimizer or ScheduleOptimizer()
+        self.workdays = frozenset(OptimizationConfig.WORKDAYS if workdays is None else workdays)
+        self._cases: Dict[date, List[Dict]] = {}
+        self._emergencies: Dict[date, List[Dict]] = {}
+        self._calendars: Dict[date, DayCalendar] = {}
+        self._plans: Dict[date, DayPlan] = {}
+        self._dirty = set()
+        self._carry_in: List[Dict] = []
+    
+    @property
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=i) for i in range(self.days)]
+    
+    def calendar(self, day) -> DayCalendar:
+        day = _as_date(day)
+        calendar = self._calendars.get(day)
+        if calendar is None:
+            calendar = DayCalendar(day, is_open=day.weekday() in self.workdays)
+        return calendar
+    
+    def set_calendar(self, calendar: DayCalendar):
+        self._calendars[calendar.day] = calendar
+        self._dirty.add(calendar.day)
+    
+    def add_cases(self, cases: Iterable[Dict]) -> List[date]:
+        """加入手術（依 'date' 分到各天），回傳受影響的日期"""
+        touched = set()
+        for case in cases:
+            day = _as_date(case['date']) if case.get('date') else self.start
+            self._cases.setdefault(day, []).append(dict(case, date=day.isoformat()))
+            touched.add(day)
+        self._dirty |= touched
+        return sorted(touched)
+    
+    def replace_day(self, day, cases: Iterable[Dict]):
+        """以新的手術列表取代某一天的原有手術"""
+        day = _as_date(day)
+        self._cases[day] = []
+        self._dirty.add(day)
+        self.add_cases(dict(case, date=day.isoformat()) for case in cases)
+    
+    def advance(self, days: int = 1):
+        """視窗往後移 days 天；移出視窗的天數不再排程，其移出的手術交給新的第一天"""
+        self.optimize()
+        new_start = self.start + timedelta(days=days)
+        carry = self._carry_in
+        for day in [d for d in self._plans if d < new_start]:
+            if day + timedelta(days=1) == new_start:
+                carry = self._plans[day].overflow
+        for store in (self._cases, self._emergencies, self._calendars, self._plans):
+            for day in [d for d in store if d < new_start]:
+                del store[day]
+        self._dirty = {d for d in self._dirty if d >= new_start}
+        self._carry_in = carry
+        self.start = new_start
+    
+    def optimize(self) -> Dict[str, Any]:
+        """
+        依序排程視窗內每一天，只重算輸入有變動的天數
+        
+        回傳 {'days': [...每天的結果], 'recomputed': [重算的日期], 'overflow': [超出視窗仍排不下的手術]}
+        """
+        carry = self._carry_in
+        recomputed = []
+        days = []
+        for day in self.dates:
+            calendar = self.calendar(day)
+            plan = self._plans.get(day)
+            if (plan is None or day in self._dirty or plan.carry_in != carry
+                    or plan.calendar_key != calendar.key()):
+                plan = self._solve_day(day, calendar, carry)
+                self._plans[day] = plan
+                recomputed.append(day.isoformat())
+            self._dirty.discard(day)
+            days.append(plan.to_dict())
+            carry = plan.overflow
+        
+        return {
+            'start': self.start.isoformat(),
+            'days': days,
+            'recomputed': recomputed,
+            'overflow': carry,
+        }
+    
+    def plan(self, day) -> Optional[DayPlan]:
+        return self._plans.get(_as_date(day))
+    
+    @classmethod
+    def load(cls, hospital_id, start, days: int = None, optimizer: ScheduleOptimizer = None,
+             workdays: Iterable[int] = None) -> 'HorizonScheduler':
+        """
+        以資料庫內各天最新的多日排程版本還原視窗（前一天移出的手術作為第一天的移入）
+        
+        各天最新的版本可能是插入緊急手術的子版本（只存差異），排程沿 parent 鏈還原。
+        還原的天數在輸入沒有變動時，optimize() 不會重算。
+        """
+        scheduler = cls(start, days, optimizer, workdays)
+        previous = scheduler.start - timedelta(days=1)
+        latest = OptimizedSchedule.objects.filter(
+            hospital_id=hospital_id, schedule_date__range=(previous, scheduler.dates[-1]),
+            optimized_data__has_key=STATE_KEY,
+        ).values('schedule_date').annotate(latest=Max('id')).values('latest')
+        versions = OptimizedSchedule.objects.filter(id__in=latest)
+        
+        carry_in = None
+        for version in versions:
+            day = version.schedule_date
+            state = version.optimized_data[STATE_KEY]
+            if day == previous:
+                carry_in = state['overflow']
+                continue
+            data = version.get_optimized_data()
+            calendar = DayCalendar.from_dict(day, state['calendar'])
+            scheduler._calendars[day] = calendar
+            scheduler._cases[day] = state['cases']
+            if state['emergencies']:
+                scheduler._emergencies[day] = state['emergencies']
+            meta = {k: v for k, v in data.items() if k not in PLAN_KEYS}
+            scheduler._plans[day] = DayPlan(day, state['carry_in'], calendar.key(), data['optimized_data'],
+                                            state['overflow'], meta)
+        
+        if carry_in is None and scheduler.start in scheduler._plans:
+            carry_in = scheduler._plans[scheduler.start].carry_in
+        scheduler._carry_in = carry_in or []
+        return scheduler
+    
+    def persist(self, hospital_id, upload: ScheduleUpload, days: Iterable[str],
+                notes_builder: Callable[[CompactSchedule, CompactSurgery], str] = optimization_notes
+                ) -> List[OptimizedSchedule]:
+        """
+        把指定日期（通常是 optimize() 回傳的 recomputed）寫入資料庫，其他天不動
+        
+        每天只取代該日的手術，並建立 schedule_date 為該天的版本（含當天的輸入，供 load() 還原）；
+        全部天數在同一個 transaction 內寫入。院區目前版本的那一天被取代時，該天的新版本
+        以 commit_version 成為目前版本（資料表與版本鏈一致，緊急插入以它為父版本）；
+        期間目前版本被其他請求換掉時，整批 rollback 後依新的目前版本重寫。
+        """
+        plans = [self._plans[_as_date(iso)] for iso in days]
+        
+        def write():
+            versions = []
+            for plan in plans:
+                SchedulePersistence(hospital_id, plan.day).replace_schedule(
+                    CompactSchedule.from_dicts(plan.optimized_data), notes_builder
+                )
+                state = {
+                    'carry_in': plan.carry_in,
+                    'overflow': plan.overflow,
+                    'cases': self._cases.get(plan.day, []),
+                    'emergencies': self._emergencies.get(plan.day, []),
+                    'calendar': self.calendar(plan.day).to_dict(),
+                }
+                versions.append(OptimizedSchedule.objects.create(
+                    hospital_id=hospital_id,
+                    original_schedule=upload,
+                    optimized_data=dict(plan.to_dict(), **{STATE_KEY: state}),
+                    utilization_improvement=plan.meta.get('improvement', 0),
+                    schedule_date=plan.day,
+                    summary=build_summary(hospital_id, plan.day),
+                ))
+            return versions
+        
+        written = []
+        
+        def prepare(head):
+            def save():
+                written[:] = write()
+                # 沒有取代目前版本的那一天時以 head 本身提交（只確認期間沒有被換掉）
+                return next((v for v in written if v.schedule_date == head.schedule_date), head)
+            return save, None
+        
+        head, _ = commit_version(hospital_id, prepare)
+        if head is None:
+            # 院區還沒有任何版本：沒有需要保持一致的目前版本
+            written[:] = write_atomic(write)
+        return written
+    
+    def _solve_day(self, day: date, calendar: DayCalendar, carry: List[Dict]) -> DayPlan:
+        records = [dict(r) for r in carry] + [dict(r) for r in self._cases.get(day, ())]
+        overflow = []
+        if not calendar.is_open:
+            # 整天不開放：全部移到下一天
+            overflow = [self._roll(r, day) for r in records]
+            return DayPlan(day, carry, calendar.key(), [], overflow, {})
+        
+        today = []
+        for r in records:
+            (today if calendar.room_open(r['room']) else overflow).append(r)
+        overflow = [self._roll(r, day) for r in overflow]
+        if not today:
+            return DayPlan(day, carry, calendar.key(), [], overflow, {})
+        
+        schedule, ordered, meta = self.optimizer.optimize_compact(today)
+        kept, late = self._split_by_close(schedule, ordered, calendar)
+        overflow += [self._roll(schedule.to_dict(s), day) for s in late]
+        
+        emergencies = []
+        for emergency in self._emergencies.get(day, ()):
+            schedule, info = self.optimizer.emergency_inserter.insert_emergency_compact(
+                schedule.to_dicts(kept), dict(emergency, date=day.isoformat()))
+            kept, late = self._split_by_close(schedule, list(schedule), calendar)
+            overflow += [self._roll(schedule.to_dict(s), day) for s in late]
+            emergencies.append(info)
+        if emergencies:
+            meta = dict(meta, emergency_insertions=emergencies)
+        
+        items = []
+        for s in kept:
+            item = schedule.to_dict(s)
+            item['date'] = day.isoformat()
+            item['slot'] = _slot(day, s.start)
+            items.append(item)
+        return DayPlan(day, carry, calendar.key(), items, overflow, meta)
+    
+    def _split_by_close(self, schedule: CompactSchedule, surgeries: List[CompactSurgery],
+                        calendar: DayCalendar) -> Tuple[List[CompactSurgery], List[CompactSurgery]]:
+        """依收班時間分成 (當天完成, 移到下一天)；錨點與緊急手術一律留在當天"""
+        kept, late = [], []
+        for s in surgeries:
+            end = s.start + (s.duration if s.has(Field.DURATION) else 90)
+            fixed = s.flag(Field.IS_FIRST_SURGERY) or s.flag(Field.IS_EMERGENCY)
+            if not fixed and end > calendar.close_time(schedule.rooms[s.room]):
+                late.append(s)
+            else:
+                kept.append(s)
+        return kept, late
+    
+    def _roll(self, item: Dict, day: date) -> Dict:
+        """轉成下一天的 TF 接台手術（保留原房與原定日期，時長等重新分析）"""
+        room = item.get('original_room', item['room'])
+        rolled = {key: item[key] for key in ROLL_KEYS if key in item}
+        rolled.update({
+            'room': room, 'original_room': room, 'time': 'TF', 'original_time': 'TF',
+            'sort_key': ROLLED_SORT_OFFSET + item.get('sort_key', 0) % ROLLED_SORT_OFFSET,
+            'rolled_from': item.get('rolled_from', day.isoformat()),
+        })
+        return rolled
@@ -0,0 +1,124 @@
+import threading
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick 多關鍵字比對器（不分大小寫）
+    
+    建好後唯讀，可跨執行緒共用；掃描一次字串即可找出所有關鍵字的出現位置，
+    成本與字串長度成正比，與關鍵字數量無關。
+    """
+    
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(dict.fromkeys(k.upper() for k in keywords))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for index, keyword in enumerate(self.keywords):
+            self._add(keyword, index)
+        self._build_failure_links()
+    
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """yield (起始位置, 關鍵字索引)；位置以轉成大寫後的字串計算"""
+        goto, fail, out, keywords = self._goto, self._fail, self._out, self.keywords
+        state = 0
+        for pos, ch in enumerate(text.upper()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield pos - len(keywords[index]) + 1, index
+    
+    def _add(self, keyword: str, index: int):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (index,)
+    
+    def _build_failure_links(self):
+        # 第一層狀態的 failure 固定指回根節點，從第二層開始以 BFS 計算
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # 後綴狀態的關鍵字也在此結束
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+
+class KeywordClassifier:
+    """
+    多組關鍵字表共用一個比對器：掃描一次，分別回傳每組表的最佳命中
+    
+    最佳命中的決定規則（與字典順序無關）：
+    1. 關鍵字最長者優先（較具體的術式名稱勝出）
+    2. 長度相同時，在字串中出現位置較前者優先
+    """
+    
+    def __init__(self, vocabularies: Mapping[str, Mapping[str, str]], cache_size: int = 4096):
+        self.namespaces = tuple(vocabularies)
+        self.matcher = KeywordMatcher(k for vocabulary in vocabularies.values() for k in vocabulary)
+        index_of = {k: i for i, k in enumerate(self.matcher.keywords)}
+        # 關鍵字索引 → [(命名空間, 對應值), ...]
+        self._targets: List[List[Tuple[str, str]]] = [[] for _ in self.matcher.keywords]
+        for namespace, vocabulary in vocabularies.items():
+            for keyword, value in vocabulary.items():
+                self._targets[index_of[keyword.upper()]].append((namespace, value))
+        # 同一天的排程大量重複相同的術式字串
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+    
+    def classify_many(self, texts: Iterable[str]) -> List[Mapping[str, Optional[str]]]:
+        """整批分類（例如一整天上傳的排程），重複的字串只比對一次"""
+        return [self.classify(text) for text in texts]
+    
+    def _classify(self, text: str) -> Mapping[str, Optional[str]]:
+        keywords = self.matcher.keywords
+        best = {}
+        for start, index in self.matcher.iter_matches(text):
+            rank = (-len(keywords[index]), start)
+            for namespace, value in self._targets[index]:
+                current = best.get(namespace)
+                if current is None or rank < current[0]:
+                    best[namespace] = (rank, value)
+        return MappingProxyType({ns: best[ns][1] if ns in best else None for ns in self.namespaces})
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_surgery_classifier() -> KeywordClassifier:
+    """
+    取得程序層級共用的術式分類器
+    
+    由知識庫（SurgeryAnalyzer）、ML 術式對照表與小型手術關鍵字一次建成：
+    'knowledge' → 知識庫關鍵字、'ml' → ML 術式類別、'small' → 小型手術關鍵字
+    """
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                from .llm_analyzer import SMALL_SURGERY_KEYWORDS
+                from .ml_analyzer import ML_SURGERY_KEYWORDS
+                from .schedule_optimizer import SURGERY_KNOWLEDGE
+                _classifier = KeywordClassifier({
+                    'knowledge': {k: k for k in SURGERY_KNOWLEDGE},
+                    'ml': ML_SURGERY_KEYWORDS,
+                    'small': {k: k for k in SMALL_SURGERY_KEYWORDS},
+                })
+    return _classifier
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+# 每個連線最多暫存的事件數；顯示端跟不上時改送一次完整快照
+QUEUE_SIZE = 32
+# 沒有事件時多久送一次 keepalive，並順便檢查其他程序是否已提交新版本
+KEEPALIVE_SECONDS = 15
+# 單一連線的最長時間（到期後由瀏覽器的 EventSource 自動重新連線）
+STREAM_MAX_SECONDS = 10 * 60
+# 瀏覽器重新連線前等待的毫秒數
+RETRY_MILLISECONDS = 1000
+
+# 佇列溢位時放入的標記：顯示端需要以目前版本重新同步
+RESYNC = object()
+
+
+class Subscription:
+    """單一顯示端的訂閱：事件佇列綁定在連線所在的 event loop 上"""
+    
+    __slots__ = ('hospital_id', 'room', 'loop', 'queue')
+    
+    def __init__(self, hospital_id, room: Optional[str], loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.hospital_id = hospital_id
+        self.room = room
+        self.loop = loop
+        self.queue = queue
+
+
+class ScheduleBroadcaster:
+    """
+    程序內的排程推播（不需要外部 broker）
+    
+    每個 SSE 連線訂閱一個院區（可限定單一手術房），閒置時只佔一個 asyncio.Queue。
+    publish() 可在任何執行緒呼叫（寫入排程的同步 view），事件透過
+    call_soon_threadsafe 交給各連線的 event loop。
+    只通知同一程序內的連線；其他程序的連線由 keepalive 時檢查目前版本補上。
+    """
+    
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Any, set] = {}
+        self._metrics = {'published': 0, 'delivered': 0, 'resyncs': 0}
+    
+    def subscribe(self, hospital_id, room: Optional[str] = None) -> Subscription:
+        """在目前的 event loop 上建立訂閱"""
+        subscription = Subscription(hospital_id, room, asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(hospital_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.hospital_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.hospital_id]
+    
+    def has_subscribers(self, hospital_id) -> bool:
+        with self._lock:
+            return bool(self._subscribers.get(hospital_id))
+    
+    def publish(self, hospital_id, event: Dict[str, Any]):
+        """把事件送給院區的所有訂閱（限定手術房的訂閱只收到該房的變動）"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(hospital_id, ()))
+            self._metrics['published'] += 1
+        
+        for subscription in subscribers:
+            payload = event if subscription.room is None else _filter_room(event, subscription.room)
+            if payload is None:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(self._offer, subscription, payload)
+            except RuntimeError:
+                # event loop 已關閉（伺服器重啟中），連線不會再讀取
+                self.unsubscribe(subscription)
+    
+    def _offer(self, subscription: Subscription, payload):
+        """在連線的 event loop 上執行：放入事件，佇列滿時清空並要求重新同步"""
+        queue = subscription.queue
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            payload = RESYNC
+        queue.put_nowait(payload)
+        with self._lock:
+            self._metrics['delivered' if payload is not RESYNC else 'resyncs'] += 1
+    
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['subscribers'] = sum(len(s) for s in self._subscribers.values())
+        return metrics
+
+
+def _filter_room(event: Dict[str, Any], room: str) -> Optional[Dict[str, Any]]:
+    rooms = [r for r in event.get('rooms', ()) if r['room'] == room]
+    removed = [r for r in event.get('removed', ()) if r == room]
+    if not rooms and not removed and event['type'] != 'snapshot':
+        return None
+    return dict(event, rooms=rooms, removed=removed)
+
+
+def room_changes(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[List[Dict], List[str]]:
+    """比較兩個版本的摘要，回傳 (有變動的房間摘要, 已不存在的房號)"""
+    before = {room['room']: room for room in previous['rooms']}
+    after = {room['room']: room for room in current['rooms']}
+    changed = [room for number, room in after.items() if before.get(number) != room]
+    removed = [number for number in before if number not in after]
+    return changed, removed
+
+
+def schedule_event(version, previous_summary: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    新版本的推播事件
+    
+    有父版本摘要時只帶有變動的手術房（'rooms'），否則送完整快照（'snapshot'）。
+    """
+    summary = version.summary
+    if previous_summary is None or previous_summary.get('version') != summary.get('version'):
+        return {'type': 'snapshot', 'optimized_id': version.id, 'rooms': summary['rooms'], 'removed': []}
+    changed, removed = room_changes(previous_summary, summary)
+    return {
+        'type': 'rooms',
+        'optimized_id': version.id,
+        'parent_id': version.parent_id,
+        'rooms': changed,
+        'removed': removed,
+    }
+
+
+def publish_on_commit(hospital_id, version, previous_summary: Dict[str, Any] = None):
+    """transaction 提交後推播新版本（rollback 或版本衝突重試時不會送出）"""
+    broadcaster = get_broadcaster()
+    if not broadcaster.has_subscribers(hospital_id):
+        return
+    event = schedule_event(version, previous_summary)
+    transaction.on_commit(lambda: broadcaster.publish(hospital_id, event))
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """事件 → SSE 文字（id 為版本 id，重新連線時瀏覽器以 Last-Event-ID 帶回）"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['optimized_id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+# 🔒 程序內共用的推播器（延遲建立）
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster() -> ScheduleBroadcaster:
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                _broadcaster = ScheduleBroadcaster()
+    return _broadcaster
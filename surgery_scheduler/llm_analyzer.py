@@ -1,15 +1,24 @@
+from .keyword_matcher import get_surgery_classifier
+
+# 小型術式關鍵字（比對時不分大小寫）
+SMALL_SURGERY_KEYWORDS = ["PORT-A", "REMOVAL", "TRIGGER", " biopsy", "清創"]
+
+
 class SurgeryLLMAnalyzer:
     def analyze_size(self, surgery_type):
-        stype = surgery_type.upper()
         # 模擬 AI 判斷：小型術式回傳 Small (120min)，其餘 Large
-        small_keywords = ["PORT-A", "REMOVAL", "TRIGGER", " biopsy", "清創"]
-        if any(k in stype for k in small_keywords):
-            return "Small", 120
-        return "Large", 180
+        return self._size_of(get_surgery_classifier().classify(surgery_type))
 
     def batch_analyze(self, data):
-        for item in data:
-            size, duration = self.analyze_size(item.get('surgery_type', ''))
+        # 整批分類，重複的術式字串只比對一次
+        matches = get_surgery_classifier().classify_many(item.get('surgery_type', '') for item in data)
+        for item, match in zip(data, matches):
+            size, duration = self._size_of(match)
             item['ai_size'] = size
             item['estimated_duration'] = duration
         return data
+
+    def _size_of(self, match):
+        if match['small']:
+            return "Small", 120
+        return "Large", 180
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0004_rename_uploaded_at_scheduleupload_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='delta_depth',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='surgery_scheduler.optimizedschedule'),
+        ),
+        migrations.AddField(
+            model_name='surgery',
+            name='position',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+    ]
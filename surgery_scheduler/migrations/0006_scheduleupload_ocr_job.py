@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+def mark_existing_processed(apps, schema_editor):
+    # 既有的上傳都是同步解析完成的，不需要再排入背景佇列
+    ScheduleUpload = apps.get_model('surgery_scheduler', 'ScheduleUpload')
+    ScheduleUpload.objects.update(processed=True, status='done', progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0005_optimizedschedule_delta_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleupload',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='scheduleupload',
+            name='processed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='scheduleupload',
+            name='progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduleupload',
+            name='status',
+            field=models.CharField(choices=[('pending', '等待解析'), ('processing', '解析中'), ('done', '解析完成'), ('failed', '解析失敗')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_processed, migrations.RunPython.noop),
+    ]
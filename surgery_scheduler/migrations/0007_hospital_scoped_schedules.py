@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_hospital(apps, schema_editor):
+    # 既有資料：手術依手術房、優化結果依上傳檔所屬的院區補上
+    Surgery = apps.get_model('surgery_scheduler', 'Surgery')
+    OperatingRoom = apps.get_model('surgery_scheduler', 'OperatingRoom')
+    OptimizedSchedule = apps.get_model('surgery_scheduler', 'OptimizedSchedule')
+    ScheduleUpload = apps.get_model('surgery_scheduler', 'ScheduleUpload')
+    Surgery.objects.update(hospital_id=Subquery(
+        OperatingRoom.objects.filter(id=OuterRef('operating_room_id')).values('hospital_id')[:1]
+    ))
+    OptimizedSchedule.objects.update(hospital_id=Subquery(
+        ScheduleUpload.objects.filter(id=OuterRef('original_schedule_id')).values('hospital_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0006_scheduleupload_ocr_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='surgery',
+            name='hospital',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='surgery_scheduler.hospital'),
+        ),
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='hospital',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='surgery_scheduler.hospital'),
+        ),
+        migrations.RunPython(fill_hospital, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='surgery',
+            name='hospital',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surgery_scheduler.hospital'),
+        ),
+        migrations.AlterField(
+            model_name='optimizedschedule',
+            name='hospital',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surgery_scheduler.hospital'),
+        ),
+        migrations.AddIndex(
+            model_name='surgery',
+            index=models.Index(fields=['hospital', 'scheduled_start'], name='surgery_hospital_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='optimizedschedule',
+            index=models.Index(fields=['hospital', 'created_at'], name='optimized_hospital_created_idx'),
+        ),
+    ]
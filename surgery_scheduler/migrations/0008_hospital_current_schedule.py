@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:37
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_current_schedule(apps, schema_editor):
+    # 既有資料：以各院區最新建立的優化結果作為目前版本
+    Hospital = apps.get_model('surgery_scheduler', 'Hospital')
+    OptimizedSchedule = apps.get_model('surgery_scheduler', 'OptimizedSchedule')
+    Hospital.objects.update(current_schedule_id=Subquery(
+        OptimizedSchedule.objects.filter(hospital_id=OuterRef('id')).order_by('-created_at', '-id').values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0007_hospital_scoped_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='current_schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='surgery_scheduler.optimizedschedule'),
+        ),
+        migrations.RunPython(fill_current_schedule, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0008_hospital_current_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['hospital', 'name'], name='doctor_hospital_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='operatingroom',
+            index=models.Index(fields=['hospital', 'number'], name='room_hospital_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surgery',
+            index=models.Index(fields=['operating_room', 'scheduled_start'], name='surgery_room_start_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0009_room_doctor_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
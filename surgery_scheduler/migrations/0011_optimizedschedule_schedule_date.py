@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+def fill_schedule_date(apps, schema_editor):
+    # 既有資料：優化結果寫入的是建立當天的手術；緊急插入的子版本沿用父版本的日期
+    OptimizedSchedule = apps.get_model('surgery_scheduler', 'OptimizedSchedule')
+    dates = {}
+    for version in OptimizedSchedule.objects.order_by('id').only('id', 'parent_id', 'created_at'):
+        dates[version.id] = dates.get(version.parent_id) or version.created_at.date()
+        version.schedule_date = dates[version.id]
+        version.save(update_fields=['schedule_date'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0010_optimizedschedule_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optimizedschedule',
+            name='schedule_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='optimizedschedule',
+            index=models.Index(fields=['hospital', 'schedule_date'], name='optimized_hospital_date_idx'),
+        ),
+        migrations.RunPython(fill_schedule_date, migrations.RunPython.noop),
+    ]
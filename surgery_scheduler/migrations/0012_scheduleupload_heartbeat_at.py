@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surgery_scheduler', '0011_optimizedschedule_schedule_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleupload',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,28 @@
-import pickle
-import os
-from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from .keyword_matcher import get_surgery_classifier
+from .model_registry import get_model_registry
+from .prediction_cache import get_prediction_cache
+
+# 模型訓練時使用的特徵欄位（順序不可更動）
+FEATURE_COLUMNS = ['surgery_encoded', 'doctor_encoded', 'time_hour', 'room', 'day_of_week']
+
+# 術式文字中的關鍵字 → 模型訓練時的術式類別
+ML_SURGERY_KEYWORDS = {
+    'DISKECTOMY': 'DISKECTOMY', 'FUSION': 'SPINAL FUSION',
+    'CRANIOTOMY': 'CRANIOTOMY', 'SHUNT': 'V-P SHUNT',
+    'LAMINECTOMY': 'LAMINECTOMY', 'TRIGGER': 'TRIGGER RELEASE',
+    'CARPAL': 'CARPAL TUNNEL', 'PORT': 'REMOVE PORT-A',
+}
+
 class MLSurgeryAnalyzer:
     def __init__(self):
-        self.model_dir = Path(__file__).parent.parent / 'ml_models'
+        # 模型由程序層級的 registry 共用，不再每次請求重新 unpickle
+        self.registry = get_model_registry()
+        self.model_dir = self.registry.model_dir
+        # 相同特徵組合的預測結果跨請求共用（模型版本改變時自動作廢）
+        self.prediction_cache = get_prediction_cache()
         self.models_loaded = False
         try:
             self._load_models()
@@ -14,58 +31,99 @@ class MLSurgeryAnalyzer:
             print(f"⚠️ ML 模型載入失敗: {e}")
     
     def _load_models(self):
-        self.duration_model = pickle.load(open(self.model_dir / 'duration_model.pkl', 'rb'))
-        self.priority_model = pickle.load(open(self.model_dir / 'priority_model.pkl', 'rb'))
-        self.surgery_encoder = pickle.load(open(self.model_dir / 'surgery_encoder.pkl', 'rb'))
-        self.doctor_encoder = pickle.load(open(self.model_dir / 'doctor_encoder.pkl', 'rb'))
+        bundle = self.registry.get()
+        self.duration_model = bundle.duration_model
+        self.priority_model = bundle.priority_model
+        self.surgery_encoder = bundle.surgery_encoder
+        self.doctor_encoder = bundle.doctor_encoder
+        self.doctor_index = bundle.doctor_index
+        self.model_version = bundle.version
     
     def analyze_surgery(self, surgery_data):
         if not self.models_loaded:
             return None
         try:
-            surgery_keyword = self._extract_surgery_keyword(surgery_data['surgery_type'])
-            doctor = surgery_data.get('doctor', '未知醫師')
-            time_str = surgery_data.get('time', '8:00')
-            room = surgery_data.get('room', 12)
-            
-            surgery_enc = self.surgery_encoder.transform([surgery_keyword])[0]
-            doctor_enc = self.doctor_encoder.transform([doctor])[0] if doctor in self.doctor_encoder.classes_ else 0
-            time_hour = int(time_str.split(':')[0])
-            
-            # 使用 DataFrame 避免警告
-            features_df = pd.DataFrame([[surgery_enc, doctor_enc, time_hour, room, 1]], 
-                                      columns=['surgery_encoded', 'doctor_encoded', 'time_hour', 'room', 'day_of_week'])
-            
-            pred_duration = self.duration_model.predict(features_df)[0]
-            pred_priority = self.priority_model.predict(features_df)[0]
-            
-            return {
-                'estimated_duration': int(pred_duration),
-                'priority': int(pred_priority),
-                'can_be_delayed': pred_priority >= 4,
-                'can_insert_before': pred_priority >= 4,
-                'urgency': 'urgent' if pred_priority <= 2 else 'routine',
-                'category': self._get_category(pred_duration),
-                'method': 'machine_learning',
-                'confidence': 0.92,
-                'reason': f'ML 預測（基於 1500 筆訓練資料）'
-            }
+            features = self._features(surgery_data)
+            prediction = self.prediction_cache.get_many(self.model_version, [features])[0]
+            if prediction is None:
+                prediction = self._predict([features])[0]
+                self.prediction_cache.put_many(self.model_version, [(features, prediction)])
+            return self._build_result(*prediction)
         except Exception as e:
             print(f"[ML ERROR] {e}")
             return None
     
-    def _extract_surgery_keyword(self, full_text):
-        keywords = {
-            'DISKECTOMY': 'DISKECTOMY', 'FUSION': 'SPINAL FUSION',
-            'CRANIOTOMY': 'CRANIOTOMY', 'SHUNT': 'V-P SHUNT',
-            'LAMINECTOMY': 'LAMINECTOMY', 'TRIGGER': 'TRIGGER RELEASE',
-            'CARPAL': 'CARPAL TUNNEL', 'PORT': 'REMOVE PORT-A',
+    def analyze_batch(self, surgeries):
+        """
+        批次分析整天的手術：相同特徵組合只推論一次，已快取的組合不再推論
+        
+        回傳與 surgeries 等長的列表，無法分析的項目為 None（與 analyze_surgery 相同）
+        """
+        results = [None] * len(surgeries)
+        if not self.models_loaded or not surgeries:
+            return results
+        
+        # 1. 逐筆取出正規化特徵，格式錯誤的項目維持 None
+        rows = []
+        for i, surgery_data in enumerate(surgeries):
+            try:
+                rows.append((i, self._features(surgery_data)))
+            except Exception as e:
+                print(f"[ML ERROR] {e}")
+        
+        if not rows:
+            return results
+        
+        # 2. 先查快取，只對未命中的不重複組合推論（每個模型只執行一次）
+        unique = list(dict.fromkeys(features for _, features in rows))
+        predictions = dict(zip(unique, self.prediction_cache.get_many(self.model_version, unique)))
+        missing = [features for features in unique if predictions[features] is None]
+        if missing:
+            try:
+                predicted = self._predict(missing)
+            except Exception as e:
+                print(f"[ML ERROR] 批次分析失敗，改為逐筆分析: {e}")
+                return [self.analyze_surgery(s) for s in surgeries]
+            predictions.update(zip(missing, predicted))
+            self.prediction_cache.put_many(self.model_version, zip(missing, predicted))
+        
+        for i, features in rows:
+            results[i] = self._build_result(*predictions[features])
+        return results
+    
+    def _features(self, surgery_data):
+        """正規化特徵 tuple（順序同 FEATURE_COLUMNS，術式以關鍵字表示），同時作為快取 key"""
+        keyword = self._extract_surgery_keyword(surgery_data['surgery_type'])
+        doctor = surgery_data.get('doctor', '未知醫師')
+        time_hour = int(surgery_data.get('time', '8:00').split(':')[0])
+        room = float(surgery_data.get('room', 12))
+        return (keyword, self.doctor_index.get(doctor, 0), time_hour, room, 1)
+    
+    def _predict(self, feature_rows):
+        """一次推論多組特徵，回傳 [(預測時長, 預測優先級), ...]"""
+        features = np.empty((len(feature_rows), len(FEATURE_COLUMNS)), dtype=np.float64)
+        features[:, 0] = self.surgery_encoder.transform([row[0] for row in feature_rows])
+        features[:, 1:] = [row[1:] for row in feature_rows]
+        # 使用 DataFrame 避免警告
+        features_df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        return list(zip(self.duration_model.predict(features_df), self.priority_model.predict(features_df)))
+    
+    def _build_result(self, pred_duration, pred_priority):
+        return {
+            'estimated_duration': int(pred_duration),
+            'priority': int(pred_priority),
+            'can_be_delayed': pred_priority >= 4,
+            'can_insert_before': pred_priority >= 4,
+            'urgency': 'urgent' if pred_priority <= 2 else 'routine',
+            'category': self._get_category(pred_duration),
+            'method': 'machine_learning',
+            'confidence': 0.92,
+            'reason': f'ML 預測（基於 1500 筆訓練資料）'
         }
-        full_text_upper = full_text.upper()
-        for keyword, full_name in keywords.items():
-            if keyword in full_text_upper:
-                return full_name
-        return 'DISKECTOMY'
+    
+    def _extract_surgery_keyword(self, full_text):
+        # 共用的預先編譯比對器（最長關鍵字優先），找不到時視為 DISKECTOMY
+        return get_surgery_classifier().classify(full_text)['ml'] or 'DISKECTOMY'
     
     def _get_category(self, duration):
         if duration >= 180:
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+# 模型屬性名稱 → ml_models/ 內的檔案
+MODEL_FILES = {
+    'duration_model': 'duration_model.pkl',
+    'priority_model': 'priority_model.pkl',
+    'surgery_encoder': 'surgery_encoder.pkl',
+    'doctor_encoder': 'doctor_encoder.pkl',
+}
+
+DEFAULT_MODEL_DIR = Path(__file__).parent.parent / 'ml_models'
+
+
+class ModelBundle:
+    """一組已載入的模型（載入後唯讀，可跨執行緒共用）"""
+    
+    def __init__(self, models, version, content_hash):
+        self.duration_model = models['duration_model']
+        self.priority_model = models['priority_model']
+        self.surgery_encoder = models['surgery_encoder']
+        self.doctor_encoder = models['doctor_encoder']
+        # 醫師名稱 → 編碼 查表（取代逐筆 transform）
+        self.doctor_index = {name: i for i, name in enumerate(self.doctor_encoder.classes_)}
+        self.version = version
+        self.content_hash = content_hash
+
+
+class ModelRegistry:
+    """
+    程序層級的模型註冊表
+    
+    - 第一次 get() 才載入（lazy），之後同一個 worker 程序內共用
+    - 每次 get() 只檢查檔案 mtime/大小；有變動時再比對 SHA-256，內容不同才重新 unpickle
+    - 以 lock 保證多執行緒下只會載入一次
+    """
+    
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        self.model_dir = Path(model_dir)
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._signature = None
+        self._failed_signature = None
+        self._last_error = None
+        self._metrics = {
+            'loads': 0,
+            'reloads': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'hash_checks': 0,
+            'last_load_seconds': 0.0,
+            'total_load_seconds': 0.0,
+            'loaded_at': None,
+        }
+    
+    def get(self) -> ModelBundle:
+        """取得目前的模型組，必要時才（重新）載入；載入失敗會拋出例外"""
+        with self._lock:
+            signature = self._stat_signature()
+            
+            if self._bundle is not None and signature == self._signature:
+                self._metrics['cache_hits'] += 1
+                return self._bundle
+            
+            # 同一組壞檔不重複嘗試
+            if signature == self._failed_signature:
+                raise RuntimeError(self._last_error)
+            
+            content_hash = self._content_hash()
+            self._metrics['hash_checks'] += 1
+            if self._bundle is not None and content_hash == self._bundle.content_hash:
+                # 檔案被 touch 過但內容沒變
+                self._signature = signature
+                self._metrics['cache_hits'] += 1
+                return self._bundle
+            
+            self._metrics['cache_misses'] += 1
+            self._load(signature, content_hash)
+            return self._bundle
+    
+    def metrics(self):
+        """回傳載入時間與快取命中等統計"""
+        with self._lock:
+            data = dict(self._metrics)
+            data['version'] = self._bundle.version if self._bundle else None
+            data['model_dir'] = str(self.model_dir)
+            data['last_error'] = self._last_error
+            return data
+    
+    def _load(self, signature, content_hash):
+        started = time.perf_counter()
+        try:
+            models = {}
+            for attr, filename in MODEL_FILES.items():
+                with open(self.model_dir / filename, 'rb') as f:
+                    models[attr] = pickle.load(f)
+            version = self._bundle.version + 1 if self._bundle else 1
+            bundle = ModelBundle(models, version, content_hash)
+        except Exception as e:
+            self._failed_signature = signature
+            self._last_error = str(e)
+            raise
+        
+        elapsed = time.perf_counter() - started
+        if self._bundle is not None:
+            self._metrics['reloads'] += 1
+        self._bundle = bundle
+        self._signature = signature
+        self._failed_signature = None
+        self._last_error = None
+        self._metrics['loads'] += 1
+        self._metrics['last_load_seconds'] = round(elapsed, 4)
+        self._metrics['total_load_seconds'] = round(self._metrics['total_load_seconds'] + elapsed, 4)
+        self._metrics['loaded_at'] = time.time()
+        print(f"✓ ML 模型已載入 v{bundle.version}（{elapsed * 1000:.1f} ms）")
+    
+    def _stat_signature(self):
+        signature = []
+        for filename in MODEL_FILES.values():
+            st = os.stat(self.model_dir / filename)
+            signature.append((st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+    
+    def _content_hash(self):
+        digest = hashlib.sha256()
+        for filename in MODEL_FILES.values():
+            with open(self.model_dir / filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """取得程序層級共用的 ModelRegistry（第一次呼叫時建立）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -2,22 +2,58 @@ from django.db import models
 
 class Hospital(models.Model):
     name = models.CharField(max_length=100)
+    # 📌 目前生效的排程版本（緊急插入以 compare-and-swap 更新，見 persistence.commit_version）
+    current_schedule = models.ForeignKey(
+        'OptimizedSchedule', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
 
 class OperatingRoom(models.Model):
     number = models.CharField(max_length=10)
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    
+    class Meta:
+        indexes = [
+            # 寫入排程時依院區 + 房號批次查詢
+            models.Index(fields=['hospital', 'number'], name='room_hospital_number_idx'),
+        ]
 
 class Doctor(models.Model):
     name = models.CharField(max_length=50)
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    
+    class Meta:
+        indexes = [
+            # 寫入排程時依院區 + 姓名批次查詢
+            models.Index(fields=['hospital', 'name'], name='doctor_hospital_name_idx'),
+        ]
 
 class ScheduleUpload(models.Model):
+    # 📄 OCR 背景解析狀態
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '等待解析'),
+        (STATUS_PROCESSING, '解析中'),
+        (STATUS_DONE, '解析完成'),
+        (STATUS_FAILED, '解析失敗'),
+    ]
+    
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     uploaded_file = models.FileField(upload_to='schedules/')
     extracted_data = models.JSONField(default=list)
     created_at = models.DateTimeField(auto_now_add=True)
+    processed = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    progress = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    # 解析中的工作最後一次回報進度的時間（逾時未更新時重新排入佇列）
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
 
 class Surgery(models.Model):
+    # 🏥 所屬院區（各院區的排程互不影響，查詢與刪除都以院區為範圍）
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     operating_room = models.ForeignKey(OperatingRoom, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     patient_name = models.CharField(max_length=100)
@@ -30,9 +66,52 @@ class Surgery(models.Model):
     estimated_duration = models.IntegerField(default=90)
     notes = models.TextField(null=True)
     nurse_assigned = models.CharField(max_length=50, null=True)
+    # 在目前排程 optimized_data 列表中的位置（緊急插入時只更新有變動的列）
+    position = models.IntegerField(null=True, db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['hospital', 'scheduled_start'], name='surgery_hospital_start_idx'),
+            # 單一手術房依時間排序的查詢（各房統計、匯出）
+            models.Index(fields=['operating_room', 'scheduled_start'], name='surgery_room_start_idx'),
+        ]
 
 class OptimizedSchedule(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     original_schedule = models.ForeignKey(ScheduleUpload, on_delete=models.CASCADE)
     optimized_data = models.JSONField()
     utilization_improvement = models.FloatField(default=0.0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 🔗 版本鏈：緊急插入產生的子版本只存與父版本的差異
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
+    delta = models.JSONField(null=True, blank=True)
+    delta_depth = models.IntegerField(default=0)
+    # 📊 各房彙整（儲存時算好一次；版本內容不會再變，結果頁與 API 直接讀取）
+    summary = models.JSONField(null=True, blank=True)
+    # 📅 排程日期（資料表內只讀寫該日的手術；緊急插入的子版本沿用父版本的日期）
+    schedule_date = models.DateField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # 各院區「最新排程」查詢
+            models.Index(fields=['hospital', 'created_at'], name='optimized_hospital_created_idx'),
+            # 多日排程依日期載入各天最新的版本
+            models.Index(fields=['hospital', 'schedule_date'], name='optimized_hospital_date_idx'),
+        ]
+    
+    def get_optimized_data(self):
+        """完整的排程資料；差異版本會沿著 parent 鏈還原"""
+        cached = getattr(self, '_full_data', None)
+        if cached is None:
+            from .schedule_versions import apply_delta
+            chain = []
+            node = self
+            while node.delta is not None:
+                chain.append(node)
+                node = node.parent
+            schedule = node.optimized_data.get('optimized_data', [])
+            for version in reversed(chain):
+                schedule = apply_delta(schedule, version.delta)
+            cached = dict(self.optimized_data, optimized_data=schedule)
+            self._full_data = cached
+        return cached
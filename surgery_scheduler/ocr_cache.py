@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral
+
+# 解析規則有修改時調高版本，舊的整份文件快取就不會再被使用
+PARSER_VERSION = 1
+
+
+def file_hash(file_path) -> str:
+    """整個檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_hash(page) -> str:
+    """
+    單頁內容的 SHA-256（pdfplumber Page）
+    
+    涵蓋頁面範圍、內容串流與字型 / XObject 資源；同一頁即使位於不同的 PDF
+    （例如只修正了其中幾頁的新版本）也會得到相同的 hash。
+    """
+    page_obj = page.page_obj
+    digest = hashlib.sha256()
+    digest.update(repr([float(v) for v in page.bbox]).encode())
+    for stream in page_obj.contents:
+        digest.update(_stream_digest(stream))
+    resources = page_obj.resources or {}
+    for key in ('Font', 'XObject'):
+        digest.update(_canonical(resources.get(key), set()).encode())
+    return digest.hexdigest()
+
+
+def _stream_digest(stream) -> bytes:
+    stream = _resolve(stream)
+    if not isinstance(stream, PDFStream):
+        return b''
+    return hashlib.sha256(stream.get_data()).digest()
+
+
+def _resolve(obj):
+    while isinstance(obj, PDFObjRef):
+        obj = obj.resolve()
+    return obj
+
+
+def _canonical(obj, seen) -> str:
+    """把 PDF 物件轉成穩定的字串（與物件編號無關，串流以內容 hash 表示）"""
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in seen:
+            return '<cycle>'
+        seen = seen | {obj.objid}
+        return _canonical(_resolve(obj), seen)
+    if isinstance(obj, PDFStream):
+        return '<stream %s %s>' % (_canonical(obj.attrs, seen), _stream_digest(obj).hex())
+    if isinstance(obj, dict):
+        # Parent 會回指頁面樹，不影響文字內容
+        return '{%s}' % ','.join(
+            f'{k}:{_canonical(v, seen)}' for k, v in sorted(obj.items()) if k != 'Parent'
+        )
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ','.join(_canonical(v, seen) for v in obj)
+    if isinstance(obj, PSLiteral):
+        return '/' + str(obj.name)
+    return repr(obj)
+
+
+class OCRCache:
+    """
+    OCR 結果的本機磁碟快取（以內容 hash 為 key）
+    
+    - documents/：整份檔案 hash → 解析後的 schedule_data（同一份檔案重新上傳時直接取用）
+    - pages/：單頁 hash → 擷取出的文字（修正過的新版本只需重新擷取有變動的頁面）
+    
+    總容量超過 max_bytes 時依最後使用時間（mtime）淘汰最久未用的項目（LRU）。
+    """
+    
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._metrics = {'document_hits': 0, 'document_misses': 0, 'page_hits': 0, 'page_misses': 0, 'evictions': 0}
+    
+    def get_document(self, digest):
+        data = self._read(self._path('documents', f'{digest}-v{PARSER_VERSION}.json'))
+        self._count('document_hits' if data is not None else 'document_misses')
+        return json.loads(data) if data is not None else None
+    
+    def put_document(self, digest, schedule_data):
+        self._write(self._path('documents', f'{digest}-v{PARSER_VERSION}.json'),
+                    json.dumps(schedule_data, ensure_ascii=False).encode('utf-8'))
+    
+    def get_page(self, digest):
+        data = self._read(self._path('pages', f'{digest}.txt'))
+        self._count('page_hits' if data is not None else 'page_misses')
+        return data.decode('utf-8') if data is not None else None
+    
+    def put_page(self, digest, text):
+        self._write(self._path('pages', f'{digest}.txt'), text.encode('utf-8'))
+    
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+    
+    def evict(self):
+        """容量超過上限時，從最久未使用的項目開始刪除"""
+        entries = []
+        total = 0
+        for kind in ('documents', 'pages'):
+            folder = self.root / kind
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        
+        if total <= self.max_bytes:
+            return 0
+        
+        removed = 0
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+            if total <= self.max_bytes:
+                break
+        self._count('evictions', removed)
+        return removed
+    
+    def _path(self, kind, name):
+        folder = self.root / kind
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder / name
+    
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # 更新 mtime 作為 LRU 的「最後使用時間」
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+    
+    def _write(self, path, data):
+        # 先寫暫存檔再 rename，其他執行緒 / 程序不會讀到寫一半的檔案
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._metrics[key] += amount
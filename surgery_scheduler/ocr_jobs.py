@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ScheduleUpload
+from .ocr_cache import OCRCache, file_hash
+
+
+class OCRJobQueue:
+    """
+    本機背景 OCR 解析佇列（不需要外部 broker）
+    
+    工作狀態存在 ScheduleUpload 本身（status / progress / processed），
+    以條件式 UPDATE 搶工作，同一筆上傳即使被多個程序送出也只會解析一次。
+    解析中的工作定期更新 heartbeat_at，逾時未更新（程序已結束）時由 reclaim_stale 改回等待中。
+    """
+    
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr')
+    
+    def submit(self, upload_id):
+        return self._executor.submit(self._run, upload_id)
+    
+    def reclaim_stale(self, uploads=None) -> List[int]:
+        """
+        把心跳逾時（OCR_JOB_TIMEOUT 秒未更新）的解析中工作改回等待中，回傳這些上傳的 id
+        
+        處理中的程序重啟或當機後，工作會一直停在解析中；多個程序同時接手時，
+        仍由 _process 的條件式 UPDATE 保證只解析一次。uploads 可限定範圍（預設全部）。
+        """
+        stale = timezone.now() - timedelta(seconds=getattr(settings, 'OCR_JOB_TIMEOUT', 600))
+        uploads = ScheduleUpload.objects.all() if uploads is None else uploads
+        reclaimed = list(uploads.filter(status=ScheduleUpload.STATUS_PROCESSING).filter(
+            Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True)
+        ).values_list('id', flat=True))
+        if reclaimed:
+            ScheduleUpload.objects.filter(id__in=reclaimed, status=ScheduleUpload.STATUS_PROCESSING).update(
+                status=ScheduleUpload.STATUS_PENDING, progress=0
+            )
+            print(f"🔁 重新排入中斷的 OCR 工作: {reclaimed}")
+        return reclaimed
+    
+    def resume_pending(self):
+        """重新送出尚在等待中、以及中斷的上傳（例如伺服器重啟前未處理完的工作）"""
+        self.reclaim_stale()
+        pending = ScheduleUpload.objects.filter(
+            status=ScheduleUpload.STATUS_PENDING
+        ).values_list('id', flat=True)
+        for upload_id in pending:
+            self.submit(upload_id)
+    
+    def _run(self, upload_id):
+        close_old_connections()
+        try:
+            self._process(upload_id)
+        finally:
+            # 背景執行緒不經過 request 週期，需自行關閉連線
+            connection.close()
+    
+    def _process(self, upload_id):
+        uploads = ScheduleUpload.objects.filter(id=upload_id)
+        claimed = uploads.filter(status=ScheduleUpload.STATUS_PENDING).update(
+            status=ScheduleUpload.STATUS_PROCESSING, progress=0, heartbeat_at=timezone.now()
+        )
+        if not claimed:
+            return
+        
+        from .ocr_processor import ScheduleOCRProcessor
+        last_progress = [0]
+        
+        def report(done, total):
+            # 只在百分比有變化時寫入，避免每頁都更新資料庫（同時作為心跳）
+            progress = min(99, done * 100 // max(total, 1))
+            if progress != last_progress[0]:
+                last_progress[0] = progress
+                uploads.update(progress=progress, heartbeat_at=timezone.now())
+        
+        try:
+            upload = uploads.get()
+            # 逐房間串流解析，不保留整份文件的全文
+            processor = ScheduleOCRProcessor(cache=get_ocr_cache())
+            schedule_data = list(processor.iter_surgeries(upload.uploaded_file.path, progress_callback=report))
+        except Exception as e:
+            print(f"❌ OCR 解析失敗（上傳 #{upload_id}）: {e}")
+            uploads.update(status=ScheduleUpload.STATUS_FAILED, error=str(e))
+            return
+        
+        uploads.update(
+            extracted_data=schedule_data,
+            status=ScheduleUpload.STATUS_DONE,
+            progress=100,
+            processed=True,
+            error=''
+        )
+        print(f"✓ OCR 解析完成（上傳 #{upload_id}）")
+
+
+def complete_from_cache(upload) -> bool:
+    """同一份檔案已解析過時直接完成，不必排入佇列"""
+    cached = get_ocr_cache().get_document(file_hash(upload.uploaded_file.path))
+    if cached is None:
+        return False
+    ScheduleUpload.objects.filter(id=upload.id, status=ScheduleUpload.STATUS_PENDING).update(
+        extracted_data=cached,
+        status=ScheduleUpload.STATUS_DONE,
+        progress=100,
+        processed=True
+    )
+    upload.refresh_from_db()
+    return upload.processed
+
+
+_queue = None
+_cache = None
+_queue_lock = threading.Lock()
+
+
+def get_ocr_queue() -> OCRJobQueue:
+    """取得程序層級共用的 OCR 佇列（第一次呼叫時建立並接手等待中的工作）"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = OCRJobQueue(max_workers=getattr(settings, 'OCR_WORKERS', 2))
+                _queue.resume_pending()
+    return _queue
+
+
+def get_ocr_cache() -> OCRCache:
+    """取得程序層級共用的 OCR 快取"""
+    global _cache
+    if _cache is None:
+        with _queue_lock:
+            if _cache is None:
+                _cache = OCRCache(
+                    getattr(settings, 'OCR_CACHE_DIR', settings.BASE_DIR / 'ocr_cache'),
+                    getattr(settings, 'OCR_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+                )
+    return _cache
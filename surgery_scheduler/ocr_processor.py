@@ -1,40 +1,235 @@
-import re, pdfplumber
+import math, os, re, threading, pdfplumber
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from .ocr_cache import file_hash, page_hash
+
+
+# 🏥 預先編譯的解析規則（每份文件、每個房間區塊共用）
+ROOM_HEADER_RE = re.compile(r'房間\s*[：:]\s*(\d+)')
+CASE_SPLIT_RE = re.compile(r'(\n\s*\d{1,2}[:：]\d{2}|\n\s*TF)')
+PATIENT_RE = re.compile(r'^\s*([\u4e00-\u9fa5]{2,4})')
+DOCTOR_RE = re.compile(r'([\u4e00-\u9fa5]{2,3})\s*(?:推床|病床|接送)')
+PROCEDURE_RE = re.compile(r'([A-Z0-9]{4,}[A-Z]*\s+[A-Za-z].*?)(?=\n|NOTE|手術部位|$)', re.S)
+
+
+def _page_text(page):
+    text = page.extract_text() or ""
+    # 釋放該頁解析出的字元物件，記憶體不隨頁數累積
+    page.close()
+    return text
+
+
+def extract_page_texts(file_path, page_numbers):
+    """擷取指定頁（0 起算）的文字（在子程序中執行，每個子程序自行開檔）"""
+    with pdfplumber.open(file_path) as pdf:
+        return [_page_text(pdf.pages[i]) for i in page_numbers]
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_page_pool(max_workers):
+    """程序層級共用的頁面擷取 process pool（避免每次上傳都重新啟動子程序）"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Django 內有多個執行緒（背景 OCR 佇列），用 spawn 避免 fork 複製鎖狀態
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = max_workers
+        return _pool
+
+
+def _reset_page_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
 
 class ScheduleOCRProcessor:
-    def process(self, file_path):
-        all_text = ""
+    # 頁數少於此值時直接在本程序擷取（子程序的啟動與傳輸成本不划算）
+    PARALLEL_MIN_PAGES = 8
+    # 每個子程序工作最少處理的頁數（每個工作都要重新開檔解析 xref）
+    MIN_PAGES_PER_TASK = 4
+    
+    def __init__(self, max_workers=None, cache=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # OCRCache：整份文件 / 單頁的內容 hash 快取（None 表示不使用）
+        self.cache = cache
+    
+    def process(self, file_path, progress_callback=None):
+        # progress_callback(已完成頁數, 總頁數)：背景解析時回報進度
+        page_texts = self.extract_pages(file_path, progress_callback)
+        # 各頁文字最後才一次串接（跨頁的房間區塊在串接後的全文中解析）
+        all_text = "".join(text + "\n" for text in page_texts)
+        if self.cache is not None:
+            self.cache.evict()
+        return {'schedule_data': self.parse_text(all_text), 'raw_text': all_text}
+    
+    def iter_surgeries(self, file_path, progress_callback=None):
+        """
+        邊讀頁面邊解析，逐個房間區塊 yield 手術記錄（結果與 process 相同）
+        
+        緩衝區只保留最後一個尚未結束的房間區塊，記憶體上限約為最大的房間區塊，
+        下游（分析、優化）可以在最後一頁讀完前就開始處理前面的房間。
+        有快取時，同一份檔案直接回傳上次的解析結果。
+        """
+        digest = None
+        if self.cache is not None:
+            digest = file_hash(file_path)
+            cached = self.cache.get_document(digest)
+            if cached is not None:
+                # 同一份檔案已解析過
+                if progress_callback:
+                    progress_callback(1, 1)
+                yield from cached
+                return
+        
+        records = [] if digest else None
+        for record in self._iter_parsed(file_path, progress_callback):
+            if records is not None:
+                records.append(dict(record))
+            yield record
+        
+        if digest:
+            self.cache.put_document(digest, records)
+            self.cache.evict()
+    
+    def _iter_parsed(self, file_path, progress_callback):
+        buffer = ""
+        for text in self.iter_page_texts(file_path, progress_callback):
+            buffer += text + "\n"
+            headers = list(ROOM_HEADER_RE.finditer(buffer))
+            if not headers:
+                # 第一個房間之前的文字不需要保留（但「房間：」可能被分頁切開）
+                tail = buffer.rfind('房間')
+                buffer = buffer[tail:] if tail >= 0 else ""
+                continue
+            
+            # 最後一個房間可能延續到下一頁，先留在緩衝區
+            for header, next_header in zip(headers, headers[1:]):
+                yield from self._parse_room_block(header.group(1), buffer[header.end():next_header.start()])
+            buffer = buffer[headers[-1].start():]
+        
+        header = ROOM_HEADER_RE.match(buffer)
+        if header:
+            yield from self._parse_room_block(header.group(1), buffer[header.end():])
+    
+    def extract_pages(self, file_path, progress_callback=None):
+        """依頁序回傳每頁文字"""
+        return list(self.iter_page_texts(file_path, progress_callback))
+    
+    def iter_page_texts(self, file_path, progress_callback=None):
+        """
+        依頁序 yield 每頁文字
+        
+        有快取時先以單頁 hash 取出已擷取過的頁面，只擷取其餘頁面；
+        需要擷取的頁數夠多時分段交給 process pool 平行處理。
+        """
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                all_text += (page.extract_text() or "") + "\n"
+            total = len(pdf.pages)
+            hashes = [None] * total
+            texts = [None] * total
+            if self.cache is not None:
+                hashes = [page_hash(page) for page in pdf.pages]
+                texts = [self.cache.get_page(h) for h in hashes]
+            missing = [i for i, text in enumerate(texts) if text is None]
+            
+            if self.max_workers <= 1 or len(missing) < self.PARALLEL_MIN_PAGES:
+                for i, page in enumerate(pdf.pages):
+                    yield self._page_text_at(i, page, texts, hashes)
+                    if progress_callback:
+                        progress_callback(i + 1, total)
+                return
+        
+        done = 0
+        try:
+            extracted = self._iter_parallel(file_path, missing)
+            for i in range(total):
+                if texts[i] is None:
+                    self._store_page(i, next(extracted), texts, hashes)
+                done += 1
+                yield texts[i]
+                if progress_callback:
+                    progress_callback(done, total)
+        except BrokenProcessPool as e:
+            # 已輸出的頁面不重複，從下一頁開始改為逐頁擷取
+            print(f"⚠️ 平行擷取失敗，改為逐頁擷取: {e}")
+            _reset_page_pool()
+            with pdfplumber.open(file_path) as pdf:
+                for i in range(done, total):
+                    done += 1
+                    yield self._page_text_at(i, pdf.pages[i], texts, hashes)
+                    if progress_callback:
+                        progress_callback(done, total)
+    
+    def _page_text_at(self, i, page, texts, hashes):
+        if texts[i] is None:
+            self._store_page(i, _page_text(page), texts, hashes)
+        return texts[i]
+    
+    def _store_page(self, i, text, texts, hashes):
+        texts[i] = text
+        if hashes[i] is not None:
+            self.cache.put_page(hashes[i], text)
+    
+    def _iter_parallel(self, file_path, page_numbers):
+        # 切成約 workers * 2 段，讓較慢的頁面不會拖住整批
+        chunk = max(self.MIN_PAGES_PER_TASK, math.ceil(len(page_numbers) / (self.max_workers * 2)))
+        pool = _get_page_pool(self.max_workers)
+        chunks = (page_numbers[k:k + chunk] for k in range(0, len(page_numbers), chunk))
+        # 同時送出的工作數有上限，未被取用的結果不會無限累積
+        pending = deque()
+        for numbers in chunks:
+            pending.append(pool.submit(extract_page_texts, str(file_path), numbers))
+            if len(pending) >= self.max_workers * 2:
+                break
         
+        while pending:
+            page_texts = pending.popleft().result()
+            numbers = next(chunks, None)
+            if numbers is not None:
+                pending.append(pool.submit(extract_page_texts, str(file_path), numbers))
+            yield from page_texts
+    
+    def parse_text(self, all_text):
         schedule_data = []
-        room_blocks = re.split(r'房間\s*[：:]\s*(\d+)', all_text)
+        room_blocks = ROOM_HEADER_RE.split(all_text)
         
         for i in range(1, len(room_blocks), 2):
-            room_no = room_blocks[i]
-            content = room_blocks[i+1]
-            # 🏥 這裡改用更穩定的切割，確保 TF 不會遺失順序
-            parts = re.split(r'(\n\s*\d{1,2}[:：]\d{2}|\n\s*TF)', content)
+            schedule_data.extend(self._parse_room_block(room_blocks[i], room_blocks[i+1]))
+        return schedule_data
+    
+    def _parse_room_block(self, room_no, content):
+        # 🏥 這裡改用更穩定的切割，確保 TF 不會遺失順序
+        parts = CASE_SPLIT_RE.split(content)
+        
+        for j in range(1, len(parts), 2):
+            time_val = parts[j].strip()
+            detail = parts[j+1]
+            p_name, d_name, s_type = "待核對", "待核對", "一般手術"
+            
+            # 抓取病患與醫師
+            p_m = PATIENT_RE.search(detail.lstrip())
+            if p_m: p_name = p_m.group(1)
+            d_m = DOCTOR_RE.search(detail)
+            if d_m: d_name = d_m.group(1)
+            
+            # 抓取術式
+            op_m = PROCEDURE_RE.search(detail)
+            if op_m: s_type = op_m.group(1).strip().replace('\n', ' ')
             
-            for j in range(1, len(parts), 2):
-                time_val = parts[j].strip()
-                detail = parts[j+1]
-                p_name, d_name, s_type = "待核對", "待核對", "一般手術"
-                
-                # 抓取病患與醫師
-                p_m = re.search(r'^\s*([\u4e00-\u9fa5]{2,4})', detail.lstrip())
-                if p_m: p_name = p_m.group(1)
-                d_m = re.search(r'([\u4e00-\u9fa5]{2,3})\s*(?:推床|病床|接送)', detail)
-                if d_m: d_name = d_m.group(1)
-                
-                # 抓取術式
-                op_m = re.search(r'([A-Z0-9]{4,}[A-Z]*\s+[A-Za-z].*?)(?=\n|NOTE|手術部位|$)', detail, re.S)
-                if op_m: s_type = op_m.group(1).strip().replace('\n', ' ')
-
-                schedule_data.append({
-                    'room': room_no, 'time': time_val, 'patient': p_name,
-                    'doctor': d_name, 'surgery_type': s_type,
-                    'original_time': time_val, 'original_room': room_no,
-                    'sort_key': j # 🏥 關鍵：保留 PDF 中的原始出現順序
-                })
-        return {'schedule_data': schedule_data, 'raw_text': all_text}
+            yield {
+                'room': room_no, 'time': time_val, 'patient': p_name,
+                'doctor': d_name, 'surgery_type': s_type,
+                'original_time': time_val, 'original_room': room_no,
+                'sort_key': j # 🏥 關鍵：保留 PDF 中的原始出現順序
+            }
@@ -4,84 +4,149 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from datetime import datetime
 import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .compact_schedule import NO_TIME, CompactSchedule, Field
+from .schedule_summary import room_sort_key
+
+# 版面改變時遞增，舊的快取檔不再使用
+EXPORT_FORMAT_VERSION = 2
+
+# 🔤 字型只需在程序內註冊一次
+_font = None
+_font_lock = threading.Lock()
+
+
+def get_pdf_font() -> str:
+    """註冊中文字型（失敗時退回 Helvetica），回傳字型名稱"""
+    global _font
+    if _font is None:
+        with _font_lock:
+            if _font is None:
+                try:
+                    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+                    _font = 'STSong-Light'
+                except Exception:
+                    _font = 'Helvetica'
+    return _font
+
 
 class SchedulePDFExporter:
     """排程 PDF 匯出器"""
     
+    TOP = A4[1] - 50
+    BOTTOM = 80
+    
     def __init__(self):
-        try:
-            pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-            self.font = 'STSong-Light'
-        except:
-            self.font = 'Helvetica'
+        self.font = get_pdf_font()
+        self._page = 0
     
-    def export(self, optimized_data, output_path='media/exports/optimized_schedule.pdf'):
-        """匯出優化後的排程為 PDF"""
-        
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        c = canvas.Canvas(output_path, pagesize=A4)
-        width, height = A4
-        y = height - 50
+    def export(self, optimized_data, output, title: str = None):
+        """
+        匯出優化後的排程為 PDF
         
-        # 標題
-        c.setFont(self.font, 14)
-        title = f"優化後排程 - {datetime.now().strftime('%Y/%m/%d %H:%M')}"
-        c.drawString(50, y, title)
-        y -= 30
+        output 可以是檔案路徑或可寫入的檔案物件；依房號分頁，換頁時重複房間標題與表頭。
+        """
+        c = canvas.Canvas(output, pagesize=A4, pageCompression=1, invariant=1)
+        title = title or f"優化後排程 - {datetime.now().strftime('%Y/%m/%d %H:%M')}"
+        self._page = 0
+        y = self._start_page(c, title)
         
-        # 按房間分組
+        # 按房間分組（精簡排程：時間為分鐘數、房號/醫師共用同一份字串）
+        schedule = CompactSchedule.from_dicts(optimized_data.get('optimized_data', []))
         by_room = {}
-        for surgery in optimized_data.get('optimized_data', []):
-            room = surgery.get('room', 0)
-            if room not in by_room:
-                by_room[room] = []
-            by_room[room].append(surgery)
+        for surgery in schedule:
+            by_room.setdefault(str(schedule.room_name(surgery, '')), []).append(surgery)
         
         # 逐房間輸出
-        for room, surgeries in sorted(by_room.items()):
-            if y < 100:
+        for room in sorted(by_room, key=room_sort_key):
+            if y < self.BOTTOM + 50:
                 c.showPage()
-                y = height - 50
-            
-            # 房間標題
-            c.setFont(self.font, 11)
-            c.drawString(50, y, f"房間：{room}")
-            y -= 20
-            
-            # 表頭
-            c.setFont(self.font, 8)
-            c.drawString(50, y, "時間")
-            c.drawString(100, y, "醫師")
-            c.drawString(160, y, "手術類型")
-            c.drawString(380, y, "優先級")
-            c.drawString(440, y, "預估時長")
-            y -= 15
+                y = self._start_page(c, title)
+            y = self._room_header(c, y, room)
             
-            # 手術列表
+            # 手術列表（優先級、時長直接取自排程項目）；依開始時間排序，
+            # 緊急插入空檔的手術附加在排程尾端，沒有時間的排在最後
+            surgeries = sorted(by_room[room], key=lambda s: (s.start == NO_TIME, s.start))
             for s in surgeries:
-                analysis = s.get('analysis', {})
+                if y < self.BOTTOM:
+                    c.showPage()
+                    y = self._room_header(c, self._start_page(c, title), room, continued=True)
                 
                 c.setFont(self.font, 8)
-                c.drawString(50, y, s.get('time', ''))
-                c.drawString(100, y, s.get('doctor', '未知'))
+                c.drawString(50, y, s.time_str if s.has(Field.TIME) else '')
+                c.drawString(100, y, schedule.doctor_name(s, '未知'))
                 
-                surgery_type = s.get('surgery_type', '一般手術')[:30]
+                surgery_type = (s.surgery_type if s.has(Field.SURGERY_TYPE) else '一般手術')[:30]
                 c.drawString(160, y, surgery_type)
                 
-                priority = analysis.get('priority', 3)
+                priority = s.priority if s.has(Field.PRIORITY) else 3
                 c.drawString(380, y, f"P{priority}")
                 
-                duration = analysis.get('estimated_duration', 90)
+                if s.has(Field.BASE_DURATION):
+                    duration = s.base_duration
+                else:
+                    duration = s.duration if s.has(Field.DURATION) else 90
                 c.drawString(440, y, f"{duration}分")
                 
                 y -= 12
-                
-                if y < 80:
-                    c.showPage()
-                    y = height - 50
             
             y -= 10
         
         c.save()
-        return output_path
+        return output
+    
+    def _start_page(self, c, title):
+        self._page += 1
+        c.setFont(self.font, 14)
+        c.drawString(50, self.TOP, title)
+        c.setFont(self.font, 8)
+        c.drawRightString(A4[0] - 50, self.TOP, f"第 {self._page} 頁")
+        return self.TOP - 30
+    
+    def _room_header(self, c, y, room, continued=False):
+        # 房間標題
+        c.setFont(self.font, 11)
+        c.drawString(50, y, f"房間：{room}{'（續）' if continued else ''}")
+        y -= 20
+        
+        # 表頭
+        c.setFont(self.font, 8)
+        c.drawString(50, y, "時間")
+        c.drawString(100, y, "醫師")
+        c.drawString(160, y, "手術類型")
+        c.drawString(380, y, "優先級")
+        c.drawString(440, y, "預估時長")
+        return y - 15
+
+
+def export_path(optimized_id) -> str:
+    return os.path.join(settings.MEDIA_ROOT, 'exports', f'schedule_{optimized_id}_v{EXPORT_FORMAT_VERSION}.pdf')
+
+
+def get_or_create_export(optimized) -> str:
+    """
+    版本的 PDF 快取檔路徑（不存在時產生）
+    
+    版本內容不會再變，同一版本只產生一次；先寫入暫存檔再 rename，
+    同時匯出（不同或相同版本）都不會讀到寫到一半的檔案。
+    """
+    path = export_path(optimized.id)
+    if os.path.exists(path):
+        return path
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.pdf.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            title = f"優化後排程 #{optimized.id} - {timezone.localtime(optimized.created_at).strftime('%Y/%m/%d %H:%M')}"
+            SchedulePDFExporter().export(optimized.get_optimized_data(), f, title=title)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
@@ -0,0 +1,251 @@
+import random
+import time as _time
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from .compact_schedule import NO_TIME, CompactSchedule, CompactSurgery, Field
+from .models import Doctor, Hospital, OperatingRoom, OptimizedSchedule, Surgery
+
+T = TypeVar('T')
+
+# 寫入衝突（SQLite 'database is locked'）時重試的次數與起始等待秒數
+WRITE_RETRIES = 8
+WRITE_RETRY_DELAY = 0.02
+# 版本衝突（其他請求已先提交新版本）時，以新的最新版本重新計算的次數
+VERSION_RETRIES = 20
+
+
+def write_atomic(block: Callable[[], T], retries: int = None) -> T:
+    """
+    在 transaction 內執行 block，遇到資料庫鎖定時整段重試（指數退避 + 抖動）
+    
+    SQLite 的 transaction 先讀後寫時，若另一個連線已在寫入會立即回傳 locked
+    （不會等待 timeout），只能 rollback 後重來；多院區同時寫入時由這裡處理。
+    已在外層 transaction 內時不重試，交給外層決定。
+    """
+    retries = WRITE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                return block()
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == retries or connection.in_atomic_block:
+                raise
+            _time.sleep(WRITE_RETRY_DELAY * (2 ** attempt) * (0.5 + random.random()))
+
+
+
+class StaleScheduleVersion(Exception):
+    """提交時父版本已不是院區目前的版本（被其他請求搶先提交）"""
+
+
+def current_version(hospital_id) -> Optional[OptimizedSchedule]:
+    """院區目前生效的排程版本"""
+    hospital = Hospital.objects.select_related('current_schedule').filter(id=hospital_id).first()
+    return hospital.current_schedule if hospital else None
+
+
+def publish_version(hospital_id, version: OptimizedSchedule):
+    """無條件把新版本設為目前版本（重新優化取代整份排程時使用）"""
+    Hospital.objects.filter(id=hospital_id).update(current_schedule=version)
+
+
+def commit_version(hospital_id, prepare: Callable[[OptimizedSchedule], Tuple[Callable[[], OptimizedSchedule], Any]],
+                   retries: int = None) -> Tuple[OptimizedSchedule, Any]:
+    """
+    以樂觀並行控制提交新版本（compare-and-swap）
+    
+    prepare(head) 以目前版本計算新排程（不寫資料庫），回傳 (save, extra)；
+    save() 在 transaction 內寫入手術與新版本並回傳新版本。寫入後只在院區的目前版本
+    仍是 head 時才切換過去，否則整個 transaction rollback，以新的目前版本重新 prepare。
+    計算期間不持有任何鎖，同時插入的緊急手術都會依序疊加，不會有人的修改被覆蓋。
+    
+    院區沒有任何版本時回傳 (None, None)；重試 retries 次仍衝突則拋出 StaleScheduleVersion。
+    """
+    retries = VERSION_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        head = current_version(hospital_id)
+        if head is None:
+            return None, None
+        save, extra = prepare(head)
+        
+        def swap():
+            version = save()
+            swapped = Hospital.objects.filter(
+                id=hospital_id, current_schedule_id=head.id
+            ).update(current_schedule=version)
+            if not swapped:
+                raise StaleScheduleVersion(f'版本 #{head.id} 已被取代')
+            return version
+        
+        try:
+            return write_atomic(swap), extra
+        except StaleScheduleVersion:
+            print(f"🔁 排程版本衝突，以最新版本重新計算（第 {attempt + 1} 次）")
+    raise StaleScheduleVersion(f'連續 {retries + 1} 次版本衝突')
+
+
+def optimization_notes(schedule, s):
+    """優化結果的備註：狀態 | 分析方法 | 分類"""
+    status = schedule.status_text(s) if s.has(Field.STATUS) else '智慧優化'
+    analysis_method = s.analysis_method if s.has(Field.ANALYSIS_METHOD) else '未知'
+    category = s.category if s.has(Field.CATEGORY) else '中型'
+    return f"{status} | {analysis_method} | {category}"
+
+
+def emergency_notes(schedule, s):
+    """緊急插入後的備註：狀態（| 分析方法）"""
+    analysis_method = s.analysis_method if s.has(Field.ANALYSIS_METHOD) else '未知'
+    notes_text = schedule.status_text(s) if s.has(Field.STATUS) else '排程中'
+    if analysis_method != '未知':
+        notes_text += f" | {analysis_method}"
+    return notes_text
+
+
+def day_surgeries(hospital_id, day: date = None):
+    """本院區某一天的手術（未指定日期時為本院區全部手術）"""
+    surgeries = Surgery.objects.filter(hospital_id=hospital_id)
+    if day is None:
+        return surgeries
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return surgeries.filter(scheduled_start__gte=start, scheduled_start__lt=start + timedelta(days=1))
+
+
+def _row_key(schedule: CompactSchedule, s: CompactSurgery) -> Tuple[str, int, str]:
+    """手術記錄的 (房號, 開始分鐘, 病患)，與 _build_surgeries 寫入的值相同"""
+    return str(schedule.room_name(s)), s.start, s.patient if s.has(Field.PATIENT) else '不明病患'
+
+
+class SchedulePersistence:
+    """
+    排程寫入服務（優化結果 / 緊急插入共用）
+    
+    房間與醫師各以一次查詢預先取出、缺少的一次 bulk_create，
+    手術以 bulk_create 批次寫入，全部包在同一個 transaction 內。
+    """
+    
+    BATCH_SIZE = 500
+    UPDATE_FIELDS = [
+        'operating_room', 'doctor', 'scheduled_start', 'scheduled_end',
+        'original_start_time', 'original_room', 'patient_name', 'surgery_type',
+        'estimated_duration', 'notes',
+    ]
+    
+    def __init__(self, hospital_id, day: date = None):
+        self.hospital_id = hospital_id
+        # 指定日期（版本的 schedule_date）時只讀寫該日的手術；
+        # 未指定時（沒有日期的舊版本）為今天、且取代全部手術
+        self.day = day
+    
+    def _surgeries(self):
+        """本次寫入範圍內的手術（只限本院區，其他院區的排程不受影響）"""
+        return day_surgeries(self.hospital_id, self.day)
+    
+    def replace_schedule(self, schedule: CompactSchedule,
+                         notes_builder: Callable[[CompactSchedule, CompactSurgery], str]) -> List[Surgery]:
+        """以新的排程取代本院區目前所有手術記錄（指定日期時只取代該日）"""
+        with transaction.atomic():
+            self._surgeries().delete()
+            return self.create_surgeries(schedule, notes_builder)
+    
+    def create_surgeries(self, schedule: CompactSchedule,
+                         notes_builder: Callable[[CompactSchedule, CompactSurgery], str]) -> List[Surgery]:
+        """批次建立手術記錄（呼叫端負責 transaction）"""
+        surgeries = self._build_surgeries(schedule, range(len(schedule)), notes_builder)
+        return Surgery.objects.bulk_create(surgeries, batch_size=self.BATCH_SIZE)
+    
+    def apply_changes(self, schedule: CompactSchedule, updated: List[int], base: List[Dict[str, Any]],
+                      notes_builder: Callable[[CompactSchedule, CompactSurgery], str]) -> bool:
+        """
+        只寫入有變動的手術：updated 位置以 bulk_update 更新，父版本 base 之後的項目新增
+        
+        要更新的列必須是父版本在該位置的手術（房號、開始時間、病患相同），新增的位置不可已存在；
+        資料表與父版本對不上時不做任何寫入並回傳 False，由呼叫端改用 replace_schedule。
+        """
+        appended = list(range(len(base), len(schedule)))
+        positions = list(updated) + appended
+        existing = {}
+        for position, pk, room, start, patient in self._surgeries().filter(position__in=positions).values_list(
+                'position', 'id', 'operating_room__number', 'scheduled_start', 'patient_name'):
+            start = timezone.localtime(start)
+            existing[position] = (pk, (room, start.hour * 60 + start.minute, patient))
+        if any(p not in existing for p in updated) or any(p in existing for p in appended):
+            return False
+        parent = CompactSchedule.from_dicts([base[p] for p in updated])
+        if any(existing[p][1] != _row_key(parent, s) for p, s in zip(updated, parent.surgeries)):
+            return False
+        
+        with transaction.atomic():
+            rows = self._build_surgeries(schedule, positions, notes_builder)
+            changed = rows[:len(updated)]
+            for row in changed:
+                row.pk = existing[row.position][0]
+            if changed:
+                Surgery.objects.bulk_update(changed, self.UPDATE_FIELDS, batch_size=self.BATCH_SIZE)
+            Surgery.objects.bulk_create(rows[len(updated):], batch_size=self.BATCH_SIZE)
+        return True
+    
+    def _build_surgeries(self, schedule: CompactSchedule, positions: Iterable[int],
+                         notes_builder: Callable[[CompactSchedule, CompactSurgery], str]) -> List[Surgery]:
+        """依位置建立（未儲存的）Surgery 物件"""
+        items = [(p, schedule.surgeries[p]) for p in positions]
+        rooms = self._get_or_create_many(
+            OperatingRoom, 'number', (str(schedule.room_name(s)) for _, s in items))
+        doctors = self._get_or_create_many(
+            Doctor, 'name', (schedule.doctor_name(s) for _, s in items))
+        
+        today = self.day or date.today()
+        start_cache = {}
+        surgeries = []
+        for position, s in items:
+            start_t = start_cache.get(s.start)
+            if start_t is None:
+                if s.start == NO_TIME:
+                    raise ValueError(f"time data {s.time_str!r} does not match format '%H:%M'")
+                start_t = timezone.make_aware(datetime.combine(today, time(*divmod(s.start, 60))))
+                start_cache[s.start] = start_t
+            
+            duration = s.duration if s.has(Field.DURATION) else 90
+            surgeries.append(Surgery(
+                hospital_id=self.hospital_id,
+                operating_room=rooms[str(schedule.room_name(s))],
+                doctor=doctors[schedule.doctor_name(s)],
+                scheduled_start=start_t,
+                scheduled_end=start_t + timedelta(minutes=duration),
+                original_start_time=s.original_time_str if s.has(Field.ORIGINAL_TIME) else None,
+                original_room=schedule.original_room_name(s) if s.has(Field.ORIGINAL_ROOM) else None,
+                patient_name=s.patient if s.has(Field.PATIENT) else '不明病患',
+                surgery_type=s.surgery_type if s.has(Field.SURGERY_TYPE) else '一般手術',
+                estimated_duration=s.base_duration if s.has(Field.BASE_DURATION) else duration,
+                notes=notes_builder(schedule, s),
+                position=position
+            ))
+        return surgeries
+    
+    def _get_or_create_many(self, model, field: str, values: Iterable[str]) -> Dict[str, Any]:
+        """一次查出既有資料，缺少的一次 bulk_create，回傳 值 → 物件"""
+        wanted = set(values)
+        found = {}
+        existing = model.objects.filter(
+            hospital_id=self.hospital_id, **{f'{field}__in': wanted}
+        ).order_by('id')
+        for obj in existing:
+            found.setdefault(getattr(obj, field), obj)
+        
+        missing = [v for v in wanted if v not in found]
+        if missing:
+            created = model.objects.bulk_create(
+                [model(hospital_id=self.hospital_id, **{field: v}) for v in sorted(missing)]
+            )
+            if all(obj.pk is not None for obj in created):
+                found.update((getattr(obj, field), obj) for obj in created)
+            else:
+                # 資料庫不支援回傳主鍵時再查一次
+                for obj in model.objects.filter(
+                    hospital_id=self.hospital_id, **{f'{field}__in': missing}
+                ).order_by('id'):
+                    found.setdefault(getattr(obj, field), obj)
+        return found
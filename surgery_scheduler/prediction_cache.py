@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 特徵組合數量有限（術式關鍵字 × 醫師 × 時段 × 房間），預設上限足以涵蓋數天的排程
+DEFAULT_MAX_SIZE = 4096
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+
+
+class PredictionCache:
+    """
+    ML 預測結果的 LRU + TTL 快取（程序內跨請求共用）
+    
+    key 為正規化後的特徵 tuple，value 為 (預測時長, 預測優先級)。
+    每筆資料記錄產生它的模型版本；registry 重新載入模型（版本改變）時整個清空。
+    """
+    
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._version = None
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def get_many(self, version, keys):
+        """回傳與 keys 等長的列表，未命中為 None"""
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            if not self._check_version(version):
+                return [None] * len(keys)
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and now - entry[1] > self.ttl_seconds:
+                    del self._data[key]
+                    self._metrics['expirations'] += 1
+                    entry = None
+                if entry is None:
+                    self._metrics['misses'] += 1
+                    results.append(None)
+                    continue
+                self._data.move_to_end(key)
+                self._metrics['hits'] += 1
+                results.append(entry[0])
+        return results
+    
+    def put_many(self, version, items):
+        """items: (key, value) 的可迭代物件"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._check_version(version):
+                return
+            for key, value in items:
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._metrics['evictions'] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def metrics(self):
+        with self._lock:
+            data = dict(self._metrics)
+            lookups = data['hits'] + data['misses']
+            data['hit_ratio'] = round(data['hits'] / lookups, 4) if lookups else 0.0
+            data['size'] = len(self._data)
+            data['max_size'] = self.max_size
+            data['ttl_seconds'] = self.ttl_seconds
+            data['model_version'] = self._version
+            return data
+    
+    def _check_version(self, version):
+        """模型重新載入後舊的預測全部作廢；仍在使用舊版模型的請求不使用快取"""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._data:
+                self._data.clear()
+                self._metrics['invalidations'] += 1
+            self._version = version
+        return True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache() -> PredictionCache:
+    """取得程序層級共用的 PredictionCache（第一次呼叫時建立）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
@@ -0,0 +1,274 @@
+import csv
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Iterable, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .compact_schedule import NO_TIME, Field
+from .models import OptimizedSchedule, Surgery
+
+# 匯出欄位：(查詢欄位, 標題)
+EXPORT_FIELDS = (
+    ('id', '編號'),
+    ('operating_room__number', '房號'),
+    ('scheduled_start', '開始時間'),
+    ('scheduled_end', '結束時間'),
+    ('patient_name', '病患'),
+    ('doctor__name', '主刀醫師'),
+    ('surgery_type', '手術類型'),
+    ('estimated_duration', '預估時長(分)'),
+    ('original_room', '原房號'),
+    ('original_start_time', '原定時間'),
+    ('notes', '狀態'),
+)
+
+# 每次 yield 的資料量（累積到約此大小再送出，減少串流的小封包）
+CHUNK_BYTES = 64 * 1024
+# 資料庫游標每次取回的筆數
+FETCH_SIZE = 2000
+
+# 格式 → (Content-Type, 副檔名)；xml 為 SpreadsheetML 2003（Excel 可直接開啟的 XML，不是 .xls 二進位檔）
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xml': ('application/xml; charset=utf-8', 'xml'),
+    'ics': ('text/calendar; charset=utf-8', 'ics'),
+}
+
+
+def export_rows(hospital_id, start: date = None, end: date = None,
+                room: str = None, doctor: str = None) -> Iterator[Tuple]:
+    """
+    本院區目前資料表內的手術（live 排程）依開始時間排序的列（欄位順序同 EXPORT_FIELDS）
+    
+    單一查詢（JOIN 房號、醫師）：不限房間時走 (hospital, scheduled_start) 索引、
+    指定房間時走 (operating_room, scheduled_start) 索引；以游標分批讀取，不會一次載入全部。
+    start / end 為日期（含 start、不含 end）。
+    """
+    surgeries = Surgery.objects.filter(hospital_id=hospital_id)
+    if start is not None:
+        surgeries = surgeries.filter(scheduled_start__gte=_day_start(start))
+    if end is not None:
+        surgeries = surgeries.filter(scheduled_start__lt=_day_start(end))
+    if room:
+        surgeries = surgeries.filter(operating_room__hospital_id=hospital_id, operating_room__number=room)
+    if doctor:
+        surgeries = surgeries.filter(doctor__name=doctor)
+    fields = [field for field, _ in EXPORT_FIELDS]
+    return surgeries.order_by('scheduled_start').values_list(*fields).iterator(chunk_size=FETCH_SIZE)
+
+
+def version_rows(optimized: OptimizedSchedule, start: date = None, end: date = None,
+                 room: str = None, doctor: str = None) -> Iterator[Tuple]:
+    """
+    指定排程版本的列（欄位與 export_rows 相同，由版本內容產生、不讀資料表）
+    
+    版本是單日排程，時間以版本的 schedule_date 為日期；編號為手術在版本內的位置，
+    其餘欄位的預設值與備註和 SchedulePersistence 寫入資料表時相同（見 version_notes）。
+    """
+    from .schedule_summary import version_notes
+    schedule, notes = version_notes(optimized)
+    day_start = _day_start(optimized.schedule_date or timezone.localdate())
+    positions = sorted((p for p, s in enumerate(schedule.surgeries) if s.start != NO_TIME),
+                       key=lambda p: schedule.surgeries[p].start)
+    for p in positions:
+        s = schedule.surgeries[p]
+        room_name = str(schedule.room_name(s))
+        doctor_name = schedule.doctor_name(s)
+        if (room and room_name != room) or (doctor and doctor_name != doctor):
+            continue
+        begin = day_start + timedelta(minutes=s.start)
+        if (start is not None and begin < _day_start(start)) or (end is not None and begin >= _day_start(end)):
+            continue
+        duration = s.duration if s.has(Field.DURATION) else 90
+        yield (
+            p, room_name, begin, begin + timedelta(minutes=duration),
+            s.patient if s.has(Field.PATIENT) else '不明病患', doctor_name,
+            s.surgery_type if s.has(Field.SURGERY_TYPE) else '一般手術',
+            s.base_duration if s.has(Field.BASE_DURATION) else duration,
+            schedule.original_room_name(s) if s.has(Field.ORIGINAL_ROOM) else None,
+            s.original_time_str if s.has(Field.ORIGINAL_TIME) else None,
+            notes[p],
+        )
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    """把小字串累積成約 CHUNK_BYTES 的區塊"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _local(value: datetime) -> str:
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+
+
+class _Line:
+    """csv.writer 的輸出目標：writerow 直接回傳該列文字"""
+    
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    """CSV（UTF-8 BOM，Excel 直接開啟不會亂碼）"""
+    writer = csv.writer(_Line())
+    
+    def lines():
+        yield '\ufeff' + writer.writerow([title for _, title in EXPORT_FIELDS])
+        for row in rows:
+            row = list(row)
+            row[2] = _local(row[2])
+            row[3] = _local(row[3])
+            yield writer.writerow(row)
+    
+    return _chunked(lines())
+
+
+def iter_spreadsheet(rows: Iterable[Tuple], sheet_name: str = '手術排程') -> Iterator[bytes]:
+    """
+    SpreadsheetML（XML Spreadsheet 2003），以 .xml 提供，Excel 可直接開啟
+    
+    純文字 XML 可以邊查詢邊輸出；XLSX 是 zip，需要整份寫完才能產生目錄。
+    """
+    def cell(value):
+        if value is None:
+            return '<Cell/>'
+        if isinstance(value, (int, float)):
+            return f'<Cell><Data ss:Type="Number">{value}</Data></Cell>'
+        return f'<Cell><Data ss:Type="String">{escape(str(value))}</Data></Cell>'
+    
+    def lines():
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<?mso-application progid="Excel.Sheet"?>\n'
+               '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+               'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+               f'<Worksheet ss:Name={quoteattr(sheet_name)}><Table>\n')
+        yield '<Row>' + ''.join(cell(title) for _, title in EXPORT_FIELDS) + '</Row>\n'
+        for row in rows:
+            row = list(row)
+            row[2] = _local(row[2])
+            row[3] = _local(row[3])
+            yield '<Row>' + ''.join(cell(value) for value in row) + '</Row>\n'
+        yield '</Table></Worksheet>\n</Workbook>\n'
+    
+    return _chunked(lines())
+
+
+def _ical_text(value) -> str:
+    """iCalendar TEXT 跳脫"""
+    return (str(value or '').replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ical_time(value: datetime) -> str:
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line: str) -> str:
+    """RFC 5545：每行最多 75 bytes，超過時以 CRLF + 空白續行（不切斷多位元組字元）"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    size = 0
+    limit = 75
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(current)
+            current = ''
+            size = 0
+            limit = 74
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ical_uid(hospital_id, start: datetime, patient: str, original_room, original_time) -> str:
+    """
+    手術的 UID：院區 + 排程日期 + 病患 + 原定房號與時間
+    
+    資料表的 id 每次重新優化都會重建、房號與時間也會調整，只有原排程的資訊不變；
+    以雜湊表示，UID 不會帶出病患姓名。
+    """
+    key = '|'.join(str(value) for value in (
+        hospital_id, timezone.localtime(start).date().isoformat(), patient, original_room or '', original_time or ''
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+def iter_ical(rows: Iterable[Tuple], calendar_name: str, hospital_id,
+              domain: str = 'hospital-scheduler') -> Iterator[bytes]:
+    """iCalendar（RFC 5545），每台手術一個 VEVENT；UID 固定，行事曆重新訂閱時會更新而非重複"""
+    stamp = _ical_time(timezone.now())
+    
+    def lines():
+        yield ('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Hospital Scheduler//Surgery Schedule//ZH\r\n'
+               'CALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n')
+        yield _fold(f'X-WR-CALNAME:{_ical_text(calendar_name)}')
+        seen = {}
+        for (pk, room, start, end, patient, doctor, surgery_type,
+             duration, original_room, original_time, notes) in rows:
+            uid = _ical_uid(hospital_id, start, patient, original_room, original_time)
+            # 同一天同一病患在同一原定時段有兩台時，依開始時間順序加上編號
+            seen[uid] = seen.get(uid, 0) + 1
+            if seen[uid] > 1:
+                uid = f'{uid}-{seen[uid]}'
+            yield (f'BEGIN:VEVENT\r\nUID:surgery-{uid}@{domain}\r\nDTSTAMP:{stamp}\r\n'
+                   f'DTSTART:{_ical_time(start)}\r\nDTEND:{_ical_time(end)}\r\n')
+            yield _fold(f'SUMMARY:{_ical_text(surgery_type)} - {_ical_text(patient)}')
+            yield _fold(f'LOCATION:{_ical_text(f"第 {room} 手術房")}')
+            yield _fold(f'DESCRIPTION:{_ical_text(f"主刀醫師: {doctor}")}\\n{_ical_text(notes)}')
+            yield 'END:VEVENT\r\n'
+        yield 'END:VCALENDAR\r\n'
+    
+    return _chunked(lines())
+
+
+async def as_async(chunks: Iterator[bytes]):
+    """
+    ASGI 用：逐塊在同步執行緒取得內容（含資料庫查詢）
+    
+    Django 4.2 在 ASGI 下遇到同步 iterator 會先整個讀進記憶體，改成 async iterator 才能邊查邊送。
+    """
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+def stream_export(fmt: str, hospital_id, start=None, end=None,
+                  room: Optional[str] = None, doctor: Optional[str] = None,
+                  version: Optional[OptimizedSchedule] = None) -> Iterator[bytes]:
+    """依格式產生串流內容；指定 version 時匯出該版本，否則匯出資料表內目前的排程"""
+    if version is not None:
+        rows = version_rows(version, start, end, room, doctor)
+    else:
+        rows = export_rows(hospital_id, start, end, room, doctor)
+    if fmt == 'csv':
+        return iter_csv(rows)
+    if fmt == 'xml':
+        return iter_spreadsheet(rows)
+    if fmt == 'ics':
+        name = '手術排程' + (f' - 第 {room} 房' if room else '') + (f' - {doctor}' if doctor else '')
+        return iter_ical(rows, name, hospital_id)
+    raise ValueError(f'未知的匯出格式: {fmt}')
@@ -1,5 +1,110 @@
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import heapq
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from .compact_schedule import (
+    DAY_START_MINUTES, NO_TIME, CompactSchedule, CompactSurgery, Field, StatusCode,
+    minutes_to_time,
+)
+from .doctor_index import DoctorIntervalIndex
+from .free_intervals import FreeIntervalIndex
+from .keyword_matcher import get_surgery_classifier
+from .schedule_solver import NO_DEADLINE, SchedulePlan, parallel_local_search, schedule_metrics
+
+class RoomDispatcher:
+    """
+    房間可用時間的 priority queue（min-heap）
+    
+    取最早空出的房間為 O(log rooms)；同時空出時依房間加入順序決定，
+    與原本 min(dict, key=...) 的結果相同。更新時直接 push 新值，
+    過期的項目在取用時才丟棄（lazy deletion）。
+    """
+    
+    def __init__(self):
+        self._ready = {}
+        self._order = {}
+        self._heap = []
+    
+    def set_ready(self, room: int, minutes: int):
+        if room not in self._order:
+            self._order[room] = len(self._order)
+        self._ready[room] = minutes
+        heapq.heappush(self._heap, (minutes, self._order[room], room))
+    
+    def ready_time(self, room: int, default: int) -> int:
+        return self._ready.get(room, default)
+    
+    def earliest(self):
+        """回傳 (房間, 可用時間)"""
+        heap = self._heap
+        while self._ready[heap[0][2]] != heap[0][0]:
+            heapq.heappop(heap)
+        minutes, _, room = heap[0]
+        return room, minutes
+
+
+_ANALYSIS_FIELDS = (Field.DURATION | Field.BASE_DURATION | Field.PRIORITY
+                    | Field.CATEGORY | Field.ANALYSIS_METHOD)
+
+
+def _start_minutes(s: CompactSurgery) -> int:
+    """排定時間（分鐘）；TF 等無法解析的時間與 strptime 一樣拋出 ValueError"""
+    if s.start == NO_TIME:
+        raise ValueError(f"time data {s.time_str!r} does not match format '%H:%M'")
+    return s.start
+
+
+def _original_minutes(s: CompactSurgery) -> int:
+    if s.original_start == NO_TIME:
+        raise ValueError(f"time data {s.original_time_str!r} does not match format '%H:%M'")
+    return s.original_start
+
+
+# 術式知識庫（關鍵字比對，命中規則見 keyword_matcher.KeywordClassifier）
+SURGERY_KNOWLEDGE = {
+    'TRIGGER': {'duration': 30, 'priority': 5, 'category': '小型'},
+    'RELEASE': {'duration': 30, 'priority': 5, 'category': '小型'},
+    'PORT-A': {'duration': 45, 'priority': 4, 'category': '小型'},
+    'REMOVAL': {'duration': 40, 'priority': 4, 'category': '小型'},
+    'DJ': {'duration': 35, 'priority': 4, 'category': '小型'},
+    'EXCISION': {'duration': 45, 'priority': 4, 'category': '小型'},
+    'CONE': {'duration': 45, 'priority': 4, 'category': '小型'},
+    'CTS': {'duration': 40, 'priority': 4, 'category': '小型'},
+    'SPINAL': {'duration': 180, 'priority': 2, 'category': '大型'},
+    'FUSION': {'duration': 180, 'priority': 2, 'category': '大型'},
+    'FIXATION': {'duration': 120, 'priority': 2, 'category': '大型'},
+    'DISKECTOMY': {'duration': 150, 'priority': 2, 'category': '大型'},
+    'CRANIOTOMY': {'duration': 200, 'priority': 1, 'category': '大型'},
+    'LAMINECTOMY': {'duration': 150, 'priority': 2, 'category': '大型'},
+}
+
+
+def _doctor_index(schedule: CompactSchedule, surgeries: Iterable[CompactSurgery]) -> DoctorIntervalIndex:
+    """以目前的房間與時間建立醫師時段索引（沒有時間的手術略過）"""
+    index = DoctorIntervalIndex()
+    for s in surgeries:
+        if s.start != NO_TIME:
+            duration = s.duration if s.has(Field.DURATION) else 90
+            index.add(schedule.doctor_name(s), s.start, s.start + duration, s.room, s)
+    return index
+
+
+def _free_index(schedule: CompactSchedule, not_before: int, clean_time: int) -> FreeIntervalIndex:
+    """各房間在 not_before 之後的空檔索引（手術佔用到結束 + 清潔時間，沒有時間的手術略過）"""
+    busy = {}
+    for s in schedule:
+        if s.start != NO_TIME:
+            length = s.duration if s.has(Field.DURATION) else 90
+            busy.setdefault(s.room, []).append((s.start, s.start + length + clean_time))
+    return FreeIntervalIndex(busy, not_before)
+
+
+def _metrics_rank(metrics: Dict[str, Any]):
+    """排程優劣：醫師重複排入 → 衝突 / 超時 → 最晚結束 → 空檔 → 提前分鐘數（越多越好）"""
+    return (metrics.get('doctor_conflicts', 0),
+            metrics['overlap_minutes'] + metrics['late_minutes'], metrics['makespan_minutes'],
+            metrics['idle_minutes'], -metrics['saved_minutes'])
+
 
 class OptimizationConfig:
     """優化配置參數 - 依臨床需求調優"""
@@ -11,9 +116,26 @@ class OptimizationConfig:
     # ML 分析設定
     USE_ML_ANALYSIS = True  # 啟用 ML 分析
     ML_PRIORITY = True  # ML 優先於知識庫
+    ANALYSIS_BATCH_SIZE = 256  # 每批推論的手術數（串流輸入時的分析粒度）
     
     # 緊急手術設定
-    EMERGENCY_BUFFER = 30  # 緊急手術預留緩衝時間（分鐘）
+    EMERGENCY_BUFFER = 30  # 緊急手術預留緩衝時間（分鐘，需延後其他手術時才加上）
+    # 各緊急程度可等待空檔的上限（分鐘）；超過時直接插入並延後之後的手術，None 為只排空檔
+    EMERGENCY_MAX_WAIT = {1: 30, 2: 60, 3: 120, 4: 240, 5: None}
+    
+    # 多日排程設定（horizon.HorizonScheduler）
+    HORIZON_DAYS = 7  # 預設排程天數
+    HORIZON_MAX_DAYS = 31  # 單次請求最多排程的天數
+    DAY_END_MINUTES = 20 * 60  # 預設收班時間，超過的手術移到下一個開放日
+    WORKDAYS = (0, 1, 2, 3, 4)  # 開放日（週一 = 0），其餘日期整天不排程
+    
+    # 求解模式：'greedy'（單次貪婪）或 'local_search'（貪婪後再以局部搜尋改善）
+    SOLVER = 'greedy'
+    SOLVERS = ('greedy', 'local_search')
+    SOLVER_TIME_BUDGET = 2.0  # 局部搜尋的牆鐘時間上限（秒）
+    SOLVER_SEED = 0
+    SOLVER_MAX_ITERATIONS = None  # 指定後結果可完全重現（不受機器快慢影響）
+    SOLVER_WORKERS = None  # 平行重啟的子程序數（None 為 CPU 核心數，1 為不啟動子程序）
 
 class SurgeryAnalyzer:
     """整合式手術分析器：ML 模型 → 知識庫 → 預設值"""
@@ -36,22 +158,9 @@ class SurgeryAnalyzer:
                 print(f"ℹ 無法載入 ML 模型: {e}，使用知識庫")
         
         # 知識庫（備用）
-        self.surgery_knowledge = {
-            'TRIGGER': {'duration': 30, 'priority': 5, 'category': '小型'},
-            'RELEASE': {'duration': 30, 'priority': 5, 'category': '小型'},
-            'PORT-A': {'duration': 45, 'priority': 4, 'category': '小型'},
-            'REMOVAL': {'duration': 40, 'priority': 4, 'category': '小型'},
-            'DJ': {'duration': 35, 'priority': 4, 'category': '小型'},
-            'EXCISION': {'duration': 45, 'priority': 4, 'category': '小型'},
-            'CONE': {'duration': 45, 'priority': 4, 'category': '小型'},
-            'CTS': {'duration': 40, 'priority': 4, 'category': '小型'},
-            'SPINAL': {'duration': 180, 'priority': 2, 'category': '大型'},
-            'FUSION': {'duration': 180, 'priority': 2, 'category': '大型'},
-            'FIXATION': {'duration': 120, 'priority': 2, 'category': '大型'},
-            'DISKECTOMY': {'duration': 150, 'priority': 2, 'category': '大型'},
-            'CRANIOTOMY': {'duration': 200, 'priority': 1, 'category': '大型'},
-            'LAMINECTOMY': {'duration': 150, 'priority': 2, 'category': '大型'},
-        }
+        self.surgery_knowledge = SURGERY_KNOWLEDGE
+        # 三種術式關鍵字表共用一個預先建好的比對器
+        self.classifier = get_surgery_classifier()
     
     def estimate_duration(self, surgery_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -63,30 +172,64 @@ class SurgeryAnalyzer:
         if self.ml_analyzer and self.config.ML_PRIORITY:
             ml_result = self.ml_analyzer.analyze_surgery(surgery_data)
             if ml_result:
-                # ML 成功分析，加上容忍值
-                base_duration = ml_result.get('estimated_duration', 90)
-                return {
-                    'duration': int(base_duration * (1 + self.config.DURATION_TOLERANCE)),
-                    'base_duration': base_duration,
-                    'priority': ml_result.get('priority', 3),
-                    'category': ml_result.get('category', '中型'),
-                    'method': 'ML',
-                    'confidence': ml_result.get('confidence', 0.0)
-                }
+                return self._from_ml_result(ml_result)
         
-        # 使用知識庫
-        surgery_type = surgery_data.get('surgery_type', '').upper()
-        for keyword, info in self.surgery_knowledge.items():
-            if keyword in surgery_type:
-                base_duration = info['duration']
-                return {
-                    'duration': int(base_duration * (1 + self.config.DURATION_TOLERANCE)),
-                    'base_duration': base_duration,
-                    'priority': info['priority'],
-                    'category': info.get('category', '中型'),
-                    'method': '知識庫',
-                    'confidence': 0.8
-                }
+        return self._from_knowledge(surgery_data)
+    
+    def estimate_batch(self, surgeries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批次估算整天的手術時長，結果與逐筆呼叫 estimate_duration 完全相同
+        ML 模型對整批只執行一次，分析失敗的項目再退回知識庫
+        """
+        ml_results = [None] * len(surgeries)
+        if self.ml_analyzer and self.config.ML_PRIORITY:
+            ml_results = self.ml_analyzer.analyze_batch(surgeries)
+        
+        return [
+            self._from_ml_result(ml_result) if ml_result else self._from_knowledge(surgery_data)
+            for surgery_data, ml_result in zip(surgeries, ml_results)
+        ]
+    
+    def iter_estimates(self, surgeries: Iterable[Dict[str, Any]],
+                       batch_size: int = 64) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        邊讀邊分析：每累積 batch_size 筆就批次估算一次，yield (手術, 分析結果)
+        
+        可直接接 ScheduleOCRProcessor.iter_surgeries，前面房間的分析不必等最後一頁解析完
+        """
+        iterator = iter(surgeries)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield from zip(batch, self.estimate_batch(batch))
+    
+    def _from_ml_result(self, ml_result: Dict[str, Any]) -> Dict[str, Any]:
+        """ML 成功分析，加上容忍值"""
+        base_duration = ml_result.get('estimated_duration', 90)
+        return {
+            'duration': int(base_duration * (1 + self.config.DURATION_TOLERANCE)),
+            'base_duration': base_duration,
+            'priority': ml_result.get('priority', 3),
+            'category': ml_result.get('category', '中型'),
+            'method': 'ML',
+            'confidence': ml_result.get('confidence', 0.0)
+        }
+    
+    def _from_knowledge(self, surgery_data: Dict[str, Any]) -> Dict[str, Any]:
+        """使用知識庫（最長關鍵字優先），找不到時回傳預設值"""
+        keyword = self.classifier.classify(surgery_data.get('surgery_type', ''))['knowledge']
+        info = self.surgery_knowledge.get(keyword)
+        if info:
+            base_duration = info['duration']
+            return {
+                'duration': int(base_duration * (1 + self.config.DURATION_TOLERANCE)),
+                'base_duration': base_duration,
+                'priority': info['priority'],
+                'category': info.get('category', '中型'),
+                'method': '知識庫',
+                'confidence': 0.8
+            }
         
         # 預設值
         return {
@@ -106,73 +249,69 @@ class EmergencySurgeryInserter:
         self.analyzer = analyzer
         self.config = OptimizationConfig
     
-    def find_best_room(self, current_schedule: List[Dict]) -> Dict[str, Any]:
+    def find_best_room(self, schedule: CompactSchedule, doctor: str = None, duration: int = 90,
+                       doctor_index: DoctorIntervalIndex = None, urgency_level: int = 1,
+                       not_before: int = DAY_START_MINUTES, free: FreeIntervalIndex = None) -> Dict[str, Any]:
         """
-        找出最適合插入緊急手術的房間
+        找出插入緊急手術的房間與時間
         
         策略：
-        1. 優先選擇當前空閒的房間
-        2. 其次選擇最快空出的房間
-        3. 評估影響最小的房間
+        1. 在所有房間的空檔中找最早、放得下（時長 + 清潔時間）的空檔，不影響任何手術
+           （房間最後一台之後也算空檔，因此一定找得到）
+        2. 該空檔的等待時間超過 urgency_level 允許的上限時，改插在最早可開始的房間，
+           只延後插入點之後、會被壓到的手術
+        3. 有醫師時段索引時，主刀醫師在該時段已有其他房間的手術則往後找
+        
+        free 為同一份排程、同一個 not_before 的空檔索引（_free_index）；與 doctor_index 一樣由呼叫端
+        建立一次後傳入，多次查詢同一份排程時不必每次重新整理所有手術；未提供時才在這裡建立。
         """
         
-        # 按房間分組
-        by_room = {}
-        for s in current_schedule:
-            room = s['room']
-            if room not in by_room:
-                by_room[room] = []
-            by_room[room].append(s)
-        
-        # 評估每個房間
-        room_scores = []
-        current_time = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
-        
-        for room, surgeries in by_room.items():
-            if not surgeries:
-                # 空房間，最優選擇
-                room_scores.append({
-                    'room': room,
-                    'score': 1000,
-                    'insert_time': current_time,
-                    'affected_surgeries': 0,
-                    'reason': '空閒房間'
-                })
-                continue
-            
-            # 排序手術
-            sorted_surgeries = sorted(surgeries, 
-                key=lambda x: datetime.strptime(x.get('time', '08:00'), '%H:%M'))
-            
-            # 計算最後一台手術的結束時間
-            last_surgery = sorted_surgeries[-1]
-            last_time = datetime.strptime(last_surgery['time'], '%H:%M')
-            last_end = last_time + timedelta(
-                minutes=last_surgery.get('duration', 90) + self.config.CLEAN_TIME
-            )
-            
-            # 影響的手術數量
-            affected = len(sorted_surgeries)
-            
-            # 評分
-            time_score = max(0, 100 - (last_end.hour - 8) * 10)
-            impact_score = max(0, 100 - affected * 15)
-            total_score = time_score + impact_score
-            
-            room_scores.append({
+        if free is None:
+            free = _free_index(schedule, not_before, self.config.CLEAN_TIME)
+        if not len(free):
+            raise ValueError('目前排程沒有可用的手術房')
+        
+        max_wait = self.config.EMERGENCY_MAX_WAIT.get(urgency_level)
+        needed = duration + self.config.CLEAN_TIME
+        
+        def earliest(length, latest_start):
+            """放得下 length 的空檔中最早可開始的 (時間, 房間)；latest_start(空檔) 為該空檔最晚可開始時間"""
+            best = None
+            for gap in free.iter_fits(length):
+                gap_start, _, room = gap
+                # 空檔依開始時間排列，之後的空檔不可能更早
+                if best is not None and gap_start >= best[0]:
+                    break
+                t = gap_start
+                if doctor_index is not None and doctor:
+                    t = doctor_index.next_free(doctor, gap_start, duration, room)
+                if t <= latest_start(gap) and (best is None or t < best[0]):
+                    best = (t, room)
+            return best
+        
+        # 1. 最早放得下的空檔（不延後任何手術）
+        t, room = earliest(needed, lambda gap: gap[1] - needed)
+        if max_wait is None or t - not_before <= max_wait:
+            return {
                 'room': room,
-                'score': total_score,
-                'insert_time': last_end,
-                'affected_surgeries': affected,
-                'reason': f"於 {last_end.strftime('%H:%M')} 插入，影響 {affected} 台手術"
-            })
-        
-        # 選擇最佳房間
-        best = max(room_scores, key=lambda x: x['score'])
-        return best
+                'insert_time': t,
+                'mode': 'gap',
+                'wait_minutes': t - not_before,
+                'reason': f"於 {minutes_to_time(t)} 排入空檔，不影響其他手術"
+            }
+        
+        # 2. 等不到空檔：插在最早可開始的房間（長度 0 的空檔即手術之間的交接點）
+        t, room = earliest(0, lambda gap: gap[1])
+        return {
+            'room': room,
+            'insert_time': t,
+            'mode': 'shift',
+            'wait_minutes': t - not_before,
+            'reason': f"緊急程度 {urgency_level}，於 {minutes_to_time(t)} 插入並延後之後的手術"
+        }
     
     def insert_emergency(self, current_schedule: List[Dict], 
-                        emergency_surgery: Dict) -> Dict[str, Any]:
+                        emergency_surgery: Dict, not_before: int = DAY_START_MINUTES) -> Dict[str, Any]:
         """
         插入緊急手術並調整排程
         
@@ -183,77 +322,115 @@ class EmergencySurgeryInserter:
                     'patient': '病患姓名',
                     'doctor': '醫師姓名',
                     'surgery_type': '手術類型',
-                    'urgency_level': 1-5
+                    'urgency_level': 1-5（1 最緊急，可等待時間見 EMERGENCY_MAX_WAIT）
                 }
+            not_before: 最早可開始的時間（距午夜分鐘數）
         """
+        schedule, insertion_info = self.insert_emergency_compact(current_schedule, emergency_surgery, not_before)
+        
+        # 緊急手術排在最後
+        adjusted_schedule = schedule.to_dicts()
+        
+        return {
+            'adjusted_schedule': adjusted_schedule,
+            'emergency_surgery': adjusted_schedule[-1],
+            'insertion_info': insertion_info
+        }
+    
+    def insert_emergency_compact(self, current_schedule: List[Dict], emergency_surgery: Dict,
+                                 not_before: int = DAY_START_MINUTES) -> Tuple[CompactSchedule, Dict[str, Any]]:
+        """與 insert_emergency 相同，但回傳 (CompactSchedule, insertion_info)；緊急手術為最後一筆"""
         
         print(f"\n{'='*60}")
         print(f"🚨 緊急手術插入處理")
         print(f"{'='*60}")
         
+        schedule = CompactSchedule.from_dicts(current_schedule)
+        
         # 1. 分析緊急手術（使用 ML 或知識庫）
         print(f"\n[1] 分析緊急手術...")
-        analysis = self.analyzer.estimate_duration(emergency_surgery)
+        analysis = self.analyzer.estimate_batch([emergency_surgery])[0]
         emergency_surgery['duration'] = analysis['duration']
         emergency_surgery['base_duration'] = analysis.get('base_duration', analysis['duration'])
         emergency_surgery['priority'] = 1  # 最高優先級
         emergency_surgery['is_emergency'] = True
         emergency_surgery['category'] = analysis.get('category', '中型')
         emergency_surgery['analysis_method'] = analysis.get('method', '預設')
+        try:
+            urgency_level = min(5, max(1, int(emergency_surgery.get('urgency_level', 1))))
+        except (TypeError, ValueError):
+            urgency_level = 1
+        emergency_surgery['urgency_level'] = urgency_level
         
         print(f"  手術: {emergency_surgery['surgery_type']}")
         print(f"  時長: {analysis.get('base_duration', 90)}分 (含容忍值: {analysis['duration']}分)")
         print(f"  分析: {analysis.get('method', '預設')}")
+        print(f"  緊急程度: {urgency_level}")
         
         # 2. 尋找最佳房間
         print(f"\n[2] 尋找最適合的房間...")
-        best_room = self.find_best_room(current_schedule)
+        doctor_index = _doctor_index(schedule, schedule)
+        free = _free_index(schedule, not_before, self.config.CLEAN_TIME)
+        best_room = self.find_best_room(schedule, emergency_surgery.get('doctor'), analysis['duration'],
+                                        doctor_index, urgency_level, not_before, free)
+        room_name = schedule.rooms[best_room['room']]
         
-        print(f"  選擇: 房間 {best_room['room']}")
+        print(f"  選擇: 房間 {room_name}")
         print(f"  理由: {best_room['reason']}")
         
         # 3. 插入緊急手術
         print(f"\n[3] 插入緊急手術並調整排程...")
         
-        emergency_surgery['room'] = best_room['room']
-        emergency_surgery['time'] = best_room['insert_time'].strftime('%H:%M')
-        emergency_surgery['status'] = '🚨 緊急手術'
-        emergency_surgery['is_scheduled'] = True
-        emergency_surgery['original_room'] = best_room['room']
-        emergency_surgery['original_time'] = emergency_surgery['time']
-        
-        # 4. 調整該房間其他手術（往後延）
-        adjusted_schedule = []
-        delay_minutes = emergency_surgery['duration'] + self.config.CLEAN_TIME + self.config.EMERGENCY_BUFFER
-        
-        for surgery in current_schedule:
-            if surgery['room'] == best_room['room']:
-                # 該房間的手術需要延後
-                original_time = datetime.strptime(surgery['time'], '%H:%M')
-                new_time = original_time + timedelta(minutes=delay_minutes)
-                
-                surgery['time'] = new_time.strftime('%H:%M')
-                surgery['status'] = f"⏰ 因緊急手術延後 {delay_minutes} 分鐘"
-                surgery['delayed_by_emergency'] = True
-                
-                print(f"  延後: {surgery['surgery_type']} → {surgery['time']}")
+        emergency = schedule.append(emergency_surgery)
+        emergency.room = emergency.original_room = best_room['room']
+        emergency.set_start(best_room['insert_time'])
+        emergency.original_start, emergency.original_time_raw = emergency.start, None
+        emergency.present |= Field.ROOM | Field.ORIGINAL_ROOM | Field.ORIGINAL_TIME
+        emergency.set_status(StatusCode.EMERGENCY)
+        emergency.set_flag(Field.IS_SCHEDULED, True)
+        
+        # 4. 只延後插入點之後、會與前一台重疊的手術（遇到夠大的空檔就停止）
+        later = sorted(
+            (s for s in schedule
+             if s.room == best_room['room'] and s is not emergency
+             and s.start != NO_TIME and s.start >= emergency.start),
+            key=lambda s: s.start
+        )
+        ready = emergency.start + emergency.duration + self.config.CLEAN_TIME
+        if best_room['mode'] == 'shift':
+            ready += self.config.EMERGENCY_BUFFER
+        
+        affected = 0
+        total_delay = 0
+        for surgery in later:
+            if surgery.start >= ready:
+                break
+            delay = ready - surgery.start
+            surgery.set_start(ready)
+            surgery.set_status(StatusCode.DELAYED, delay)
+            surgery.set_flag(Field.DELAYED_BY_EMERGENCY, True)
+            affected += 1
+            total_delay += delay
+            ready = surgery.start + (surgery.duration if surgery.has(Field.DURATION) else 90) + self.config.CLEAN_TIME
             
-            adjusted_schedule.append(surgery)
+            print(f"  延後: {surgery.surgery_type} → {surgery.time_str}（{delay} 分鐘）")
         
-        # 5. 將緊急手術加入排程
-        adjusted_schedule.append(emergency_surgery)
+        # 5. 檢查醫師時段衝突
+        doctor_conflicts = _doctor_index(schedule, schedule).count_conflicts()
+        if doctor_conflicts:
+            print(f"  ⚠️ 醫師時段衝突: {doctor_conflicts} 組")
         
         print(f"\n✓ 緊急手術已插入")
         
-        return {
-            'adjusted_schedule': adjusted_schedule,
-            'emergency_surgery': emergency_surgery,
-            'insertion_info': {
-                'room': best_room['room'],
-                'time': emergency_surgery['time'],
-                'affected_surgeries': best_room['affected_surgeries'],
-                'total_delay': delay_minutes
-            }
+        return schedule, {
+            'room': room_name,
+            'time': emergency.time_str,
+            'mode': best_room['mode'],
+            'urgency_level': urgency_level,
+            'wait_minutes': best_room['wait_minutes'],
+            'affected_surgeries': affected,
+            'total_delay': total_delay,
+            'doctor_conflicts': doctor_conflicts
         }
 
 
@@ -265,26 +442,64 @@ class ScheduleOptimizer:
         self.analyzer = SurgeryAnalyzer()
         self.emergency_inserter = EmergencySurgeryInserter(self.analyzer)
     
-    def optimize(self, extracted_data: List[Dict], hospital_id: str = None) -> Dict:
-        """標準優化流程（整合 ML 分析）"""
+    def optimize(self, extracted_data: Iterable[Dict], hospital_id: str = None, solver: str = None,
+                 time_budget: float = None, seed: int = None, max_iterations: int = None,
+                 workers: int = None) -> Dict:
+        """
+        標準優化流程（整合 ML 分析）；extracted_data 可以是列表或逐筆產生的 generator
+        
+        solver='local_search' 時在貪婪結果之後以局部搜尋縮短最晚結束時間與空檔
+        （workers 個子程序各自從不同起點搜尋，取最佳解），
+        回傳的 'solver' 欄位包含兩者在同一份輸入上的指標，可直接比較。
+        """
+        schedule, optimized_list, result = self.optimize_compact(
+            extracted_data, hospital_id, solver, time_budget, seed, max_iterations, workers
+        )
+        return dict(optimized_data=schedule.to_dicts(optimized_list), **result)
+    
+    def optimize_compact(self, extracted_data: Iterable[Dict], hospital_id: str = None, solver: str = None,
+                         time_budget: float = None, seed: int = None, max_iterations: int = None,
+                         workers: int = None) -> Tuple[CompactSchedule, List[CompactSurgery], Dict]:
+        """
+        與 optimize 相同，但回傳 (CompactSchedule, 依房間與時間排序的手術, 統計資訊)
+        
+        手術的 start 為距午夜分鐘數，超過午夜時不會像 'HH:MM' 字串一樣折回，
+        多日排程以此判斷是否超過收班時間。
+        """
+        solver = solver or self.config.SOLVER
+        if solver not in self.config.SOLVERS:
+            raise ValueError(f'未知的求解模式: {solver}')
         
         # 統計使用的分析方法
         ml_count = 0
         kb_count = 0
         default_count = 0
         
-        # 1. 初始化並使用 ML/知識庫分析
-        for s in extracted_data:
-            analysis = self.analyzer.estimate_duration(s)
-            s['duration'] = analysis['duration']
-            s['base_duration'] = analysis.get('base_duration', analysis['duration'])
-            s['priority'] = analysis['priority']
-            s['category'] = analysis.get('category', '中型')
-            s['analysis_method'] = analysis.get('method', '預設')
-            s['is_scheduled'] = False
-            s['is_tf'] = "TF" in str(s.get('time', '')).upper()
-            s['original_room'] = s['room']
-            s['original_time'] = s['time']
+        # 1. 初始化並使用 ML/知識庫分析（輸入可邊解析邊送入）
+        #    已是列表時整批一次推論；generator 則每 ANALYSIS_BATCH_SIZE 筆推論一次
+        schedule = CompactSchedule()
+        rooms = schedule.rooms
+        batch_size = self.config.ANALYSIS_BATCH_SIZE
+        if isinstance(extracted_data, (list, tuple)):
+            batch_size = max(len(extracted_data), 1)
+        
+        for item, analysis in self.analyzer.iter_estimates(extracted_data, batch_size):
+            s = schedule.append(item)
+            if not s.has(Field.ROOM):
+                raise KeyError('room')
+            if not s.has(Field.TIME):
+                raise KeyError('time')
+            s.duration = analysis['duration']
+            s.base_duration = analysis.get('base_duration', analysis['duration'])
+            s.priority = analysis['priority']
+            s.category = analysis.get('category', '中型')
+            s.analysis_method = analysis.get('method', '預設')
+            s.present |= _ANALYSIS_FIELDS
+            s.set_flag(Field.IS_SCHEDULED, False)
+            s.set_flag(Field.IS_TF, "TF" in str(item.get('time', '')).upper())
+            s.original_room = s.room
+            s.original_start, s.original_time_raw = s.start, s.time_raw
+            s.present |= Field.ORIGINAL_ROOM | Field.ORIGINAL_TIME
             
             # 統計
             if analysis.get('method') == 'ML':
@@ -293,75 +508,185 @@ class ScheduleOptimizer:
                 kb_count += 1
             else:
                 default_count += 1
-
+        
         # 2. 鎖定第一台 (📌 錨點絕對不動)
-        pool = sorted(extracted_data, key=lambda x: (int(x['room']), x.get('sort_key', 0)))
-        room_busy_until = {}
+        #    時間一律預先轉成「距午夜分鐘數」，之後只做整數運算
+        pool = sorted(schedule, key=lambda x: (int(rooms[x.room]), x.sort_key))
+        by_room = {}
+        for s in pool:
+            by_room.setdefault(rooms[s.room], []).append(s)
+        
+        dispatcher = RoomDispatcher()
+        doctor_index = DoctorIntervalIndex()
         optimized_list = []
-        all_rooms = sorted(list(set(int(s['room']) for s in pool)))
+        anchors = []
+        all_rooms = sorted(list(set(int(rooms[s.room]) for s in pool)))
         
         for r_int in all_rooms:
-            r = str(r_int)
-            room_ops = [s for s in pool if s['room'] == r]
+            room_ops = by_room.get(str(r_int))
             if room_ops:
                 first = room_ops[0]
-                first['is_scheduled'] = True
-                first['is_first_surgery'] = True
-                first['status'] = "📌 第一台-保留"
-                t_str = "08:00" if first['is_tf'] else first['time']
-                curr_t = datetime.strptime(t_str, "%H:%M")
-                first['time'] = curr_t.strftime("%H:%M")
-                room_busy_until[r] = curr_t + timedelta(minutes=first['duration'] + self.config.CLEAN_TIME)
+                first.set_flag(Field.IS_SCHEDULED, True)
+                first.set_flag(Field.IS_FIRST_SURGERY, True)
+                first.set_status(StatusCode.ANCHOR)
+                curr_t = DAY_START_MINUTES if first.flag(Field.IS_TF) else _start_minutes(first)
+                first.set_start(curr_t)
+                dispatcher.set_ready(first.room, curr_t + first.duration + self.config.CLEAN_TIME)
+                doctor_index.add(schedule.doctor_name(first), curr_t, curr_t + first.duration, first.room, first)
                 optimized_list.append(first)
-
-        # 3. 平均分配其餘手術
-        remaining = sorted([s for s in pool if not s['is_scheduled']], 
-                           key=lambda x: (x['priority'], datetime.strptime("08:00" if x['is_tf'] else x['time'], "%H:%M")))
+                anchors.append(first)
+        
+        # 3. 平均分配其餘手術（priority queue 取最早空出的房間）
+        remaining = [
+            (DAY_START_MINUTES if s.flag(Field.IS_TF) else _original_minutes(s), s)
+            for s in pool if not s.flag(Field.IS_SCHEDULED)
+        ]
+        remaining.sort(key=lambda x: (x[1].priority, x[0]))
         
         total_saved = 0
-        for surgery in remaining:
-            best_room = min(room_busy_until.keys(), key=lambda r: room_busy_until[r])
-            ready_t = room_busy_until[best_room]
-            
-            orig_t_str = "08:00" if surgery['is_tf'] else surgery['original_time']
-            orig_t = datetime.strptime(orig_t_str, "%H:%M")
+        conflicts_avoided = 0
+        for orig_t, surgery in remaining:
+            best_room, ready_t = dispatcher.earliest()
+            doctor = schedule.doctor_name(surgery)
             
-            if ready_t <= orig_t:
-                surgery['is_scheduled'] = True
-                surgery['room'] = best_room
-                surgery['time'] = ready_t.strftime("%H:%M")
-                surgery['status'] = f"🔄 重新分配(原房{surgery['original_room']})"
-                total_saved += (orig_t - ready_t).total_seconds() / 60
-                optimized_list.append(surgery)
-                room_busy_until[best_room] = ready_t + timedelta(minutes=surgery['duration'] + self.config.CLEAN_TIME)
+            surgery.set_flag(Field.IS_SCHEDULED, True)
+            # 只有主刀醫師在新時段沒有其他房間的手術時才換房提前
+            movable = ready_t <= orig_t
+            if movable and not doctor_index.is_free(doctor, ready_t, ready_t + surgery.duration, best_room):
+                movable = False
+                conflicts_avoided += 1
+            if movable:
+                surgery.room = best_room
+                surgery.set_start(ready_t)
+                surgery.set_status(StatusCode.REASSIGNED, surgery.original_room)
+                total_saved += orig_t - ready_t
+                dispatcher.set_ready(best_room, ready_t + surgery.duration + self.config.CLEAN_TIME)
             else:
-                r_orig = surgery['original_room']
-                ready_orig = room_busy_until.get(r_orig, datetime.strptime("08:00", "%H:%M"))
+                r_orig = surgery.original_room
+                ready_orig = dispatcher.ready_time(r_orig, DAY_START_MINUTES)
                 act_t = max(ready_orig, orig_t)
-                if act_t > orig_t and not surgery['is_tf']: 
+                if act_t > orig_t and not surgery.flag(Field.IS_TF): 
                     act_t = orig_t
                 
-                surgery['is_scheduled'] = True
-                surgery['room'], surgery['time'] = r_orig, act_t.strftime("%H:%M")
-                surgery['status'] = "✅ 保持原房"
-                optimized_list.append(surgery)
-                room_busy_until[r_orig] = act_t + timedelta(minutes=surgery['duration'] + self.config.CLEAN_TIME)
-
-        return {
-            'optimized_data': sorted(optimized_list, key=lambda x: (int(x['room']), x['time'])),
-            'improvement': round((total_saved / 480) * 100, 1),
+                surgery.room = r_orig
+                surgery.set_start(act_t)
+                surgery.set_status(StatusCode.KEPT)
+                dispatcher.set_ready(r_orig, act_t + surgery.duration + self.config.CLEAN_TIME)
+            doctor_index.add(doctor, surgery.start, surgery.start + surgery.duration, surgery.room, surgery)
+            optimized_list.append(surgery)
+        
+        improvement = round((total_saved / 480) * 100, 1)
+        solver_info = None
+        if solver == 'local_search':
+            solver_info = self._improve_schedule(
+                schedule, anchors, [s for _, s in remaining],
+                self.config.SOLVER_TIME_BUDGET if time_budget is None else time_budget,
+                self.config.SOLVER_SEED if seed is None else seed,
+                self.config.SOLVER_MAX_ITERATIONS if max_iterations is None else max_iterations,
+                self.config.SOLVER_WORKERS if workers is None else workers
+            )
+            improvement = solver_info['result']['improvement']
+        
+        if solver_info is not None and solver_info['applied']:
+            doctor_index = _doctor_index(schedule, optimized_list)
+        
+        optimized_list.sort(key=lambda x: (int(rooms[x.room]), x.time_str))
+        result = {
+            'improvement': improvement,
+            'doctor_conflicts': doctor_index.count_conflicts(),
+            'doctor_conflicts_avoided': conflicts_avoided,
             'ml_analysis_count': ml_count,
             'kb_analysis_count': kb_count,
             'default_analysis_count': default_count
         }
+        if solver_info is not None:
+            result['solver'] = solver_info
+        return schedule, optimized_list, result
+    
+    def _improve_schedule(self, schedule: CompactSchedule, anchors: List[CompactSurgery], others: List[CompactSurgery],
+                          time_budget: float, seed: int, max_iterations: Optional[int],
+                          workers: Optional[int]) -> Dict[str, Any]:
+        """
+        以局部搜尋改善貪婪排程（直接修改 others 的房間、時間與狀態）
+        
+        限制與貪婪相同：錨點不動、房內相鄰手術間隔 CLEAN_TIME、開始時間不晚於原定時間（TF 除外）；
+        醫師重複排入兩間房的組數是第一優先，結果不會比貪婪排程多
+        """
+        clean = self.config.CLEAN_TIME
+        room_index = {a.room: r for r, a in enumerate(anchors)}
+        original = [DAY_START_MINUTES if s.flag(Field.IS_TF) else _original_minutes(s) for s in others]
+        deadline = [NO_DEADLINE if s.flag(Field.IS_TF) else t for s, t in zip(others, original)]
+        
+        def metrics():
+            entries = [(a.room, a.start, a.duration, a.start, a.start, True) for a in anchors]
+            entries += [(s.room, s.start, s.duration, o, d, False) for s, o, d in zip(others, original, deadline)]
+            result = schedule_metrics(entries, clean)
+            result['doctor_conflicts'] = _doctor_index(schedule, anchors + others).count_conflicts()
+            return result
+        
+        greedy_metrics = metrics()
+        
+        # 初始解：貪婪結果依房間、開始時間排列
+        sequences = [[] for _ in anchors]
+        for c in sorted(range(len(others)), key=lambda c: others[c].start):
+            sequences[room_index[others[c].room]].append(c)
+        plan = SchedulePlan(
+            ready=[a.start + a.duration + clean for a in anchors],
+            anchor_end=[a.start + a.duration for a in anchors],
+            duration=[s.duration for s in others],
+            deadline=deadline,
+            # 優先級 1（最緊急）權重最高，越緊急越往前排
+            weight=[max(1, 6 - s.priority) for s in others],
+            clean_time=clean,
+            sequences=sequences,
+            # 醫師時段：搜尋不接受讓醫師重複排入兩間房的組數增加的移動
+            doctor=[schedule.doctor_name(s) for s in others],
+            fixed=[(schedule.doctor_name(a), a.start, a.start + a.duration) for a in anchors],
+        )
+        found = parallel_local_search(plan, seed=seed, time_budget=time_budget,
+                                      max_iterations=max_iterations, workers=workers)
+        
+        greedy_state = [(s.room, s.start, s.time_raw, s.status, s.status_arg, s.status_raw) for s in others]
+        for r, seq in enumerate(found['sequences']):
+            for c, start in zip(seq, plan.starts(r, seq)):
+                s = others[c]
+                s.room = anchors[r].room
+                s.set_start(start)
+                if s.room != s.original_room:
+                    s.set_status(StatusCode.REASSIGNED, s.original_room)
+                else:
+                    s.set_status(StatusCode.KEPT)
+        
+        # 以同一套指標比較，搜尋結果沒有比貪婪好時保留貪婪排程
+        result_metrics = metrics()
+        applied = _metrics_rank(result_metrics) <= _metrics_rank(greedy_metrics)
+        if not applied:
+            for s, state in zip(others, greedy_state):
+                s.room, s.start, s.time_raw, s.status, s.status_arg, s.status_raw = state
+            result_metrics = greedy_metrics
+        
+        return {
+            'mode': 'local_search',
+            'seed': found['seed'],
+            'iterations': found['iterations'],
+            'elapsed_seconds': found['elapsed_seconds'],
+            'time_budget': time_budget,
+            'workers': found['workers'],
+            'best_restart': found['best_restart'],
+            'restarts': found['restarts'],
+            'applied': applied,
+            'greedy': greedy_metrics,
+            'result': result_metrics,
+        }
     
     def insert_emergency_surgery(self, current_schedule: List[Dict], 
-                                emergency_data: Dict) -> Dict:
+                                emergency_data: Dict, not_before: int = DAY_START_MINUTES) -> Dict:
         """
         插入緊急手術
         
         Args:
             current_schedule: 當前排程（optimized_data）
             emergency_data: 緊急手術資料
+            not_before: 最早可開始的時間（距午夜分鐘數）
         """
-        return self.emergency_inserter.insert_emergency(current_schedule, emergency_data)
+        return self.emergency_inserter.insert_emergency(current_schedule, emergency_data, not_before)
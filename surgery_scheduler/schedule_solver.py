@@ -0,0 +1,359 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .doctor_index import DoctorIntervalIndex
+
+# 沒有時間上限（TF 接台）的手術
+NO_DEADLINE = 1 << 30
+
+
+class SchedulePlan:
+    """
+    局部搜尋用的排程問題（只含整數列表，可直接 pickle 給子程序）
+    
+    - 每間房的第一台（📌 錨點）固定不動，ready[r] 為錨點結束 + 清潔時間
+    - 其餘手術依 sequences[r] 的順序在房內連續排列（前一台結束 + 清潔時間即開始）
+    - deadline[c] 為原定時間，開始時間不得晚於此時間（TF 接台沒有上限）；
+      房間到原定時間仍未空出時與貪婪的「保持原房」相同，照原定時間開始，
+      重疊的分鐘數記為衝突
+    - doctor[c] 為主刀醫師、fixed[r] 為錨點的 (醫師, 開始, 結束)；有提供時，
+      醫師同時排入兩間房的組數列為第一優先的最小化目標（見 DoctorClashes）
+    """
+    
+    __slots__ = ('ready', 'anchor_end', 'duration', 'deadline', 'weight', 'clean_time', 'sequences',
+                 'doctor', 'fixed')
+    
+    def __init__(self, ready: List[int], anchor_end: List[int], duration: List[int],
+                 deadline: List[int], weight: List[int], clean_time: int, sequences: List[List[int]],
+                 doctor: Optional[List[str]] = None, fixed: Optional[List[Tuple[str, int, int]]] = None):
+        self.ready = ready
+        self.anchor_end = anchor_end
+        self.duration = duration
+        self.deadline = deadline
+        self.weight = weight
+        self.clean_time = clean_time
+        self.sequences = sequences
+        self.doctor = doctor
+        self.fixed = fixed
+    
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+    
+    def room_cost(self, r: int, seq: Sequence[int]) -> Tuple[int, int, int]:
+        """回傳 (衝突分鐘數, 房間結束時間, 加權開始時間總和)"""
+        t = self.ready[r]
+        end = self.anchor_end[r]
+        conflict = weighted = 0
+        duration, deadline, weight, clean = self.duration, self.deadline, self.weight, self.clean_time
+        for c in seq:
+            start = t
+            if start > deadline[c]:
+                conflict += start - deadline[c]
+                start = deadline[c]
+            weighted += weight[c] * start
+            finish = start + duration[c]
+            if finish > end:
+                end = finish
+            t = finish + clean
+        return conflict, end, weighted
+    
+    def starts(self, r: int, seq: Sequence[int]) -> List[int]:
+        starts = []
+        t = self.ready[r]
+        for c in seq:
+            start = min(t, self.deadline[c])
+            starts.append(start)
+            t = start + self.duration[c] + self.clean_time
+        return starts
+
+
+class DoctorClashes:
+    """
+    局部搜尋中目前解的醫師時段索引，增量維護「同一醫師同時在兩間房」的組數
+    
+    每次移動只重算涉及的房間：先從索引移除這些房間的時段，
+    分別計算舊時段與新時段和其他房間（含錨點）的衝突數，差值即為總數的變化。
+    plan 沒有醫師資料時不追蹤（總數固定為 0）。
+    """
+    
+    def __init__(self, plan: SchedulePlan, seqs: Sequence[Sequence[int]]):
+        self.plan = plan
+        self.enabled = plan.doctor is not None
+        self.index = DoctorIntervalIndex()
+        if self.enabled:
+            for r, (doctor, start, end) in enumerate(plan.fixed or ()):
+                self.index.add(doctor, start, end, r, -1 - r)
+            for r, seq in enumerate(seqs):
+                for entry in self.entries(r, seq):
+                    self.index.add(*entry)
+        self.total = self.index.count_conflicts()
+    
+    def entries(self, r: int, seq: Sequence[int]) -> List[Tuple[str, int, int, int, int]]:
+        """房間 r 依 seq 排列時各台的 (醫師, 開始, 結束, 房間, 手術)"""
+        if not self.enabled:
+            return []
+        doctor, duration = self.plan.doctor, self.plan.duration
+        return [(doctor[c], start, start + duration[c], r, c) for c, start in zip(seq, self.plan.starts(r, seq))]
+    
+    def _count(self, entries) -> int:
+        """entries 與索引內其他房間的衝突數 + entries 彼此間跨房的衝突數"""
+        local = DoctorIntervalIndex()
+        count = 0
+        for doctor, start, end, room, key in entries:
+            count += len(self.index.conflicts(doctor, start, end, room))
+            local.add(doctor, start, end, room, key)
+        return count + local.count_conflicts()
+    
+    def propose(self, old_entries, new_entries) -> int:
+        """從索引移除 old_entries，回傳換成 new_entries 後的總數；之後必須以 settle 放回其中一組"""
+        if not self.enabled:
+            return 0
+        for entry in old_entries:
+            self.index.remove(*entry)
+        return self.total - self._count(old_entries) + self._count(new_entries)
+    
+    def settle(self, entries, total: Optional[int] = None):
+        """把接受（或還原）的時段放回索引"""
+        for entry in entries:
+            self.index.add(*entry)
+        if total is not None:
+            self.total = total
+
+
+def total_cost(room_costs: Sequence[Tuple[int, int, int]]) -> Tuple[int, int, int]:
+    """整體目標（依序比較）：衝突總分鐘數 → 最晚結束時間（makespan）→ 加權開始時間總和"""
+    conflict = weighted = 0
+    makespan = 0
+    for room_conflict, end, room_weighted in room_costs:
+        conflict += room_conflict
+        weighted += room_weighted
+        if end > makespan:
+            makespan = end
+    return conflict, makespan, weighted
+
+
+def local_search(plan: SchedulePlan, seed: int = 0, time_budget: float = 1.0,
+                 max_iterations: Optional[int] = None) -> Dict[str, Any]:
+    """
+    relocate / swap 鄰域的局部搜尋（接受不變差的移動以跨越平原），回傳找到的最佳解
+    
+    time_budget 為牆鐘時間上限（秒）；需要可重現的結果時請同時指定 max_iterations，
+    相同的 seed 與迭代次數一定得到相同的解。
+    """
+    rng = random.Random(seed)
+    seqs = [list(s) for s in plan.sequences]
+    room_costs = [plan.room_cost(r, s) for r, s in enumerate(seqs)]
+    # 目標（依序比較）：醫師重複排入的組數 → total_cost
+    clashes = DoctorClashes(plan, seqs)
+    cost = (clashes.total,) + total_cost(room_costs)
+    best_cost, best_seqs = cost, [list(s) for s in seqs]
+    
+    n_rooms = len(seqs)
+    started = time.perf_counter()
+    deadline = started + time_budget
+    iterations = 0
+    while n_rooms and (max_iterations is None or iterations < max_iterations):
+        # 每 64 次才檢查一次時間，避免 perf_counter 成為熱點
+        if iterations & 63 == 0 and time.perf_counter() >= deadline:
+            break
+        iterations += 1
+        
+        # 一半機率從最晚結束（或衝突最多）的房間移出手術
+        if rng.random() < 0.5:
+            a = max(range(n_rooms), key=lambda r: (room_costs[r][0], room_costs[r][1]))
+        else:
+            a = rng.randrange(n_rooms)
+        if not seqs[a]:
+            continue
+        b = rng.randrange(n_rooms)
+        i = rng.randrange(len(seqs[a]))
+        
+        new_a = list(seqs[a])
+        if rng.random() < 0.5:
+            # relocate：把 a 房第 i 台移到 b 房的任意位置
+            case = new_a.pop(i)
+            new_b = new_a if a == b else list(seqs[b])
+            new_b.insert(rng.randrange(len(new_b) + 1), case)
+        else:
+            # swap：交換 a 房第 i 台與 b 房任一台
+            new_b = new_a if a == b else list(seqs[b])
+            if not new_b:
+                continue
+            j = rng.randrange(len(new_b))
+            new_a[i], new_b[j] = new_b[j], new_a[i]
+        
+        old_a, old_b = room_costs[a], room_costs[b]
+        room_costs[a] = plan.room_cost(a, new_a)
+        if a != b:
+            room_costs[b] = plan.room_cost(b, new_b)
+        old_entries = clashes.entries(a, seqs[a]) + (clashes.entries(b, seqs[b]) if a != b else [])
+        new_entries = clashes.entries(a, new_a) + (clashes.entries(b, new_b) if a != b else [])
+        doctor_clashes = clashes.propose(old_entries, new_entries)
+        new_cost = (doctor_clashes,) + total_cost(room_costs)
+        
+        if new_cost <= cost:
+            seqs[a] = new_a
+            seqs[b] = new_b
+            cost = new_cost
+            clashes.settle(new_entries, doctor_clashes)
+            if cost < best_cost:
+                best_cost, best_seqs = cost, [list(s) for s in seqs]
+        else:
+            room_costs[a], room_costs[b] = old_a, old_b
+            clashes.settle(old_entries)
+    
+    return {
+        'cost': best_cost,
+        'sequences': best_seqs,
+        'iterations': iterations,
+        'elapsed_seconds': round(time.perf_counter() - started, 4),
+        'seed': seed,
+    }
+
+
+def restart_seed(seed: int, index: int) -> int:
+    """第 index 個重啟使用的亂數種子（只由基礎種子與序號決定，與執行順序無關）"""
+    return seed * 1_000_003 + index
+
+
+def perturb(plan: SchedulePlan, seed: int, strength: float = 0.2) -> List[List[int]]:
+    """隨機把約 strength 比例的手術移到任意房間的任意位置，作為重啟的起點"""
+    rng = random.Random(seed)
+    seqs = [list(s) for s in plan.sequences]
+    cases = [c for s in seqs for c in s]
+    if not cases or not seqs:
+        return seqs
+    for c in rng.sample(cases, max(1, int(len(cases) * strength))):
+        for s in seqs:
+            if c in s:
+                s.remove(c)
+                break
+        target = seqs[rng.randrange(len(seqs))]
+        target.insert(rng.randrange(len(target) + 1), c)
+    return seqs
+
+
+def _run_restart(plan: SchedulePlan, seed: int, index: int, time_budget: float,
+                 max_iterations: Optional[int]) -> Dict[str, Any]:
+    """單一重啟（在子程序中執行）：0 號從貪婪解出發，其餘從擾動後的貪婪解出發"""
+    worker_seed = restart_seed(seed, index)
+    if index:
+        plan = SchedulePlan(plan.ready, plan.anchor_end, plan.duration, plan.deadline,
+                            plan.weight, plan.clean_time, perturb(plan, worker_seed), plan.doctor, plan.fixed)
+    found = local_search(plan, seed=worker_seed, time_budget=time_budget, max_iterations=max_iterations)
+    found['index'] = index
+    return found
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_solver_pool(max_workers):
+    """程序層級共用的求解 process pool（子程序只在第一次使用時啟動）"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # 與 OCR 頁面擷取相同，用 spawn 避免 fork 複製背景執行緒的鎖狀態
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = max_workers
+        return _pool
+
+
+def _reset_solver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def parallel_local_search(plan: SchedulePlan, seed: int = 0, time_budget: float = 1.0,
+                          max_iterations: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    在 process pool 中同時跑 workers 個獨立的局部搜尋重啟，取最佳解
+    
+    第 i 個重啟的種子為 restart_seed(seed, i)，最佳解依 (目標值, 序號) 選出，
+    因此指定 max_iterations 時結果與 workers 的排程順序無關、可完全重現。
+    workers 為 1 時直接在本程序執行，不啟動子程序。
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    started = time.perf_counter()
+    if workers == 1:
+        runs = [_run_restart(plan, seed, 0, time_budget, max_iterations)]
+    else:
+        try:
+            pool = _get_solver_pool(workers)
+            futures = [pool.submit(_run_restart, plan, seed, i, time_budget, max_iterations)
+                       for i in range(workers)]
+            runs = [f.result() for f in futures]
+        except BrokenProcessPool as e:
+            print(f"⚠️ 平行求解失敗，改為單一程序求解: {e}")
+            _reset_solver_pool()
+            runs = [_run_restart(plan, seed, 0, time_budget, max_iterations)]
+    
+    best = min(runs, key=lambda run: (run['cost'], run['index']))
+    return {
+        'cost': best['cost'],
+        'sequences': best['sequences'],
+        'iterations': sum(run['iterations'] for run in runs),
+        'elapsed_seconds': round(time.perf_counter() - started, 4),
+        'seed': seed,
+        'workers': len(runs),
+        'best_restart': best['index'],
+        'restarts': [
+            {'seed': run['seed'], 'cost': list(run['cost']), 'iterations': run['iterations']}
+            for run in runs
+        ],
+    }
+
+
+def schedule_metrics(entries: Sequence[Tuple[Any, int, int, int, int, bool]], clean_time: int,
+                     day_minutes: int = 480) -> Dict[str, Any]:
+    """
+    以實際開始時間評估排程，貪婪與局部搜尋的結果用同一套指標比較
+    
+    entries: (房間, 開始, 時長, 原定時間, 時間上限, 是否為錨點)
+    improvement 與貪婪演算法相同：提前的總分鐘數 / 480 * 100
+    """
+    by_room = {}
+    for entry in entries:
+        by_room.setdefault(entry[0], []).append(entry)
+    
+    makespan = idle = overlap = late = saved = 0
+    for room_entries in by_room.values():
+        room_entries.sort(key=lambda e: e[1])
+        prev_ready = None
+        for _, start, duration, original, deadline, is_anchor in room_entries:
+            if prev_ready is not None:
+                if start > prev_ready:
+                    idle += start - prev_ready
+                else:
+                    overlap += prev_ready - start
+            prev_ready = start + duration + clean_time
+            makespan = max(makespan, start + duration)
+            if not is_anchor:
+                late += max(0, start - deadline)
+                saved += max(0, original - start)
+    
+    return {
+        'makespan_minutes': makespan,
+        'idle_minutes': idle,
+        'overlap_minutes': overlap,
+        'late_minutes': late,
+        'saved_minutes': saved,
+        'improvement': round((saved / day_minutes) * 100, 1),
+    }
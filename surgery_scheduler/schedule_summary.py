@@ -0,0 +1,167 @@
+from datetime import date
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from django.utils import timezone
+
+from .compact_schedule import NO_TIME, CompactSchedule, Field, minutes_to_time, time_to_minutes
+from .models import Hospital, OptimizedSchedule, Surgery
+from .persistence import day_surgeries, emergency_notes, optimization_notes
+from .schedule_versions import apply_delta, diff_schedules, updated_positions
+
+# 摘要格式版本（格式改變時遞增，舊的摘要會在讀取時重新計算）
+SUMMARY_VERSION = 1
+
+# 摘要需要的手術欄位
+SUMMARY_SURGERY_FIELDS = (
+    'operating_room__number', 'doctor__name', 'scheduled_start', 'original_start_time',
+    'patient_name', 'surgery_type', 'notes',
+)
+
+
+def room_sort_key(room: str):
+    """房號依數字排序，非數字排在最後"""
+    return int(room) if room.isdigit() else 999
+
+
+def _summarize(rows: Iterable[tuple]) -> Dict[str, Any]:
+    """
+    依手術房彙整 (房號, 開始分鐘, 原定時間, 病患, 醫師, 術式, 備註)，rows 需依開始時間排序
+    
+    每房：手術列表（依開始時間）、累計填補空檔（原定時間 - 新時間，只計提前的部分）、
+    是否有緊急手術。
+    """
+    rooms = {}
+    for number, start, original_start_time, patient_name, doctor, surgery_type, notes in rows:
+        room = rooms.setdefault(number, {
+            'room': number,
+            'count': 0,
+            'total_saved': 0,
+            'has_emergency': False,
+            'surgeries': [],
+        })
+        room['count'] += 1
+        room['surgeries'].append({
+            'start': minutes_to_time(start),
+            'original_start_time': original_start_time,
+            'patient_name': patient_name,
+            'doctor': doctor,
+            'surgery_type': surgery_type,
+            'notes': notes,
+        })
+        
+        # 檢查是否有緊急手術
+        if '🚨' in notes:
+            room['has_emergency'] = True
+        
+        # 計算節省時間
+        if original_start_time:
+            try:
+                diff = time_to_minutes(original_start_time) - start
+            except ValueError:
+                continue
+            if diff > 0:
+                room['total_saved'] += diff
+    
+    return {
+        'version': SUMMARY_VERSION,
+        'total': sum(room['count'] for room in rooms.values()),
+        'rooms': [rooms[k] for k in sorted(rooms, key=room_sort_key)],
+    }
+
+
+def summarize_surgeries(surgeries: Iterable[Surgery]) -> Dict[str, Any]:
+    """
+    依手術房彙整資料表內的手術（結果頁與 JSON API 共用）
+    
+    surgeries 需依 scheduled_start 排序並帶有 operating_room、doctor。
+    """
+    def rows():
+        for s in surgeries:
+            start = timezone.localtime(s.scheduled_start)
+            yield (s.operating_room.number, start.hour * 60 + start.minute, s.original_start_time,
+                   s.patient_name, s.doctor.name, s.surgery_type, s.notes or '')
+    return _summarize(rows())
+
+
+def summarize_schedule(schedule: CompactSchedule, notes: Sequence[str]) -> Dict[str, Any]:
+    """
+    依手術房彙整一份排程（欄位預設值與 SchedulePersistence 寫入資料表時相同）
+    
+    notes 為各位置寫入資料表時的備註（見 version_notes）。
+    """
+    positions = sorted((p for p, s in enumerate(schedule.surgeries) if s.start != NO_TIME),
+                       key=lambda p: schedule.surgeries[p].start)
+    rows = []
+    for p in positions:
+        s = schedule.surgeries[p]
+        rows.append((
+            str(schedule.room_name(s)), s.start,
+            s.original_time_str if s.has(Field.ORIGINAL_TIME) else None,
+            s.patient if s.has(Field.PATIENT) else '不明病患',
+            schedule.doctor_name(s),
+            s.surgery_type if s.has(Field.SURGERY_TYPE) else '一般手術',
+            notes[p],
+        ))
+    return _summarize(rows)
+
+
+def version_notes(optimized: OptimizedSchedule) -> Tuple[CompactSchedule, List[str]]:
+    """
+    版本的排程與各位置寫入資料表時的備註
+    
+    優化版本整批以 optimization_notes 寫入；緊急插入版本只重寫與父版本不同及新增的位置
+    （emergency_notes），其餘沿用父版本的備註。
+    """
+    chain = []
+    node = optimized
+    while node.parent_id is not None and 'emergency_insertion' in node.optimized_data:
+        chain.append(node)
+        node = node.parent
+    
+    data = node.get_optimized_data().get('optimized_data', [])
+    schedule = CompactSchedule.from_dicts(data)
+    builder = emergency_notes if 'emergency_insertion' in node.optimized_data else optimization_notes
+    notes = [builder(schedule, s) for s in schedule.surgeries]
+    for version in reversed(chain):
+        parent_data = data
+        if version.delta is not None:
+            delta = version.delta
+            data = apply_delta(parent_data, delta)
+        else:
+            data = version.optimized_data.get('optimized_data', [])
+            delta = diff_schedules(parent_data, data)
+        schedule = CompactSchedule.from_dicts(data)
+        notes.extend([''] * (len(data) - len(parent_data)))
+        for p in updated_positions(delta) + list(range(len(parent_data), len(data))):
+            notes[p] = emergency_notes(schedule, schedule.surgeries[p])
+    return schedule, notes
+
+
+def build_summary(hospital_id, day: date = None) -> Dict[str, Any]:
+    """
+    以資料表內本院區某一天（版本的 schedule_date）的手術建立摘要
+    
+    在寫入排程的同一個 transaction 內呼叫；day 為 None（沒有日期的舊版本）時彙整全部手術。
+    """
+    surgeries = day_surgeries(hospital_id, day).select_related(
+        'operating_room', 'doctor'
+    ).only(*SUMMARY_SURGERY_FIELDS).order_by('scheduled_start')
+    return summarize_surgeries(surgeries)
+
+
+def get_summary(optimized: OptimizedSchedule) -> Dict[str, Any]:
+    """
+    版本的摘要；版本建立後內容不會再變，摘要在儲存時算好一次即可
+    
+    舊版本（沒有摘要或格式過舊）在第一次讀取時計算並存回：資料表只保存院區目前的排程，
+    所以只有目前版本以資料表計算，其他版本以版本自己的排程資料計算。
+    """
+    summary = optimized.summary
+    if summary is None or summary.get('version') != SUMMARY_VERSION:
+        if Hospital.objects.filter(id=optimized.hospital_id, current_schedule_id=optimized.id).exists():
+            summary = build_summary(optimized.hospital_id, optimized.schedule_date)
+        else:
+            summary = summarize_schedule(*version_notes(optimized))
+        OptimizedSchedule.objects.filter(id=optimized.id).update(summary=summary)
+        optimized.summary = summary
+    return summary
@@ -0,0 +1,73 @@
+from typing import Any, Dict, List
+
+# 每隔幾個差異版本存一次完整快照，限制還原時需要走的 parent 鏈長度
+SNAPSHOT_INTERVAL = 10
+
+_REMOVED = '__removed__'
+
+
+def diff_schedules(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    計算兩個排程版本的差異（依位置比對）
+    
+    新排程必須保留父版本的順序，只能修改既有項目或在尾端新增
+    （EmergencySurgeryInserter 的輸出即是如此）。
+    """
+    if len(new) < len(old):
+        raise ValueError('新排程不可少於父版本（差異只支援修改與新增）')
+    
+    updated = {}
+    for i, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        change = {k: v for k, v in after.items() if k not in before or before[k] != v}
+        removed = [k for k in before if k not in after]
+        if removed:
+            change[_REMOVED] = removed
+        updated[str(i)] = change
+    
+    return {'updated': updated, 'appended': new[len(old):]}
+
+
+def apply_delta(base: List[Dict[str, Any]], delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把差異套用到父版本，回傳新的排程列表（不修改 base）"""
+    result = list(base)
+    for key, change in delta.get('updated', {}).items():
+        i = int(key)
+        item = dict(result[i])
+        for k in change.get(_REMOVED, ()):
+            item.pop(k, None)
+        item.update((k, v) for k, v in change.items() if k != _REMOVED)
+        result[i] = item
+    result.extend(delta.get('appended', []))
+    return result
+
+
+def updated_positions(delta: Dict[str, Any]) -> List[int]:
+    return sorted(int(k) for k in delta.get('updated', {}))
+
+
+def child_version_fields(parent, schedule: List[Dict[str, Any]], delta: Dict[str, Any],
+                         meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    建立子版本 OptimizedSchedule 所需的欄位
+    
+    一般只存差異（optimized_data 只放 meta）；差異鏈達到 SNAPSHOT_INTERVAL 時改存完整快照。
+    子版本沿用父版本的排程日期。
+    """
+    depth = parent.delta_depth + 1
+    if depth >= SNAPSHOT_INTERVAL:
+        return {
+            'parent': parent,
+            'schedule_date': parent.schedule_date,
+            'optimized_data': dict(meta, optimized_data=schedule),
+            'delta': None,
+            'delta_depth': 0,
+        }
+    return {
+        'parent': parent,
+        'schedule_date': parent.schedule_date,
+        'optimized_data': dict(meta),
+        'delta': delta,
+        'delta_depth': depth,
+    }
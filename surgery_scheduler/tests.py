@@ -0,0 +1,875 @@
+import contextlib
+import copy
+import csv
+import io
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from surgery_scheduler.compact_schedule import CompactSchedule, time_to_minutes
+from surgery_scheduler.models import Hospital, OptimizedSchedule, ScheduleUpload, Surgery
+from surgery_scheduler.persistence import (
+    SchedulePersistence, StaleScheduleVersion, commit_version, current_version, day_surgeries,
+    optimization_notes, publish_version,
+)
+from surgery_scheduler.schedule_optimizer import OptimizationConfig, ScheduleOptimizer
+from surgery_scheduler.schedule_summary import SUMMARY_VERSION, build_summary, get_summary
+
+SURGERY_TYPES = [
+    'L4-5 DISKECTOMY', 'SPINAL FUSION', 'CRANIOTOMY', 'PORT-A REMOVAL',
+    'TRIGGER RELEASE', 'CTS RELEASE', 'LAMINECTOMY', 'V-P SHUNT', 'EXCISION',
+]
+DOCTORS = ['陳志明', '廖啓耀', '林育德', '施育彤', '王建明', '黃赞文', '待核對']
+
+
+def quiet(func, *args, **kwargs):
+    """執行時不輸出排程過程的 print"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def make_day(rooms: int, cases: int, seed: int = 0, first_room: int = 1):
+    """與 OCR 輸出格式相同的排程（房號從 first_room 起連續編號）"""
+    rng = random.Random(seed)
+    data = []
+    for r in range(rooms):
+        room = str(first_room + r)
+        count = cases // rooms + (1 if r < cases % rooms else 0)
+        t = 8 * 60
+        for j in range(count):
+            tf = j > 0 and rng.random() < 0.1
+            time_str = 'TF' if tf else f"{t // 60:02d}:{t % 60:02d}"
+            data.append({
+                'room': room, 'time': time_str, 'patient': f'病患{room}-{j}',
+                'doctor': rng.choice(DOCTORS), 'surgery_type': rng.choice(SURGERY_TYPES),
+                'original_time': time_str, 'original_room': room, 'sort_key': 2 * j + 1,
+            })
+            t = min(t + rng.choice([30, 45, 60, 90, 120, 180]), 23 * 60 + 30)
+    return data
+
+
+def write_schedule_pdf(path, day, lines_per_page=48):
+    """把排程寫成 ScheduleOCRProcessor 可解析的 PDF（連續排版，房間區塊會跨頁），回傳頁數"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+    
+    if 'STSong-Light' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    c = canvas.Canvas(str(path), invariant=1)
+    lines = []
+    room = None
+    for i, surgery in enumerate(day):
+        if surgery['room'] != room:
+            room = surgery['room']
+            lines.append(f'房間：{room}')
+        lines += [surgery['time'], f"{surgery['patient']} {surgery['doctor']} 推床",
+                  f"S{1000 + i} {surgery['surgery_type']}"]
+    for start in range(0, len(lines), lines_per_page):
+        if start:
+            c.showPage()
+        c.setFont('STSong-Light', 10)
+        for row, text in enumerate(lines[start:start + lines_per_page]):
+            c.drawString(40, 800 - row * 16, text)
+    c.save()
+    return (len(lines) + lines_per_page - 1) // lines_per_page
+
+
+def seed_schedule(hospital, cases, data=None):
+    """與 ScheduleOptimizationView 相同的寫入（cases 台、房號 11 起；或直接給定 data），回傳發布的 OptimizedSchedule"""
+    if data is None:
+        data = make_day(max(2, cases // 12), cases, seed=cases, first_room=11)
+    upload = ScheduleUpload.objects.create(
+        hospital=hospital, uploaded_file='schedules/synthetic.pdf', extracted_data=data,
+        processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+    )
+    result = ScheduleOptimizer().optimize(data, hospital.id)
+    today = timezone.localdate()
+    SchedulePersistence(hospital.id, today).replace_schedule(
+        CompactSchedule.from_dicts(result['optimized_data']), optimization_notes
+    )
+    optimized = OptimizedSchedule.objects.create(
+        hospital=hospital, original_schedule=upload, optimized_data=result,
+        utilization_improvement=result.get('improvement', 0), schedule_date=today,
+        summary=build_summary(hospital.id, today),
+    )
+    publish_version(hospital.id, optimized)
+    return optimized
+
+
+class WithoutML:
+    """測試只用知識庫估計時長（結果不受 ml_models/*.pkl 影響）"""
+    
+    def setUp(self):
+        super().setUp()
+        self._use_ml = OptimizationConfig.USE_ML_ANALYSIS
+        OptimizationConfig.USE_ML_ANALYSIS = False
+        self.addCleanup(setattr, OptimizationConfig, 'USE_ML_ANALYSIS', self._use_ml)
+        self.optimizer = quiet(ScheduleOptimizer)
+
+
+class LocalSearchDoctorConflictTests(WithoutML, SimpleTestCase):
+    """局部搜尋不可讓醫師重複排入兩間房的組數比貪婪排程多"""
+    
+    def test_solver_never_increases_doctor_conflicts(self):
+        for seed in range(30):
+            with self.subTest(seed=seed):
+                result = quiet(self.optimizer.optimize, copy.deepcopy(make_day(12, 100, seed)),
+                               solver='local_search', seed=seed, max_iterations=1500, workers=1, time_budget=30)
+                solver = result['solver']
+                self.assertLessEqual(solver['result']['doctor_conflicts'], solver['greedy']['doctor_conflicts'])
+                self.assertEqual(result['doctor_conflicts'], solver['result']['doctor_conflicts'])
+
+
+class EmergencyNotBeforeTests(WithoutML, SimpleTestCase):
+    """緊急手術不可排入 not_before（現在時間）之前已經過去的空檔"""
+    
+    # 第 1 房 09:20–13:00 有空檔；第 2 房整天滿檔
+    DAY = [
+        {'room': '1', 'time': '08:00', 'patient': '王小明', 'doctor': '陳志明', 'surgery_type': 'TRIGGER RELEASE', 'duration': 60},
+        {'room': '1', 'time': '13:00', 'patient': '林美玲', 'doctor': '陳志明', 'surgery_type': 'TRIGGER RELEASE', 'duration': 60},
+        {'room': '2', 'time': '08:00', 'patient': '陳建宏', 'doctor': '林育德', 'surgery_type': 'SPINAL FUSION', 'duration': 600},
+    ]
+    
+    def insert(self, not_before, urgency_level):
+        emergency = {'patient': '張淑芬', 'doctor': '王建明', 'surgery_type': 'TRIGGER RELEASE',
+                     'urgency_level': urgency_level}
+        return quiet(self.optimizer.insert_emergency_surgery, copy.deepcopy(self.DAY), emergency, not_before)
+    
+    def test_morning_uses_earliest_gap(self):
+        info = self.insert(8 * 60, 5)['insertion_info']
+        self.assertEqual((info['room'], info['time']), ('1', '09:20'))
+    
+    def test_find_best_room_reuses_given_index(self):
+        from surgery_scheduler.schedule_optimizer import _free_index
+        inserter = self.optimizer.emergency_inserter
+        schedule = CompactSchedule.from_dicts(copy.deepcopy(self.DAY))
+        free = _free_index(schedule, 8 * 60, OptimizationConfig.CLEAN_TIME)
+        with mock.patch('surgery_scheduler.schedule_optimizer._free_index') as build:
+            found = [inserter.find_best_room(schedule, '王建明', 60, urgency_level=level, not_before=8 * 60, free=free)
+                     for level in (1, 5)]
+        build.assert_not_called()
+        self.assertEqual(found, [inserter.find_best_room(schedule, '王建明', 60, urgency_level=level, not_before=8 * 60)
+                                 for level in (1, 5)])
+    
+    def test_afternoon_skips_past_gaps(self):
+        for urgency_level in range(1, 6):
+            with self.subTest(urgency_level=urgency_level):
+                result = self.insert(15 * 60, urgency_level)
+                self.assertGreaterEqual(time_to_minutes(result['insertion_info']['time']), 15 * 60)
+                self.assertEqual(result['insertion_info']['affected_surgeries'], 0)
+
+
+class EmergencyViewNotBeforeTests(WithoutML, TestCase):
+    """緊急插入的 view 以現在的當地時間作為最早開始時間"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        quiet(seed_schedule, self.hospital, 0, copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+    
+    def post_at(self, hour, minute=0):
+        now = datetime(2026, 1, 5, hour, minute, tzinfo=dt_timezone.utc)
+        with mock.patch('surgery_scheduler.views.timezone.localtime', return_value=now):
+            response = quiet(self.client.post, '/emergency/', {
+                'patient_name': '張淑芬', 'doctor_name': '王建明',
+                'surgery_type': 'TRIGGER RELEASE', 'urgency_level': '5',
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['insertion_info']
+    
+    def test_afternoon_request_is_not_placed_in_the_morning(self):
+        self.assertGreaterEqual(time_to_minutes(self.post_at(15, 10)['time']), 15 * 60 + 10)
+    
+    def test_before_opening_starts_at_opening(self):
+        self.assertGreaterEqual(time_to_minutes(self.post_at(6)['time']), 8 * 60)
+
+
+class VersionSummaryTests(WithoutML, TestCase):
+    """沒有摘要的舊版本以版本自己的排程計算摘要，不可用資料表內目前的排程"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.old = quiet(seed_schedule, self.hospital, 0, copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        self.head = quiet(seed_schedule, self.hospital, 24)
+        self.expected = self.old.summary
+        OptimizedSchedule.objects.filter(id=self.old.id).update(summary=None)
+    
+    def test_old_version_uses_its_own_data(self):
+        old = OptimizedSchedule.objects.get(id=self.old.id)
+        self.assertEqual(get_summary(old), self.expected)
+        self.assertEqual(OptimizedSchedule.objects.get(id=self.old.id).summary, self.expected)
+    
+    def test_head_version_is_unchanged(self):
+        self.assertEqual(get_summary(self.head), self.head.summary)
+    
+    def test_emergency_version_keeps_notes_of_unchanged_rows(self):
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+        response = quiet(self.client.post, '/emergency/', {
+            'patient_name': '張淑芬', 'doctor_name': '王建明',
+            'surgery_type': 'TRIGGER RELEASE', 'urgency_level': '3',
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.hospital.refresh_from_db()
+        emergency = OptimizedSchedule.objects.get(id=self.hospital.current_schedule_id)
+        expected = emergency.summary
+        quiet(seed_schedule, self.hospital, 12)
+        OptimizedSchedule.objects.filter(id=emergency.id).update(summary=None)
+        self.assertEqual(get_summary(OptimizedSchedule.objects.get(id=emergency.id)), expected)
+
+
+class ScheduleStreamHospitalTests(TestCase):
+    """訂閱其他院區的推播（開啟其他院區的結果頁）不可切換 session 目前的院區"""
+    
+    def setUp(self):
+        self.first = Hospital.objects.create(name='院區1')
+        self.second = Hospital.objects.create(name='院區2')
+    
+    async def test_stream_does_not_switch_session_hospital(self):
+        await self.async_client.get(f'/upload/?hospital={self.first.id}')
+        response = await self.async_client.get(f'/live/schedule/?hospital={self.second.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        response = await self.async_client.get('/upload/')
+        self.assertEqual(response.context['hospital_id'], self.first.id)
+    
+    async def test_unknown_hospital_is_not_found(self):
+        response = await self.async_client.get('/live/schedule/?hospital=999')
+        self.assertEqual(response.status_code, 404)
+
+
+class ReadOnlyHospitalTests(TestCase):
+    """輪詢的 GET 不寫入 session、不建立院區；只有上傳排程時才建立預設院區"""
+    
+    def test_polling_creates_no_hospital(self):
+        self.assertEqual(self.client.get('/api/schedule/').status_code, 404)
+        self.assertEqual(self.client.get('/upload/1/status/').status_code, 404)
+        self.assertEqual(self.client.get('/upload/').status_code, 200)
+        self.assertFalse(Hospital.objects.exists())
+        self.assertNotIn('hospital_id', self.client.session)
+        
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media), \
+                mock.patch('surgery_scheduler.ocr_jobs.complete_from_cache', return_value=True):
+            pdf = io.BytesIO(b'%PDF-1.4')
+            pdf.name = 'schedule.pdf'
+            self.client.post('/upload/', {'uploaded_file': pdf})
+        hospital = Hospital.objects.get()
+        self.assertEqual(self.client.session['hospital_id'], hospital.id)
+    
+    def test_polling_other_hospital_keeps_session(self):
+        first = Hospital.objects.create(name='院區1')
+        second = Hospital.objects.create(name='院區2')
+        self.client.get(f'/upload/?hospital={second.id}')
+        self.client.get(f'/api/schedule/?hospital={first.id}')
+        self.assertEqual(self.client.session['hospital_id'], second.id)
+        self.assertEqual(self.client.get('/api/schedule/?hospital=999').status_code, 404)
+        self.assertEqual(self.client.get('/upload/').context['hospital_id'], second.id)
+
+
+class HorizonViewTests(WithoutML, TestCase):
+    """多日排程：狀態存在資料庫，修改週四只重算週四之後；單日排程不可刪除其他天的手術"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+        # 下下週一起算，不與今天的單日排程重疊
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday() + 7)
+        self.week = [self.monday + timedelta(days=i) for i in range(5)]
+    
+    def upload(self, days):
+        data = [dict(case, date=day.isoformat()) for day in days for case in EmergencyNotBeforeTests.DAY]
+        return ScheduleUpload.objects.create(
+            hospital=self.hospital, uploaded_file='schedules/test.pdf', extracted_data=data,
+            processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+        )
+    
+    def post(self, upload):
+        response = quiet(self.client.post, f'/horizon/{upload.id}/', {'start': self.monday.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def rows(self, day):
+        return set(day_surgeries(self.hospital.id, day).values_list('id', flat=True))
+    
+    def test_changing_thursday_keeps_earlier_days(self):
+        first = self.post(self.upload(self.week))
+        self.assertEqual(len(first['recomputed']), 7)
+        monday_rows = self.rows(self.monday)
+        self.assertEqual(len(monday_rows), 3)
+        
+        second = self.post(self.upload([self.week[3]]))
+        self.assertEqual(second['recomputed'], [self.week[3].isoformat()])
+        self.assertEqual(self.rows(self.monday), monday_rows)
+        version = OptimizedSchedule.objects.get(id=second['versions'][self.week[3].isoformat()])
+        self.assertEqual(version.schedule_date, self.week[3])
+        self.assertEqual(get_summary(version)['total'], 3)
+    
+    def test_single_day_optimization_keeps_horizon_days(self):
+        self.post(self.upload(self.week))
+        week_rows = set().union(*(self.rows(day) for day in self.week))
+        
+        upload = self.upload([])
+        upload.extracted_data = copy.deepcopy(EmergencyNotBeforeTests.DAY)
+        upload.save()
+        quiet(self.client.post, f'/optimize/{upload.id}/')
+        self.hospital.refresh_from_db()
+        head = self.hospital.current_schedule
+        self.assertEqual(head.schedule_date, timezone.localdate())
+        self.assertEqual(head.summary['total'], 3)
+        self.assertEqual(set().union(*(self.rows(day) for day in self.week)), week_rows)
+
+
+class HorizonHeadTests(WithoutML, TestCase):
+    """多日排程重算今天時成為目前版本；在它之上插入的緊急手術保留在多日狀態，重算該天時不會遺失"""
+    
+    def setUp(self):
+        super().setUp()
+        workdays = mock.patch.object(OptimizationConfig, 'WORKDAYS', tuple(range(7)))
+        workdays.start()
+        self.addCleanup(workdays.stop)
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.today = timezone.localdate()
+        self.single = quiet(seed_schedule, self.hospital, 0, copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+    
+    def horizon(self, cases):
+        upload = ScheduleUpload.objects.create(
+            hospital=self.hospital, uploaded_file='schedules/test.pdf', extracted_data=cases,
+            processed=True, status=ScheduleUpload.STATUS_DONE, progress=100,
+        )
+        response = quiet(self.client.post, f'/horizon/{upload.id}/', {'start': self.today.isoformat(), 'days': '1'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['versions'][self.today.isoformat()]
+    
+    def emergency(self):
+        now = datetime.combine(self.today, datetime.min.time(), tzinfo=dt_timezone.utc) + timedelta(hours=8)
+        with mock.patch('surgery_scheduler.views.timezone.localtime', return_value=now):
+            response = quiet(self.client.post, '/emergency/', {
+                'patient_name': '張淑芬', 'doctor_name': '王建明',
+                'surgery_type': 'TRIGGER RELEASE', 'urgency_level': '5',
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['optimized_id']
+    
+    def head(self):
+        self.hospital.refresh_from_db()
+        return self.hospital.current_schedule
+    
+    def test_horizon_version_becomes_head_and_matches_table(self):
+        version_id = self.horizon(copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        head = self.head()
+        self.assertEqual(head.id, version_id)
+        self.assertEqual(day_surgeries(self.hospital.id, self.today).count(), len(head.get_optimized_data()['optimized_data']))
+        
+        rows = set(day_surgeries(self.hospital.id, self.today).values_list('id', flat=True))
+        child = OptimizedSchedule.objects.get(id=self.emergency())
+        self.assertEqual(child.parent_id, version_id)
+        # 以父版本為基準只寫入差異：原有的列沒有被整批重建
+        self.assertLessEqual(rows, set(day_surgeries(self.hospital.id, self.today).values_list('id', flat=True)))
+    
+    def test_recomputing_the_day_keeps_the_emergency(self):
+        self.horizon(copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        self.emergency()
+        version_id = self.horizon(copy.deepcopy(EmergencyNotBeforeTests.DAY[:2]))
+        head = self.head()
+        self.assertEqual(head.id, version_id)
+        patients = {item['patient'] for item in head.get_optimized_data()['optimized_data']}
+        self.assertEqual(patients, {'王小明', '林美玲', '張淑芬'})
+        self.assertEqual(set(day_surgeries(self.hospital.id, self.today).values_list('patient_name', flat=True)), patients)
+    
+    def test_apply_changes_rejects_rows_of_another_version(self):
+        parent = self.single.get_optimized_data()['optimized_data']
+        other = [dict(item, patient=f"{item['patient']}X") for item in parent]
+        changed = [dict(item, notes='x') for item in parent]
+        persistence = SchedulePersistence(self.hospital.id, self.today)
+        schedule = CompactSchedule.from_dicts(changed)
+        self.assertFalse(persistence.apply_changes(schedule, [0], other, optimization_notes))
+        self.assertTrue(persistence.apply_changes(schedule, [0], parent, optimization_notes))
+
+
+class ConcurrentHospitalCommitTests(WithoutML, TransactionTestCase):
+    """兩個院區各有多個請求同時插入緊急手術：每筆都寫入自己院區的目前版本，不影響其他院區"""
+    
+    THREADS = 2
+    PER_THREAD = 2
+    
+    def post_emergencies(self, hospital_id, thread, errors):
+        from django.db import connection
+        client = Client()
+        try:
+            client.get(f'/upload/?hospital={hospital_id}')
+            for i in range(self.PER_THREAD):
+                response = client.post('/emergency/', {
+                    'patient_name': f'急診{hospital_id}-{thread}-{i}', 'doctor_name': f'值班醫師{hospital_id}',
+                    'surgery_type': 'Debridement', 'urgency_level': '1',
+                }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                if response.status_code != 200:
+                    errors.append((hospital_id, thread, i, response.status_code))
+        except Exception as e:  # 在主執行緒檢查
+            errors.append((hospital_id, thread, repr(e)))
+        finally:
+            connection.close()
+    
+    def assertVersionChain(self, hospital_id, root_id, expected_patients):
+        """目前版本包含所有緊急手術、版本鏈是一條直線回到 root，且資料表與目前版本一致"""
+        head = current_version(hospital_id)
+        schedule = head.get_optimized_data()['optimized_data']
+        self.assertLessEqual(expected_patients, {item.get('patient') for item in schedule})
+        chain = []
+        node = head
+        while node.id != root_id:
+            chain.append(node.id)
+            node = node.parent
+            self.assertIsNotNone(node, '目前版本的 parent 鏈沒有回到優化版本')
+        self.assertEqual(len(chain), len(expected_patients))
+        self.assertCountEqual(
+            OptimizedSchedule.objects.filter(hospital_id=hospital_id).exclude(id=root_id).values_list('id', flat=True),
+            chain,
+        )
+        rows = Surgery.objects.filter(hospital_id=hospital_id)
+        self.assertEqual(rows.count(), len(schedule))
+        self.assertLessEqual(expected_patients, set(rows.values_list('patient_name', flat=True)))
+    
+    def test_concurrent_commits_are_isolated_per_hospital(self):
+        roots = {}
+        for i in range(2):
+            hospital = Hospital.objects.create(name=f'院區{i + 1}')
+            data = make_day(4, 30, seed=i, first_room=10 * (i + 1) + 1)
+            roots[hospital.id] = quiet(seed_schedule, hospital, 0, data).id
+        
+        errors = []
+        threads = [threading.Thread(target=self.post_emergencies, args=(hospital_id, t, errors))
+                   for hospital_id in roots for t in range(self.THREADS)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(errors, [])
+        
+        for hospital_id, root_id in roots.items():
+            with self.subTest(hospital=hospital_id):
+                expected = {f'急診{hospital_id}-{t}-{i}' for t in range(self.THREADS) for i in range(self.PER_THREAD)}
+                self.assertVersionChain(hospital_id, root_id, expected)
+                surgeries = Surgery.objects.filter(hospital_id=hospital_id)
+                self.assertFalse(surgeries.exclude(operating_room__hospital_id=hospital_id).exists())
+                self.assertFalse(surgeries.exclude(doctor__hospital_id=hospital_id).exists())
+                self.assertFalse(surgeries.filter(patient_name__startswith='急診').exclude(
+                    patient_name__startswith=f'急診{hospital_id}-').exists())
+
+
+class ScheduleReadQueryTests(WithoutML, TestCase):
+    """結果頁與 JSON API 的查詢數固定，不隨台數增加；304 只確認院區與版本，不讀取排程內容"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.small = quiet(seed_schedule, self.hospital, 12)
+        self.large = quiet(seed_schedule, self.hospital, 120)
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+    
+    def test_result_page(self):
+        for optimized in (self.small, self.large):
+            with self.subTest(cases=len(optimized.optimized_data['optimized_data'])):
+                with self.assertNumQueries(3):
+                    response = self.client.get(f'/result/{optimized.id}/')
+                self.assertEqual(response.status_code, 200)
+    
+    def test_not_modified_for_version(self):
+        response = self.client.get(f'/api/schedule/{self.large.id}/')
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/schedule/{self.large.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_not_modified_for_current(self):
+        response = self.client.get('/api/schedule/')
+        self.assertEqual(response.json()['optimized_id'], self.large.id)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/schedule/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class VersionHospitalScopeTests(WithoutML, TestCase):
+    """以版本 id 讀取的頁面只能讀取目前院區的版本"""
+    
+    def setUp(self):
+        super().setUp()
+        own = Hospital.objects.create(name='院區1')
+        other = Hospital.objects.create(name='院區2')
+        quiet(seed_schedule, own, 12)
+        self.other = quiet(seed_schedule, other, 12)
+        self.client.get(f'/upload/?hospital={own.id}')
+    
+    def test_other_hospital_versions_are_not_found(self):
+        etag = f'"schedule-{self.other.id}-v{SUMMARY_VERSION}"'
+        for url, headers in [
+            (f'/result/{self.other.id}/', {}),
+            (f'/api/schedule/{self.other.id}/', {}),
+            (f'/api/schedule/{self.other.id}/', {'HTTP_IF_NONE_MATCH': etag}),
+            (f'/export/{self.other.id}/', {}),
+        ]:
+            with self.subTest(url=url, **headers):
+                self.assertEqual(self.client.get(url, **headers).status_code, 404)
+
+
+class PDFRoomOrderTests(SimpleTestCase):
+    """PDF 各房依開始時間列出（插入空檔的緊急手術在排程列表尾端）"""
+    
+    def test_rooms_are_listed_by_start_time(self):
+        import pdfplumber
+        from surgery_scheduler.pdf_exporter import SchedulePDFExporter
+        data = [
+            {'room': '1', 'time': '08:00', 'doctor': '陳志明', 'surgery_type': 'TRIGGER RELEASE'},
+            {'room': '1', 'time': '13:00', 'doctor': '陳志明', 'surgery_type': 'TRIGGER RELEASE'},
+            {'room': '2', 'time': '08:00', 'doctor': '林育德', 'surgery_type': 'SPINAL FUSION'},
+            {'room': '1', 'time': '09:20', 'doctor': '王建明', 'surgery_type': 'TRIGGER RELEASE'},
+        ]
+        output = io.BytesIO()
+        SchedulePDFExporter().export({'optimized_data': data}, output)
+        output.seek(0)
+        with pdfplumber.open(output) as pdf:
+            text = '\n'.join(page.extract_text() for page in pdf.pages)
+        times = [line.split()[0] for line in text.splitlines() if line[:2].isdigit() and line[2:3] == ':']
+        self.assertEqual(times, ['08:00', '09:20', '13:00', '08:00'])
+
+
+class ICalUIDTests(WithoutML, TestCase):
+    """iCalendar 的 UID 不隨重新優化（資料表重建、房號與時間調整）改變"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+    
+    def uids(self):
+        content = b''.join(self.client.get('/export/schedule.ics').streaming_content).decode('utf-8')
+        return [line[len('UID:'):] for line in content.split('\r\n') if line.startswith('UID:')]
+    
+    def test_uids_survive_reoptimization(self):
+        data = make_day(3, 24, seed=1, first_room=11)
+        quiet(seed_schedule, self.hospital, 0, copy.deepcopy(data))
+        first = self.uids()
+        self.assertEqual(len(set(first)), len(data))
+        
+        # 順序不同的同一份排程：重新建立的手術 id、房號與時間都可能不同
+        quiet(seed_schedule, self.hospital, 0, copy.deepcopy(data[::-1]))
+        self.assertEqual(set(self.uids()), set(first))
+
+
+class ScheduleExportVersionTests(WithoutML, TestCase):
+    """?version= 匯出該版本的內容，與它當時寫入資料表的內容相同；不指定則匯出資料表"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+    
+    def rows(self, query=''):
+        response = self.client.get(f'/export/schedule.csv{query}')
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        # 編號欄：資料表是 Surgery.id、版本是位置，不比較
+        return sorted(tuple(row[1:]) for row in csv.reader(io.StringIO(content)))
+    
+    def test_version_matches_rows_written(self):
+        first = quiet(seed_schedule, self.hospital, 24)
+        live = self.rows()
+        self.assertEqual(len(live), 24 + 1)
+        
+        quiet(seed_schedule, self.hospital, 36)
+        self.assertEqual(len(self.rows()), 36 + 1)
+        self.assertEqual(self.rows(f'?version={first.id}'), live)
+    
+    def test_spreadsheet_is_served_as_xml(self):
+        optimized = quiet(seed_schedule, self.hospital, 12)
+        response = self.client.get(f'/export/schedule.xml?version={optimized.id}')
+        self.assertEqual(response['Content-Type'], 'application/xml; charset=utf-8')
+        self.assertIn(f'v{optimized.id}.xml', response['Content-Disposition'])
+        self.assertIn(b'urn:schemas-microsoft-com:office:spreadsheet', b''.join(response.streaming_content))
+        self.assertEqual(self.client.get('/export/schedule.xls').status_code, 404)
+        
+        other = Hospital.objects.create(name='院區2')
+        foreign = quiet(seed_schedule, other, 12)
+        self.assertEqual(self.client.get(f'/export/schedule.csv?version={foreign.id}').status_code, 404)
+
+
+class OCRReclaimTests(TestCase):
+    """解析中的工作心跳逾時（程序重啟或當機）時改回等待中並重新送出；仍在更新的工作不動"""
+    
+    def setUp(self):
+        from surgery_scheduler.ocr_jobs import OCRJobQueue
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.queue = OCRJobQueue(max_workers=1)
+        self.addCleanup(self.queue._executor.shutdown)
+        now = timezone.now()
+        self.stale = self.upload(now - timedelta(hours=1))
+        self.legacy = self.upload(None)
+        self.running = self.upload(now)
+    
+    def upload(self, heartbeat_at):
+        return ScheduleUpload.objects.create(
+            hospital=self.hospital, uploaded_file='schedules/test.pdf', progress=40,
+            status=ScheduleUpload.STATUS_PROCESSING, heartbeat_at=heartbeat_at,
+        )
+    
+    def status(self, upload):
+        return ScheduleUpload.objects.values_list('status', flat=True).get(id=upload.id)
+    
+    def test_resume_pending_reclaims_stale_jobs(self):
+        with mock.patch.object(self.queue, 'submit') as submit:
+            quiet(self.queue.resume_pending)
+        self.assertEqual(sorted(c.args[0] for c in submit.call_args_list), sorted([self.stale.id, self.legacy.id]))
+        self.assertEqual(self.status(self.stale), ScheduleUpload.STATUS_PENDING)
+        self.assertEqual(self.status(self.running), ScheduleUpload.STATUS_PROCESSING)
+    
+    def test_status_poll_requeues_its_stale_job(self):
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+        with mock.patch('surgery_scheduler.ocr_jobs.get_ocr_queue', return_value=self.queue), \
+                mock.patch.object(self.queue, 'submit') as submit:
+            response = quiet(self.client.get, f'/upload/{self.stale.id}/status/')
+            self.assertEqual(response.json()['status'], ScheduleUpload.STATUS_PENDING)
+            quiet(self.client.get, f'/upload/{self.running.id}/status/')
+        submit.assert_called_once_with(self.stale.id)
+        self.assertEqual(self.status(self.legacy), ScheduleUpload.STATUS_PROCESSING)
+
+
+class MLBatchAnalysisTests(SimpleTestCase):
+    """整批推論（analyze_batch）與逐筆推論（analyze_surgery）的結果完全相同"""
+    
+    def setUp(self):
+        from surgery_scheduler.ml_analyzer import MLSurgeryAnalyzer
+        from surgery_scheduler.prediction_cache import PredictionCache
+        self.batch = quiet(MLSurgeryAnalyzer)
+        self.single = quiet(MLSurgeryAnalyzer)
+        self.assertTrue(self.batch.is_ready())
+        # 各自使用空的快取，兩邊都實際執行模型
+        self.batch.prediction_cache = PredictionCache()
+        self.single.prediction_cache = PredictionCache()
+    
+    def test_batch_matches_per_row(self):
+        day = make_day(4, 40, seed=3)
+        # 重複的特徵組合、接台（沒有時間）與缺少術式的項目
+        surgeries = day + day[:5] + [{'room': '1', 'doctor': '陳志明'}]
+        expected = [quiet(self.single.analyze_surgery, s) for s in surgeries]
+        self.assertEqual(quiet(self.batch.analyze_batch, surgeries), expected)
+        self.assertIsNone(expected[-1])
+        self.assertIsNotNone(expected[0])
+
+
+class CompactScheduleRoundTripTests(WithoutML, SimpleTestCase):
+    """CompactSchedule.from_dicts → to_dicts 無損（含未知欄位與型別不符的值）"""
+    
+    def assertRoundTrip(self, items):
+        self.assertEqual(CompactSchedule.from_dicts(copy.deepcopy(items)).to_dicts(), items)
+    
+    def test_ocr_and_optimized_data(self):
+        day = make_day(4, 40, seed=5)
+        self.assertRoundTrip(day)
+        self.assertRoundTrip(quiet(self.optimizer.optimize, copy.deepcopy(day))['optimized_data'])
+    
+    def test_extra_fields_and_unusual_values(self):
+        self.assertRoundTrip([
+            # 多日排程加上的欄位、巢狀的值
+            {'room': '10', 'time': '08:00', 'patient': '王小明', 'date': '2026-01-05',
+             'slot': '2026-01-05T08:00', 'history': {'moved': [1, 2]}},
+            # 整數房號、接台、無法解析的時間、型別不符的已知欄位、None
+            {'room': 12, 'time': 'TF', 'original_time': '待定', 'priority': '3', 'duration': 1.5, 'notes': None},
+            {'is_emergency': True, 'delayed_by_emergency': False, 'status': '🚨 緊急插入', 'urgency_level': 1},
+            {},
+        ])
+
+
+class StreamingOCRTests(SimpleTestCase):
+    """iter_surgeries 邊讀邊解析的結果與 process 相同，包含跨頁的房間區塊"""
+    
+    PATIENTS = ['王小明', '林美玲', '陳建宏', '張淑芬', '李志強', '黃雅婷', '吳俊傑']
+    
+    def test_iter_surgeries_matches_process(self):
+        from surgery_scheduler.ocr_processor import ScheduleOCRProcessor
+        # 每房 20 台（61 行）> 每頁 48 行：第一個房間延續到第二頁
+        day = [dict(case, patient=self.PATIENTS[i % len(self.PATIENTS)])
+               for i, case in enumerate(make_day(3, 60, seed=2))]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'schedule.pdf'
+            self.assertEqual(write_schedule_pdf(path, day), 4)
+            processor = ScheduleOCRProcessor(max_workers=1)
+            expected = quiet(processor.process, path)['schedule_data']
+            streamed = quiet(lambda: list(processor.iter_surgeries(path)))
+        self.assertEqual(streamed, expected)
+        self.assertEqual([(s['room'], s['time'], s['patient']) for s in streamed],
+                         [(s['room'], s['time'], s['patient']) for s in day])
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """ML 預測快取：命中/未命中計數正確，模型版本更新後舊的預測全部作廢"""
+    
+    def setUp(self):
+        from surgery_scheduler.prediction_cache import PredictionCache
+        self.cache = PredictionCache(max_size=2)
+    
+    def metrics(self, *keys):
+        data = self.cache.metrics()
+        return {key: data[key] for key in keys}
+    
+    def test_hit_and_miss_counters(self):
+        self.assertEqual(self.cache.get_many(1, ['a', 'b']), [None, None])
+        self.cache.put_many(1, [('a', (60, 3)), ('b', (90, 2))])
+        self.assertEqual(self.cache.get_many(1, ['a', 'b', 'c']), [(60, 3), (90, 2), None])
+        self.assertEqual(self.metrics('hits', 'misses', 'hit_ratio', 'size'),
+                         {'hits': 2, 'misses': 3, 'hit_ratio': 0.4, 'size': 2})
+        # 超過上限時淘汰最久未使用的 'a'
+        self.cache.get_many(1, ['b'])
+        self.cache.put_many(1, [('c', (30, 5))])
+        self.assertEqual(self.cache.get_many(1, ['a', 'b', 'c']), [None, (90, 2), (30, 5)])
+        self.assertEqual(self.metrics('evictions', 'size'), {'evictions': 1, 'size': 2})
+    
+    def test_model_version_bump_invalidates(self):
+        self.cache.put_many(1, [('a', (60, 3))])
+        self.assertEqual(self.cache.get_many(2, ['a']), [None])
+        self.assertEqual(self.metrics('invalidations', 'size', 'model_version'),
+                         {'invalidations': 1, 'size': 0, 'model_version': 2})
+        # 仍使用舊版模型的請求不可寫入或讀到新版的快取
+        self.cache.put_many(1, [('a', (60, 3))])
+        self.cache.put_many(2, [('a', (45, 4))])
+        self.assertEqual(self.cache.get_many(1, ['a']), [None])
+        self.assertEqual(self.cache.get_many(2, ['a']), [(45, 4)])
+    
+    def test_analyzer_uses_cache_per_model_version(self):
+        from surgery_scheduler.ml_analyzer import MLSurgeryAnalyzer
+        analyzer = quiet(MLSurgeryAnalyzer)
+        self.assertTrue(analyzer.is_ready())
+        analyzer.prediction_cache = self.cache
+        surgery = make_day(1, 1)[0]
+        first = analyzer.analyze_surgery(surgery)
+        self.assertEqual(analyzer.analyze_surgery(surgery), first)
+        self.assertEqual(self.metrics('hits', 'misses'), {'hits': 1, 'misses': 1})
+        # registry 重新載入模型後版本號增加：同一組特徵重新推論
+        analyzer.model_version += 1
+        self.assertEqual(analyzer.analyze_surgery(surgery), first)
+        self.assertEqual(self.metrics('hits', 'misses', 'invalidations'), {'hits': 1, 'misses': 2, 'invalidations': 1})
+
+
+class KeywordPrecedenceTests(WithoutML, SimpleTestCase):
+    """知識庫比對：最長的關鍵字優先，長度相同時取字串中較前面的，與字典順序無關"""
+    
+    def knowledge(self, surgery_type):
+        result = self.optimizer.analyzer.estimate_duration({'surgery_type': surgery_type})
+        return result['base_duration'], result['method']
+    
+    def test_longest_keyword_wins(self):
+        # 舊版依字典順序先命中 PORT-A（45 分）
+        self.assertEqual(self.knowledge('S1234 PORT-A REMOVAL'), (40, '知識庫'))
+        self.assertEqual(self.knowledge('port-a removal'), (40, '知識庫'))
+        self.assertEqual(self.knowledge('L4-5 FUSION DISKECTOMY'), (150, '知識庫'))
+    
+    def test_equal_length_uses_first_occurrence(self):
+        from surgery_scheduler.keyword_matcher import get_surgery_classifier
+        classify = get_surgery_classifier().classify
+        self.assertEqual(classify('SPINAL FUSION')['knowledge'], 'SPINAL')
+        self.assertEqual(classify('FUSION SPINAL')['knowledge'], 'FUSION')
+        self.assertEqual(self.knowledge('UNKNOWN PROCEDURE'), (90, '預設'))
+    
+    def test_matcher_reports_overlapping_keywords(self):
+        from surgery_scheduler.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher(['he', 'SHE', 'HERS', 'HIS'])
+        found = {(start, matcher.keywords[index]) for start, index in matcher.iter_matches('ushers')}
+        self.assertEqual(found, {(1, 'SHE'), (2, 'HE'), (2, 'HERS')})
+
+
+class LocalSearchTests(WithoutML, SimpleTestCase):
+    """局部搜尋：指定 seed 與迭代次數時結果可重現，且依同一套指標不會比貪婪排程差"""
+    
+    def solve(self, data, seed, workers=1):
+        return quiet(self.optimizer.optimize, copy.deepcopy(data), solver='local_search', seed=seed,
+                     max_iterations=800, workers=workers, time_budget=30)
+    
+    def assertNotWorseThanGreedy(self, result):
+        from surgery_scheduler.schedule_optimizer import _metrics_rank
+        solver = result['solver']
+        self.assertLessEqual(_metrics_rank(solver['result']), _metrics_rank(solver['greedy']))
+    
+    def test_same_seed_reproduces_the_schedule(self):
+        data = make_day(8, 60, seed=4)
+        first = self.solve(data, seed=7)
+        second = self.solve(data, seed=7)
+        self.assertEqual(second['optimized_data'], first['optimized_data'])
+        self.assertEqual(second['solver']['result'], first['solver']['result'])
+        self.assertEqual(second['solver']['iterations'], first['solver']['iterations'])
+    
+    def test_never_worse_than_greedy(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                self.assertNotWorseThanGreedy(self.solve(make_day(6, 50, seed), seed))
+    
+    def test_parallel_restarts_are_reproducible(self):
+        data = make_day(8, 60, seed=5)
+        first = self.solve(data, seed=3, workers=2)
+        second = self.solve(data, seed=3, workers=2)
+        self.assertEqual(first['solver']['workers'], 2)
+        self.assertEqual(second['optimized_data'], first['optimized_data'])
+        self.assertEqual(second['solver']['restarts'], first['solver']['restarts'])
+        self.assertEqual(second['solver']['best_restart'], first['solver']['best_restart'])
+        self.assertNotWorseThanGreedy(first)
+
+
+class CommitVersionTests(WithoutML, TestCase):
+    """commit_version：head 在計算期間被取代時以新的 head 重算，連續衝突時拋出 StaleScheduleVersion"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='院區1')
+        self.root = quiet(seed_schedule, self.hospital, 0, copy.deepcopy(EmergencyNotBeforeTests.DAY))
+        self.heads = []
+    
+    def child(self, parent, name):
+        return OptimizedSchedule.objects.create(
+            hospital=self.hospital, parent=parent, schedule_date=parent.schedule_date,
+            original_schedule_id=parent.original_schedule_id, optimized_data={'optimized_data': [], 'name': name},
+        )
+    
+    def prepare(self, conflicts):
+        """前 conflicts 次計算期間都有其他請求搶先提交"""
+        def prepare(head):
+            self.heads.append(head.id)
+            if len(self.heads) <= conflicts:
+                publish_version(self.hospital.id, self.child(head, f'其他請求{len(self.heads)}'))
+            return (lambda: self.child(head, '本次')), len(self.heads)
+        return prepare
+    
+    def test_retries_on_the_new_head(self):
+        version, attempts = quiet(commit_version, self.hospital.id, self.prepare(2))
+        self.assertEqual(attempts, 3)
+        self.assertEqual(current_version(self.hospital.id).id, version.id)
+        # 第二、三次以搶先提交的版本為 head，最後的版本接在最新的 head 之後
+        self.assertEqual(self.heads[0], self.root.id)
+        self.assertEqual(version.parent_id, self.heads[-1])
+        self.assertEqual(version.parent.optimized_data['name'], '其他請求2')
+        # 失敗的嘗試整段 rollback，沒有留下多餘的版本
+        self.assertEqual(OptimizedSchedule.objects.filter(optimized_data__name='本次').count(), 1)
+    
+    def test_gives_up_after_retries(self):
+        with self.assertRaises(StaleScheduleVersion):
+            quiet(commit_version, self.hospital.id, self.prepare(10), retries=2)
+        self.assertEqual(len(self.heads), 3)
+        self.assertFalse(OptimizedSchedule.objects.filter(optimized_data__name='本次').exists())
+        self.assertEqual(current_version(self.hospital.id).optimized_data['name'], '其他請求3')
+    
+    def test_emergency_view_reports_conflict(self):
+        self.client.get(f'/upload/?hospital={self.hospital.id}')
+        with mock.patch('surgery_scheduler.views.commit_version', side_effect=StaleScheduleVersion('版本 #1 已被取代')):
+            response = quiet(self.client.post, '/emergency/', {
+                'patient_name': '張淑芬', 'doctor_name': '王建明',
+                'surgery_type': 'TRIGGER RELEASE', 'urgency_level': '3',
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['success'])
@@ -4,12 +4,29 @@ from . import views
 urlpatterns = [
     # 🏥 基礎上傳與優化路徑
     path('upload/', views.ScheduleUploadView.as_view(), name='upload'),
+    path('upload/<int:upload_id>/status/', views.UploadStatusView.as_view(), name='upload_status'),
     path('optimize/<int:upload_id>/', views.ScheduleOptimizationView.as_view(), name='optimize'),
     path('result/<int:optimized_id>/', views.ResultView.as_view(), name='result'),
     
+    # 📅 多日排程（rolling horizon，只重算受影響的天數）
+    path('horizon/<int:upload_id>/', views.HorizonOptimizationView.as_view(), name='horizon_optimize'),
+    
+    # 📡 排程 JSON API（支援 ETag / If-None-Match）
+    path('api/schedule/', views.ScheduleAPIView.as_view(), name='schedule_api'),
+    path('api/schedule/<int:optimized_id>/', views.ScheduleAPIView.as_view(), name='schedule_api_version'),
+    
+    # 📺 看板即時推播（SSE，需以 ASGI 執行）
+    path('live/schedule/', views.ScheduleStreamView.as_view(), name='schedule_stream'),
+    
     # 🚑 急診手術入口 (解決 NoReverseMatch 報錯的關鍵)
     path('emergency/', views.EmergencySurgeryView.as_view(), name='emergency_surgery'),
     
     # PDF 匯出路徑
     path('export/<int:optimized_id>/', views.ExportPDFView.as_view(), name='export_pdf'),
+    
+    # 📑 批次匯出（CSV / Excel / iCalendar）
+    path('export/schedule.<str:fmt>', views.ScheduleExportView.as_view(), name='export_schedule'),
+    
+    # 📈 ML 模型載入統計
+    path('ml/metrics/', views.ModelMetricsView.as_view(), name='model_metrics'),
 ]
@@ -1,101 +1,243 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.views import View
 from django.utils import timezone
-from django.http import JsonResponse
-from datetime import timedelta, datetime
-from .models import ScheduleUpload, OptimizedSchedule, Surgery, Doctor, OperatingRoom
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import asyncio
+from datetime import date, datetime
+from urllib.parse import quote
+from .models import Hospital, ScheduleUpload, OptimizedSchedule, Doctor, OperatingRoom
+from .compact_schedule import DAY_START_MINUTES, CompactSchedule
+from .persistence import (
+    SchedulePersistence, StaleScheduleVersion, commit_version, current_version, emergency_notes,
+    optimization_notes, publish_version, write_atomic,
+)
+from .live_updates import (
+    KEEPALIVE_SECONDS, RESYNC, RETRY_MILLISECONDS, STREAM_MAX_SECONDS, format_event, get_broadcaster, publish_on_commit,
+)
+from .schedule_summary import SUMMARY_VERSION, build_summary, get_summary
+from .schedule_versions import child_version_fields, diff_schedules, updated_positions
+
+
+def _hospital_id(request):
+    """
+    目前操作的院區（唯讀）：?hospital=<id>（或表單欄位 hospital），未指定時沿用 session 的院區，
+    session 沒有記錄時使用第一個院區
+    
+    不寫入 session、也不建立院區：看板輪詢、解析狀態與推播等請求不會改變使用者目前的院區；
+    指定的院區不存在或尚無任何院區時回傳 None（查詢結果為空，視圖回傳 404）。
+    """
+    value = request.POST.get('hospital') or request.GET.get('hospital')
+    if value is not None:
+        if value.isdigit() and Hospital.objects.filter(id=value).exists():
+            return int(value)
+        return None
+    
+    hospital_id = request.session.get('hospital_id')
+    if hospital_id is not None and Hospital.objects.filter(id=hospital_id).exists():
+        return hospital_id
+    return Hospital.objects.order_by('id').values_list('id', flat=True).first()
+
+
+def _upload_hospital_id(request):
+    """上傳排程的院區：同 _hospital_id，並記在 session；沒有任何院區時建立預設院區"""
+    hospital_id = _hospital_id(request)
+    if hospital_id is None:
+        if request.POST.get('hospital') or request.GET.get('hospital'):
+            return None
+        hospital_id = Hospital.objects.create(name='預設院區').id
+    request.session['hospital_id'] = hospital_id
+    return hospital_id
+
+
+def _not_before_minutes():
+    """緊急手術最早可開始的時間（距午夜分鐘數）：現在的當地時間，但不早於開班時間"""
+    now = timezone.localtime()
+    return max(DAY_START_MINUTES, now.hour * 60 + now.minute)
+
 
 class ScheduleUploadView(View):
     def get(self, request):
-        return render(request, 'surgery_scheduler/upload.html', {'upload': None})
+        hospital_id = _hospital_id(request)
+        # 院區選單切換（?hospital=）才記住選擇，之後的頁面與 API 沿用
+        if request.GET.get('hospital') and hospital_id is not None:
+            request.session['hospital_id'] = hospital_id
+        upload = None
+        upload_id = request.GET.get('upload')
+        if upload_id and upload_id.isdigit():
+            upload = ScheduleUpload.objects.filter(id=upload_id, hospital_id=hospital_id).first()
+        return render(request, 'surgery_scheduler/upload.html', {
+            'upload': upload,
+            'hospitals': Hospital.objects.order_by('id'),
+            'hospital_id': hospital_id,
+        })
     
     def post(self, request):
-        from .ocr_processor import ScheduleOCRProcessor
+        from .ocr_jobs import complete_from_cache, get_ocr_queue
         uploaded_file = request.FILES.get('uploaded_file')
         if not uploaded_file: 
             return redirect('upload')
         
+        hospital_id = _upload_hospital_id(request)
+        if hospital_id is None:
+            return JsonResponse({'success': False, 'error': '找不到院區'}, status=404)
         upload = ScheduleUpload.objects.create(
             uploaded_file=uploaded_file, 
-            hospital_id=1
+            hospital_id=hospital_id
         )
         
-        processor = ScheduleOCRProcessor()
-        result = processor.process(upload.uploaded_file.path)
-        
-        upload.extracted_data = result.get('schedule_data', [])
-        upload.raw_text = result.get('raw_text', "")
-        upload.save()
+        # 📄 已解析過的同一份檔案直接取用快取，否則交給背景佇列，請求立即回應工作編號
+        if not complete_from_cache(upload):
+            transaction.on_commit(lambda: get_ocr_queue().submit(upload.id))
         
-        return render(request, 'surgery_scheduler/upload.html', {'upload': upload})
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'job_id': upload.id,
+                'status': upload.status,
+                'status_url': reverse('upload_status', args=[upload.id])
+            }, status=202)
+        return render(request, 'surgery_scheduler/upload.html', {
+            'upload': upload,
+            'hospitals': Hospital.objects.order_by('id'),
+            'hospital_id': upload.hospital_id,
+        })
+
+
+class UploadStatusView(View):
+    """OCR 背景解析狀態（供前端輪詢）"""
+    
+    def get(self, request, upload_id):
+        from .ocr_jobs import get_ocr_queue
+        uploads = ScheduleUpload.objects.filter(hospital_id=_hospital_id(request))
+        upload = get_object_or_404(uploads, id=upload_id)
+        if upload.status == ScheduleUpload.STATUS_PROCESSING:
+            # 解析中的程序已中斷（心跳逾時）時重新排入佇列
+            queue = get_ocr_queue()
+            for reclaimed_id in queue.reclaim_stale(uploads.filter(id=upload.id)):
+                queue.submit(reclaimed_id)
+                upload.refresh_from_db()
+        return JsonResponse({
+            'job_id': upload.id,
+            'status': upload.status,
+            'progress': upload.progress,
+            'processed': upload.processed,
+            'surgery_count': len(upload.extracted_data) if upload.processed else 0,
+            'error': upload.error,
+        })
 
 
 class ScheduleOptimizationView(View):
     def post(self, request, upload_id):
-        upload = get_object_or_404(ScheduleUpload, id=upload_id)
-        Surgery.objects.all().delete()
+        upload = get_object_or_404(ScheduleUpload, id=upload_id, hospital_id=_hospital_id(request))
+        if not upload.processed:
+            return JsonResponse({'success': False, 'error': '排程仍在解析中，請稍候'}, status=409)
         
-        from .schedule_optimizer import ScheduleOptimizer
+        from .schedule_optimizer import OptimizationConfig, ScheduleOptimizer
         optimizer = ScheduleOptimizer()
         
+        # 求解模式：預設貪婪，可選擇局部搜尋深度優化
+        solver = request.POST.get('solver') or None
+        if solver not in (None,) + OptimizationConfig.SOLVERS:
+            return JsonResponse({'success': False, 'error': f'未知的求解模式: {solver}'}, status=400)
+        
         # 執行優化（會自動使用 ML 分析）
-        result = optimizer.optimize(upload.extracted_data, upload.hospital_id)
+        result = optimizer.optimize(upload.extracted_data, upload.hospital_id, solver=solver)
         
-        # 儲存優化結果
-        for item in result.get('optimized_data', []):
-            room, _ = OperatingRoom.objects.get_or_create(
-                number=str(item['room']), 
-                hospital_id=upload.hospital_id
-            )
-            doc, _ = Doctor.objects.get_or_create(
-                name=item.get('doctor', '待核對'), 
-                hospital_id=upload.hospital_id
-            )
-            
-            start_t = timezone.make_aware(
-                datetime.combine(
-                    datetime.today(), 
-                    datetime.strptime(item['time'], '%H:%M').time()
-                )
+        # 儲存優化結果（批次寫入，單一 transaction；與其他院區同時寫入時重試）
+        # 單日排程只取代今天的手術，多日排程的其他天不受影響
+        day = timezone.localdate()
+        
+        def save():
+            SchedulePersistence(upload.hospital_id, day).replace_schedule(
+                CompactSchedule.from_dicts(result.get('optimized_data', [])), optimization_notes
             )
             
-            # 儲存 ML 分析結果
-            analysis_method = item.get('analysis_method', '未知')
-            category = item.get('category', '中型')
-            base_duration = item.get('base_duration', item.get('duration', 90))
-            
-            notes = f"{item.get('status', '智慧優化')} | {analysis_method} | {category}"
-            
-            Surgery.objects.create(
-                operating_room=room,
-                doctor=doc,
-                scheduled_start=start_t,
-                scheduled_end=start_t + timedelta(minutes=item.get('duration', 90)),
-                original_start_time=item.get('original_time'),
-                original_room=item.get('original_room'),
-                patient_name=item.get('patient', '不明病患'),
-                surgery_type=item.get('surgery_type', '一般手術'),
-                estimated_duration=base_duration,
-                notes=notes
+            optimized = OptimizedSchedule.objects.create(
+                hospital_id=upload.hospital_id,
+                original_schedule=upload,
+                optimized_data=result,
+                utilization_improvement=result.get('improvement', 0),
+                schedule_date=day,
+                summary=build_summary(upload.hospital_id, day)
             )
+            # 重新優化取代整份排程，直接成為目前版本（進行中的緊急插入會以此版本重算）
+            publish_version(upload.hospital_id, optimized)
+            publish_on_commit(upload.hospital_id, optimized)
+            return optimized
         
-        optimized = OptimizedSchedule.objects.create(
-            original_schedule=upload,
-            optimized_data=result,
-            utilization_improvement=result.get('improvement', 0)
-        )
+        optimized = write_atomic(save)
         
         return redirect('result', optimized_id=optimized.id)
 
 
+class HorizonOptimizationView(View):
+    """
+    多日排程（rolling horizon）：以上傳的手術排程 start（預設今天）起 days 天
+    
+    上傳內每筆手術以 'date'（YYYY-MM-DD）指定日期，沒有日期的排在 start；
+    上傳內出現的日期以上傳內容取代，其餘天數沿用已保存的排程，只重算與寫入受影響的天數。
+    重算到院區目前版本的那一天時，該天的多日排程版本成為目前版本（緊急插入接在它之後）。
+    """
+    
+    def post(self, request, upload_id):
+        upload = get_object_or_404(ScheduleUpload, id=upload_id, hospital_id=_hospital_id(request))
+        if not upload.processed:
+            return JsonResponse({'success': False, 'error': '排程仍在解析中，請稍候'}, status=409)
+        
+        from .horizon import HorizonScheduler
+        from .schedule_optimizer import OptimizationConfig
+        try:
+            start = date.fromisoformat(request.POST['start']) if request.POST.get('start') else timezone.localdate()
+            days = int(request.POST.get('days') or OptimizationConfig.HORIZON_DAYS)
+            cases_by_day = {}
+            for case in upload.extracted_data:
+                day = date.fromisoformat(case['date']) if case.get('date') else start
+                cases_by_day.setdefault(day, []).append(case)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'日期格式錯誤: {str(e)}'}, status=400)
+        if not 1 <= days <= OptimizationConfig.HORIZON_MAX_DAYS:
+            return JsonResponse({
+                'success': False, 'error': f'天數需介於 1 到 {OptimizationConfig.HORIZON_MAX_DAYS}'
+            }, status=400)
+        
+        # 以已保存的各天排程還原視窗，只取代這次上傳的天數
+        scheduler = HorizonScheduler.load(upload.hospital_id, start, days)
+        outside = sorted(d.isoformat() for d in cases_by_day if d not in scheduler.dates)
+        for day, cases in cases_by_day.items():
+            if day in scheduler.dates:
+                scheduler.replace_day(day, cases)
+        
+        result = scheduler.optimize()
+        try:
+            versions = scheduler.persist(upload.hospital_id, upload, result['recomputed'])
+        except StaleScheduleVersion as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'排程更新過於頻繁，請稍後再試: {str(e)}'
+            }, status=409)
+        return JsonResponse({
+            'success': True,
+            'start': result['start'],
+            'recomputed': result['recomputed'],
+            'versions': {v.schedule_date.isoformat(): v.id for v in versions},
+            'overflow_count': len(result['overflow']),
+            'skipped_dates': outside,
+        })
+
+
 class EmergencySurgeryView(View):
     """緊急手術插入視圖"""
     
     def get(self, request):
         """顯示緊急手術表單"""
-        latest_optimized = OptimizedSchedule.objects.order_by('-created_at').first()
-        rooms = OperatingRoom.objects.all()
-        doctors = Doctor.objects.all()
+        hospital_id = _hospital_id(request)
+        latest_optimized = current_version(hospital_id)
+        rooms = OperatingRoom.objects.filter(hospital_id=hospital_id)
+        doctors = Doctor.objects.filter(hospital_id=hospital_id)
         
         context = {
             'latest_optimized': latest_optimized,
@@ -122,15 +264,8 @@ class EmergencySurgeryView(View):
                 'error': '請填寫所有必填欄位'
             }, status=400)
         
-        # 2. 獲取當前排程
-        latest_optimized = OptimizedSchedule.objects.order_by('-created_at').first()
-        if not latest_optimized:
-            return JsonResponse({
-                'success': False,
-                'error': '找不到當前排程，請先上傳並優化排程'
-            }, status=404)
-        
-        # 3. 準備緊急手術資料
+        # 2. 準備緊急手術資料
+        hospital_id = _hospital_id(request)
         emergency_surgery = {
             'patient': patient_name,
             'doctor': doctor_name,
@@ -139,76 +274,70 @@ class EmergencySurgeryView(View):
             'notes': notes
         }
         
-        # 4. 插入緊急手術
+        from .horizon import emergency_state
         from .schedule_optimizer import ScheduleOptimizer
         optimizer = ScheduleOptimizer()
+        # 已經過去的空檔不能再排入
+        not_before = _not_before_minutes()
         
-        current_schedule = latest_optimized.optimized_data.get('optimized_data', [])
+        def prepare(latest_optimized):
+            # 3. 以本院區目前版本插入緊急手術（計算期間不鎖定；被其他請求搶先提交時以新版本重算）
+            current_schedule = latest_optimized.get_optimized_data().get('optimized_data', [])
+            result = optimizer.insert_emergency_surgery(current_schedule, emergency_surgery, not_before)
+            adjusted_schedule = result['adjusted_schedule']
+            delta = diff_schedules(current_schedule, adjusted_schedule)
+            
+            def save():
+                # 4. 只寫入差異：新增緊急手術、更新被延後的手術（資料表不一致時才整批重寫）
+                persistence = SchedulePersistence(hospital_id, latest_optimized.schedule_date)
+                schedule = CompactSchedule.from_dicts(adjusted_schedule)
+                if not persistence.apply_changes(schedule, updated_positions(delta),
+                                                 current_schedule, emergency_notes):
+                    persistence.replace_schedule(schedule, emergency_notes)
+                
+                # 5. 創建新的優化記錄（只存與上一版的差異）
+                meta = {
+                    'improvement': latest_optimized.optimized_data.get('improvement', 0),
+                    'doctor_conflicts': result['insertion_info']['doctor_conflicts'],
+                    'emergency_insertion': result['insertion_info'],
+                    # 多日排程的那一天：緊急手術一併記錄在多日狀態，重算該天時不會遺失
+                    **emergency_state(latest_optimized.optimized_data, emergency_surgery)
+                }
+                
+                version = OptimizedSchedule.objects.create(
+                    hospital_id=hospital_id,
+                    original_schedule=latest_optimized.original_schedule,
+                    utilization_improvement=latest_optimized.utilization_improvement,
+                    summary=build_summary(hospital_id, latest_optimized.schedule_date),
+                    **child_version_fields(latest_optimized, adjusted_schedule, delta, meta)
+                )
+                # 提交後推播有變動的手術房給看板
+                publish_on_commit(hospital_id, version, latest_optimized.summary)
+                return version
+            
+            return save, result
         
+        # 6. 提交新版本（compare-and-swap，衝突時自動以最新版本重試）
         try:
-            result = optimizer.insert_emergency_surgery(current_schedule, emergency_surgery)
+            new_optimized, result = commit_version(hospital_id, prepare)
+        except StaleScheduleVersion as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'排程更新過於頻繁，請稍後再試: {str(e)}'
+            }, status=409)
         except Exception as e:
             return JsonResponse({
                 'success': False,
                 'error': f'插入失敗: {str(e)}'
             }, status=500)
         
-        # 5. 清除舊的手術記錄
-        Surgery.objects.all().delete()
-        
-        # 6. 儲存新的排程（包含緊急手術）
-        for item in result['adjusted_schedule']:
-            room, _ = OperatingRoom.objects.get_or_create(
-                number=str(item['room']), 
-                hospital_id=1
-            )
-            doc, _ = Doctor.objects.get_or_create(
-                name=item.get('doctor', '待核對'), 
-                hospital_id=1
-            )
-            
-            start_t = timezone.make_aware(
-                datetime.combine(
-                    datetime.today(), 
-                    datetime.strptime(item['time'], '%H:%M').time()
-                )
-            )
-            
-            # 標記是否為緊急手術
-            is_emergency = item.get('is_emergency', False)
-            analysis_method = item.get('analysis_method', '未知')
-            
-            notes_text = item.get('status', '排程中')
-            if analysis_method != '未知':
-                notes_text += f" | {analysis_method}"
-            
-            Surgery.objects.create(
-                operating_room=room,
-                doctor=doc,
-                scheduled_start=start_t,
-                scheduled_end=start_t + timedelta(minutes=item.get('duration', 90)),
-                original_start_time=item.get('original_time'),
-                original_room=item.get('original_room'),
-                patient_name=item.get('patient', '不明病患'),
-                surgery_type=item.get('surgery_type', '一般手術'),
-                estimated_duration=item.get('base_duration', item.get('duration', 90)),
-                notes=notes_text
-            )
-        
-        # 7. 創建新的優化記錄
-        new_optimized_data = {
-            'optimized_data': result['adjusted_schedule'],
-            'improvement': latest_optimized.optimized_data.get('improvement', 0),
-            'emergency_insertion': result['insertion_info']
-        }
-        
-        new_optimized = OptimizedSchedule.objects.create(
-            original_schedule=latest_optimized.original_schedule,
-            optimized_data=new_optimized_data,
-            utilization_improvement=latest_optimized.utilization_improvement
-        )
+        if new_optimized is None:
+            return JsonResponse({
+                'success': False,
+                'error': '找不到當前排程，請先上傳並優化排程'
+            }, status=404)
         
-        # 8. 返回結果
+        # 7. 返回結果
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
                 'success': True,
@@ -222,40 +351,13 @@ class EmergencySurgeryView(View):
 
 class ResultView(View):
     def get(self, request, optimized_id):
-        optimized = get_object_or_404(OptimizedSchedule, id=optimized_id)
-        all_surgeries = Surgery.objects.all().order_by('scheduled_start')
-        
-        raw_rooms_data = {}
-        for s in all_surgeries:
-            r_no = s.operating_room.number
-            if r_no not in raw_rooms_data:
-                raw_rooms_data[r_no] = {
-                    'surgeries': [], 
-                    'total_saved': 0,
-                    'has_emergency': False
-                }
-            
-            raw_rooms_data[r_no]['surgeries'].append(s)
-            
-            # 檢查是否有緊急手術
-            if '🚨' in s.notes:
-                raw_rooms_data[r_no]['has_emergency'] = True
-            
-            # 計算節省時間
-            if s.original_start_time:
-                try:
-                    orig = datetime.strptime(s.original_start_time, '%H:%M')
-                    now = s.scheduled_start.replace(tzinfo=None)
-                    diff = (orig.hour * 60 + orig.minute) - (now.hour * 60 + now.minute)
-                    if diff > 0: 
-                        raw_rooms_data[r_no]['total_saved'] += diff
-                except Exception: 
-                    pass
-        
-        # 數字排序
-        sorted_keys = sorted(raw_rooms_data.keys(), 
-                           key=lambda x: int(x) if x.isdigit() else 999)
-        rooms_data = {k: raw_rooms_data[k] for k in sorted_keys}
+        optimized = get_object_or_404(
+            OptimizedSchedule.objects.select_related('hospital'),
+            id=optimized_id, hospital_id=_hospital_id(request)
+        )
+        # 各房彙整在儲存版本時已算好，這裡只讀取
+        summary = get_summary(optimized)
+        rooms_data = {room['room']: room for room in summary['rooms']}
         
         # 檢查緊急手術資訊
         emergency_info = optimized.optimized_data.get('emergency_insertion')
@@ -269,6 +371,9 @@ class ResultView(View):
             'optimized': optimized,
             'rooms_data': rooms_data,
             'emergency_info': emergency_info,
+            'doctor_conflicts': optimized.optimized_data.get('doctor_conflicts'),
+            # 目前版本的頁面會訂閱即時推播，有新版本時自動切換
+            'is_current': optimized.hospital.current_schedule_id == optimized.id,
             'ml_analysis_count': ml_count,
             'kb_analysis_count': kb_count,
             'default_analysis_count': default_count
@@ -277,6 +382,236 @@ class ResultView(View):
         return render(request, 'surgery_scheduler/result.html', context)
 
 
+class ScheduleAPIView(View):
+    """
+    排程 JSON API（牆面看板輪詢用）
+    
+    - /api/schedule/：本院區目前版本；/api/schedule/<id>/：指定版本
+    - ?room=10 只回傳該房，?page=、?page_size= 分頁（依房號、開始時間排序）
+    - 回應帶 ETag（版本 id），If-None-Match 相符時回傳 304，不讀取排程內容
+    - 只能讀取本院區的版本，其他院區的版本 id 回傳 404
+    """
+    
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    
+    def get(self, request, optimized_id=None):
+        hospital_id = _hospital_id(request)
+        versions = OptimizedSchedule.objects.filter(hospital_id=hospital_id)
+        # 目前版本一定屬於本院區；指定的版本要另外確認
+        explicit = optimized_id is not None
+        if not explicit:
+            optimized_id = Hospital.objects.filter(
+                id=hospital_id
+            ).values_list('current_schedule_id', flat=True).first()
+            if optimized_id is None:
+                return JsonResponse({'success': False, 'error': '找不到當前排程，請先上傳並優化排程'}, status=404)
+        
+        etag = f'"schedule-{optimized_id}-v{SUMMARY_VERSION}"'
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            if explicit and not versions.filter(id=optimized_id).exists():
+                return JsonResponse({'success': False, 'error': '找不到排程版本'}, status=404)
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        
+        try:
+            page_number = int(request.GET.get('page', 1))
+            page_size = min(int(request.GET.get('page_size', self.PAGE_SIZE)), self.MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'page 與 page_size 必須是整數'}, status=400)
+        if page_number < 1 or page_size < 1:
+            return JsonResponse({'success': False, 'error': 'page 與 page_size 必須大於 0'}, status=400)
+        
+        optimized = get_object_or_404(
+            versions.only('id', 'hospital_id', 'created_at', 'summary'), id=optimized_id
+        )
+        summary = get_summary(optimized)
+        rooms = summary['rooms']
+        room_filter = request.GET.get('room')
+        if room_filter:
+            rooms = [room for room in rooms if room['room'] == room_filter]
+        
+        surgeries = [dict(s, room=room['room']) for room in rooms for s in room['surgeries']]
+        offset = (page_number - 1) * page_size
+        response = JsonResponse({
+            'success': True,
+            'optimized_id': optimized.id,
+            'hospital_id': optimized.hospital_id,
+            'created_at': optimized.created_at.isoformat(),
+            'rooms': [{k: v for k, v in room.items() if k != 'surgeries'} for room in rooms],
+            'surgeries': surgeries[offset:offset + page_size],
+            'page': page_number,
+            'page_size': page_size,
+            'pages': max(1, -(-len(surgeries) // page_size)),
+            'total': len(surgeries),
+        }, json_dumps_params={'ensure_ascii': False})
+        response['ETag'] = etag
+        # 每次都向伺服器確認（輪詢時多半是 304）
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+def _snapshot_event(hospital_id, room, sent_id):
+    """院區目前版本的完整快照事件；與已送出的版本相同（或沒有版本）時回傳 None"""
+    head_id = Hospital.objects.filter(id=hospital_id).values_list('current_schedule_id', flat=True).first()
+    if head_id is None or head_id == sent_id:
+        return None
+    optimized = OptimizedSchedule.objects.only('id', 'hospital_id', 'summary').get(id=head_id)
+    rooms = get_summary(optimized)['rooms']
+    if room is not None:
+        rooms = [r for r in rooms if r['room'] == room]
+    return {'type': 'snapshot', 'optimized_id': optimized.id, 'rooms': rooms, 'removed': []}
+
+
+async def _schedule_stream(hospital_id, room, sent_id):
+    """
+    SSE 事件串流：連線時（版本與 Last-Event-ID 不同）先送快照，之後推送各房變動
+    
+    閒置時只等待佇列；每 KEEPALIVE_SECONDS 送一次 keepalive 並檢查目前版本，
+    補上其他程序提交、沒有經過本程序推播的版本。
+    """
+    broadcaster = get_broadcaster()
+    subscription = broadcaster.subscribe(hospital_id, room)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_MAX_SECONDS
+    snapshot = sync_to_async(_snapshot_event)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        event = await snapshot(hospital_id, room, sent_id)
+        if event is not None:
+            sent_id = event['optimized_id']
+            yield format_event(event)
+        
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                event = await snapshot(hospital_id, room, sent_id)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+            
+            # 佇列溢位，或中間漏掉版本（差異接不上）時改送完整快照
+            if event is RESYNC or (event['type'] == 'rooms' and event['parent_id'] != sent_id):
+                event = await snapshot(hospital_id, room, sent_id)
+                if event is None:
+                    continue
+            if sent_id is not None and event['optimized_id'] <= sent_id:
+                continue
+            sent_id = event['optimized_id']
+            yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+class ScheduleStreamView(View):
+    """
+    排程即時推播（Server-Sent Events）
+    
+    需以 ASGI 伺服器執行（例如 uvicorn hospital_scheduler.asgi:application），
+    WSGI 無法長時間保持連線，回傳 503。
+    - ?room=10 只接收該房的變動
+    - 重新連線時以 Last-Event-ID（或 ?last=）帶回最後收到的版本 id，相同時不重送快照
+    - 事件：snapshot（完整各房摘要）、rooms（有變動的手術房與已移除的房號）
+    """
+    
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'success': False, 'error': '即時推播需以 ASGI 伺服器執行'}, status=503)
+        
+        hospital_id = await sync_to_async(_hospital_id)(request)
+        if hospital_id is None:
+            return JsonResponse({'success': False, 'error': '找不到院區'}, status=404)
+        room = request.GET.get('room') or None
+        last = request.headers.get('Last-Event-ID') or request.GET.get('last') or ''
+        sent_id = int(last) if last.isdigit() else None
+        
+        response = StreamingHttpResponse(
+            _schedule_stream(hospital_id, room, sent_id), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # 反向代理（nginx）不要緩衝事件
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class ExportPDFView(View):
+    """
+    匯出版本的 PDF（每個版本只產生一次，之後從快取檔串流）
+    
+    第一次產生時，差異版本沿 parent 鏈還原完整排程；reportlab 的 Canvas 在 save() 前保留整份文件，
+    產生時的記憶體用量仍與版本的手術數成正比，下載快取檔時則不受影響。
+    """
+    
     def get(self, request, optimized_id):
-        return redirect('result', optimized_id=optimized_id)
+        from .pdf_exporter import get_or_create_export
+        # 不延遲載入欄位：產生 PDF 時需要 optimized_data、parent、delta 還原排程
+        optimized = get_object_or_404(
+            OptimizedSchedule, id=optimized_id, hospital_id=_hospital_id(request)
+        )
+        
+        # 每個版本只產生一次 PDF，之後直接從快取檔分段串流
+        path = get_or_create_export(optimized)
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True,
+            filename=f'schedule_{optimized.id}.pdf', content_type='application/pdf'
+        )
+
+
+class ScheduleExportView(View):
+    """
+    排程批次匯出（供護理、麻醉、醫師行事曆等下游系統使用）
+    
+    /export/schedule.csv、.xml（SpreadsheetML 2003，Excel 可開啟）、.ics（iCalendar）
+    - 預設匯出資料表內目前的排程（各天最新寫入的手術）；?version=<id>：只匯出該排程版本的內容
+    - ?start=YYYY-MM-DD&end=YYYY-MM-DD：日期範圍（含 start、不含 end），預設全部
+    - ?room=10：單一手術房；?doctor=姓名：單一醫師（行事曆訂閱用）
+    資料表以單一查詢邊讀邊輸出，匯出整個月也不會一次載入記憶體。
+    """
+    
+    def get(self, request, fmt):
+        from .schedule_export import FORMATS, as_async, stream_export
+        if fmt not in FORMATS:
+            return JsonResponse({'success': False, 'error': f'未知的匯出格式: {fmt}'}, status=404)
+        
+        try:
+            start, end = (
+                datetime.strptime(request.GET[key], '%Y-%m-%d').date() if request.GET.get(key) else None
+                for key in ('start', 'end')
+            )
+        except ValueError:
+            return JsonResponse({'success': False, 'error': '日期格式應為 YYYY-MM-DD'}, status=400)
+        room = request.GET.get('room') or None
+        doctor = request.GET.get('doctor') or None
+        hospital_id = _hospital_id(request)
+        version = None
+        if request.GET.get('version'):
+            if not request.GET['version'].isdigit():
+                return JsonResponse({'success': False, 'error': '版本編號格式錯誤'}, status=400)
+            version = get_object_or_404(OptimizedSchedule, id=request.GET['version'], hospital_id=hospital_id)
+        
+        chunks = stream_export(fmt, hospital_id, start, end, room, doctor, version)
+        if isinstance(request, ASGIRequest):
+            chunks = as_async(chunks)
+        content_type, extension = FORMATS[fmt]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        name = '_'.join(['schedule'] + [part for part in (version and f'v{version.id}', room and f'room{room}',
+                                                          doctor, start and start.isoformat()) if part])
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(name)}.{extension}"
+        return response
+
+
+class ModelMetricsView(View):
+    """ML 模型註冊表統計（載入時間、快取命中）與預測快取命中率"""
+    
+    def get(self, request):
+        from .model_registry import get_model_registry
+        from .prediction_cache import get_prediction_cache
+        data = get_model_registry().metrics()
+        data['prediction_cache'] = get_prediction_cache().metrics()
+        return JsonResponse(data)